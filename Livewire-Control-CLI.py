@@ -12,21 +12,23 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/libs")
 import time
 import argparse
 from LWCPClient import LWCPClient
+from LivewireCLIDaemon import LivewireCLIDaemon, forwardCommand
+from LivewireBatch import LivewireBatch, BatchArgumentParser, parseBatch
 import AxiaLivewireAddressHelper
 import LivewireCLILogging
 
-if __name__ == "__main__":
-
+def buildParser(parserClass=argparse.ArgumentParser):
+    """Setup the command line arguments."""
     description = "Livewire Control Command Line Interface (CLI). " + "\r\n"
     description += __copyright__ + ". \r\n"
     description += "Version " + __version__ + ". \r\n"
     description += "This software is sold under a proprietary license. Please purchase a license from https://mediarealm.com.au/. " + "\r\n"
 
     # Setup Argparser
-    parser = argparse.ArgumentParser(description=description)
+    parser = parserClass(description=description)
 
     # Default connection parameters
-    parser.add_argument("lwcp_ip", help="Enter the IP Address of your LWCP Device")
+    parser.add_argument("lwcp_ip", nargs="?", help="Enter the IP Address of your LWCP Device (not needed with --daemon)")
     
     # Show Profile get/set
     parser.add_argument('--get_showprofile', default=False, action='store_true', help="Get the name and ID of the current show profile")
@@ -62,53 +64,101 @@ if __name__ == "__main__":
     parser.add_argument('--get_vmixgain', default=False, action='store_true', help="Get the on/off state of the currently selected VMix channel")
     parser.add_argument('--set_vmixgain', type=int, help="Set the gain level for the currently selected VMix channel")
 
+    # Run many commands at once
+    parser.add_argument('--batch', type=str, metavar="FILE", help="Run each line of a file (or - for stdin) as a command, using the same options as above, all over one connection")
+
+    # Daemon mode - keep the device connections open between commands
+    parser.add_argument('--daemon', default=False, action='store_true', help="Run as a daemon, holding connections open for commands sent with --via_daemon")
+    parser.add_argument('--via_daemon', default=False, action='store_true', help="Send this command to the daemon (or run it directly if the daemon isn't running)")
+    parser.add_argument('--daemon_port', type=int, metavar="PORT", default=9394, help="Which daemon to use: the number in its socket file name, or its local TCP port on Windows (default: 9394)")
+
     # Logging parameters
     parser.add_argument('--debug', default=False, action='store_true', help="Specify this option to see debug/error output on the console")
     parser.add_argument('--disable_logging', default=False, action='store_true', help="Specify this option to disable logging to a file")
     
-    # Parse parameters
-    args = parser.parse_args()
+    return parser
 
-    # Setup the logger
-    if args.debug:
-        LivewireCLILogging.setupLogger(True)
-    else:
-        LivewireCLILogging.setupLogger(False)
-    
-    if args.disable_logging:
-        LivewireCLILogging.disableLogging()
-    
-    # Log all exceptions
-    sys.excepthook = LivewireCLILogging.exception
+def connectDevice(args):
+    """Connect to the LWCP device given in the arguments."""
+    LivewireCLILogging.info("Attempting to connect to IP", args.lwcp_ip)
+    device = LWCPClient(args.lwcp_ip)
 
-    # Trim all arguments
-    for arg in vars(args):
-        if isinstance(getattr(args, arg), str):
-            setattr(args, arg, getattr(args, arg).strip())
+    device.errorSub(LivewireCLILogging.error)
+
+    return device
+
+def runBatch(args, output, getDevice):
+    """Run every line of a batch over one connection, with all the SETs pipelined and the GETs sent together. Returns the exit code."""
+    commands, errors = parseBatch(buildParser(BatchArgumentParser), args.batch)
+    exitCode = 0
+
+    for error in errors:
+        LivewireCLILogging.error(error)
+        exitCode = 1
+
+    for lineArgs in commands:
+        # Every line runs on this command's connection
+        lineArgs.lwcp_ip = args.lwcp_ip
+        lineArgs.batch = None
 
-    # Attempt to connect
     try:
-        LivewireCLILogging.info("Attempting to connect to IP", args.lwcp_ip)
-        device = LWCPClient(args.lwcp_ip)
+        device = getDevice(args)
     except Exception, e:
         LivewireCLILogging.critical("Unable to connect", e.message)
-        sys.exit(1)
-
-    device.errorSub(LivewireCLILogging.error)
+        return 1
+
+    # Any change on the console could affect the other data, so each SET makes the next GETs ask again
+    batch = LivewireBatch(device, {
+        "getShowProfiles": "getShowProfiles",
+        "getShowProfile": "getShowProfile",
+        "getSourceProfiles": "getSourceProfiles",
+        "getSourceProfile": "getSourceProfile",
+        "getChannelState": "getChannelState",
+        "getChannelGain": "getChannelGain",
+        "getChannelBus": "getChannelBus",
+        "getVMixChannelState": "getVMixChannelState",
+    }, {
+        "setShowProfile": ["*"],
+        "setSourceProfile": ["*"],
+        "setChannelState": ["*"],
+        "setChannelGain": ["*"],
+        "setChannelBus": ["*"],
+        "setVMixChannelState": ["*"],
+        "setVMixChannelGain": ["*"],
+    })
+
+    for lineOutput, lineExitCode in batch.run(commands, executeCommand):
+        output.extend(lineOutput)
+        exitCode = max(exitCode, lineExitCode)
+
+    return exitCode
+
+def executeCommand(args, output, getDevice):
+    """Run the gets and sets given in the arguments, adding each line of output to the output list. Returns the exit code.
+
+    getDevice(args) returns a connected LWCPClient - a new connection, or one the daemon has kept open."""
+    if args.batch:
+        return runBatch(args, output, getDevice)
 
+    # Attempt to connect
+    try:
+        device = getDevice(args)
+    except Exception, e:
+        LivewireCLILogging.critical("Unable to connect", e.message)
+        return 1
 
     # Show Profile - Get Current
     if args.get_showprofile:
         profile = device.getShowProfile()
         if profile is not None and len(profile) >= 1 and 'attributes' in profile[0] and 'profile_id' in profile[0]['attributes'] and 'profile_name' in profile[0]['attributes']:
-            print "ActiveShowProfile:" + str(profile[0]['attributes']['profile_id']) + "=" + str(profile[0]['attributes']['profile_name'])
+            output.append("ActiveShowProfile:" + str(profile[0]['attributes']['profile_id']) + "=" + str(profile[0]['attributes']['profile_name']))
 
     # Show Profiles - Get All
     if args.get_showprofiles:
         profiles = device.getShowProfiles()
         if profiles is not None and len(profiles) >= 1 and 'attributes' in profiles[0] and 'profile_list' in profiles[0]['attributes']:
             for profile in profiles[0]['attributes']['profile_list']:
-                print "ShowProfile:" + str(profile['id']) + "=" + str(profile['name'])
+                output.append("ShowProfile:" + str(profile['id']) + "=" + str(profile['name']))
 
     # Show Profile - Set
     if args.set_showprofile:
@@ -129,7 +179,7 @@ if __name__ == "__main__":
             source = device.getSourceProfile(chnum, chtype)
             if source is not None and len(source) >= 1 and 'attributes' in source[0]:
                 for attr in source[0]['attributes']:
-                    print "active_" + str(attr) + "=" +str(source[0]['attributes'][attr]) 
+                    output.append("active_" + str(attr) + "=" +str(source[0]['attributes'][attr]))
 
         # Source Profiles - Get All
         if args.get_sourceprofiles:
@@ -140,7 +190,7 @@ if __name__ == "__main__":
                         lwch = "/Lw" + str(source['lwch'])
                     else:
                         lwch = ""
-                    print "SourceProfile:" + str(source['id']) + lwch + "=" + str(source['name'])
+                    output.append("SourceProfile:" + str(source['id']) + lwch + "=" + str(source['name']))
 
         # Source Profile - Set
         if args.set_sourceprofile:
@@ -151,9 +201,9 @@ if __name__ == "__main__":
             state = device.getChannelState(chnum, chtype)
             if state is not None and len(state) >= 1 and 'attributes' in state[0] and 'ChannelOn' in state[0]['attributes']:
                 if state[0]['attributes']['ChannelOn'] is True:
-                    print "ChannelOn"
+                    output.append("ChannelOn")
                 else:
-                    print "ChannelOff"
+                    output.append("ChannelOff")
 
         # Channel - State Set
         if args.set_channelstate and args.set_channelstate == "ON":
@@ -165,7 +215,7 @@ if __name__ == "__main__":
         if args.get_fadergain:
             gain = device.getChannelGain(chnum, chtype)
             if gain is not None and len(gain) >= 1 and 'attributes' in gain[0] and 'fader_gain' in gain[0]['attributes']:
-                print "FaderGain:" + str(gain[0]['attributes']['fader_gain'])
+                output.append("FaderGain:" + str(gain[0]['attributes']['fader_gain']))
 
         # Channel - Fader Level Set
         if args.set_fadergain is not None:
@@ -177,29 +227,29 @@ if __name__ == "__main__":
             if bus is not None and len(bus) >= 1:
                 for bus_info in bus:
                     if 'bus_pgm1' in bus_info['attributes'] and (args.get_channelbus == "PGM1" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm1'] is True:
-                        print "PGM1:ON"
+                        output.append("PGM1:ON")
                     elif 'bus_pgm1' in bus_info['attributes'] and (args.get_channelbus == "PGM1" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm1'] is False:
-                        print "PGM1:OFF"
+                        output.append("PGM1:OFF")
                     
                     if 'bus_pgm2' in bus_info['attributes'] and (args.get_channelbus == "PGM2" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm2'] is True:
-                        print "PGM2:ON"
+                        output.append("PGM2:ON")
                     elif 'bus_pgm2' in bus_info['attributes'] and (args.get_channelbus == "PGM2" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm2'] is False:
-                        print "PGM2:OFF"
+                        output.append("PGM2:OFF")
                     
                     if 'bus_pgm3' in bus_info['attributes'] and (args.get_channelbus == "PGM3" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm3'] is True:
-                        print "PGM3:ON"
+                        output.append("PGM3:ON")
                     elif 'bus_pgm3' in bus_info['attributes'] and (args.get_channelbus == "PGM3" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm3'] is False:
-                        print "PGM3:OFF"
+                        output.append("PGM3:OFF")
                     
                     if 'bus_pgm4' in bus_info['attributes'] and (args.get_channelbus == "PGM4" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm4'] is True:
-                        print "PGM4:ON"
+                        output.append("PGM4:ON")
                     elif 'bus_pgm4' in bus_info['attributes'] and (args.get_channelbus == "PGM4" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_pgm4'] is False:
-                        print "PGM4:OFF"
+                        output.append("PGM4:OFF")
                     
                     if 'bus_prev' in bus_info['attributes'] and (args.get_channelbus == "PREV" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_prev'] is True:
-                        print "PREV:ON"
+                        output.append("PREV:ON")
                     elif 'bus_prev' in bus_info['attributes'] and (args.get_channelbus == "PREV" or args.get_channelbus == "ALL") and bus_info['attributes']['bus_prev'] is False:
-                        print "PREV:OFF"
+                        output.append("PREV:OFF")
 
         # Channel - Bus Set PGM1
         if args.set_channelbus_pgm1 and args.set_channelbus_pgm1 == "ON":
@@ -238,9 +288,9 @@ if __name__ == "__main__":
         if args.get_vmixstate:
             vmix = device.getVMixChannelState(args.vmix_num, args.vmix_chnum)
             if vmix is not None and len(vmix) >= 1 and 'attributes' in vmix[0] and 'VMixOn' in vmix[0]['attributes'] and vmix[0]['attributes']['VMixOn'] is True:
-                print "VMix:ON"
+                output.append("VMix:ON")
             elif vmix is not None and len(vmix) >= 1 and 'attributes' in vmix[0] and 'VMixOn' in vmix[0]['attributes'] and vmix[0]['attributes']['VMixOn'] is False:
-                print "VMix:OFF"
+                output.append("VMix:OFF")
 
         # VMix - On/Off State Set
         if args.set_vmixstate and args.set_vmixstate == "ON":
@@ -252,13 +302,80 @@ if __name__ == "__main__":
         if args.get_vmixgain:
             vmix = device.getVMixChannelState(args.vmix_num, args.vmix_chnum)
             if vmix is not None and len(vmix) >= 1 and 'attributes' in vmix[0] and 'vmix_gain' in vmix[0]['attributes']:
-                print "VMixGain:" + str(vmix[0]['attributes']['vmix_gain'])
+                output.append("VMixGain:" + str(vmix[0]['attributes']['vmix_gain']))
 
         # VMix - Gain Set
         if args.set_vmixgain is not None:
             device.setVMixChannelGain(args.vmix_num, args.vmix_chnum, args.set_vmixgain)
 
+    return 0
+
+if __name__ == "__main__":
+
+    # Parse parameters
+    parser = buildParser()
+    args = parser.parse_args()
+
+    # Setup the logger
+    if args.debug:
+        LivewireCLILogging.setupLogger(True)
+    else:
+        LivewireCLILogging.setupLogger(False)
+    
+    if args.disable_logging:
+        LivewireCLILogging.disableLogging()
+    
+    # Log all exceptions
+    sys.excepthook = LivewireCLILogging.exception
+
+    # Trim all arguments
+    for arg in vars(args):
+        if isinstance(getattr(args, arg), str):
+            setattr(args, arg, getattr(args, arg).strip())
+
+    if args.daemon:
+        daemon = LivewireCLIDaemon(args.daemon_port, connectDevice, executeCommand, ["lwcp_ip"])
+        daemon.serve()
+        sys.exit(0)
+
+    if not args.lwcp_ip:
+        parser.error("the IP Address of your LWCP Device is required")
+
+    if args.batch:
+        # Read the batch now, so it can be sent to the daemon
+        if args.batch == "-":
+            args.batch = sys.stdin.readlines()
+        else:
+            with open(args.batch) as batchFile:
+                args.batch = batchFile.readlines()
+
+    if args.via_daemon:
+        result = forwardCommand(args.daemon_port, args)
+
+        if result is not None:
+            output, exitCode = result
+            for line in output:
+                print line
+            sys.exit(exitCode)
+
+        LivewireCLILogging.warning("The CLI daemon isn't running. Running the command directly.")
+
+    # Run the command on a new connection
+    output = []
+    devices = []
+
+    def getDevice(args):
+        devices.append(connectDevice(args))
+        return devices[-1]
+
+    exitCode = executeCommand(args, output, getDevice)
+
+    for line in output:
+        print line
+
     # Disconnect from the LWCP
-    time.sleep(0.4)
-    device.stop()
-    sys.exit(0)
+    if len(devices) > 0:
+        time.sleep(0.4)
+        devices[0].stop()
+
+    sys.exit(exitCode)
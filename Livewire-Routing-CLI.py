@@ -11,22 +11,73 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/libs")
 
 import time
 import argparse
+import csv
+import json
 from LWRPClient import LWRPClient
+from LWRPClientPool import LWRPClientPool
+from LWRPSalvo import loadSalvos
+from LivewireCLIDaemon import LivewireCLIDaemon, forwardCommand
+from LivewireBatch import LivewireBatch, BatchArgumentParser, parseBatch
 import AxiaLivewireAddressHelper
 import LivewireCLILogging
 
-if __name__ == "__main__":
+def loadRoutingFile(filename):
+    """Read a CSV or JSON routing file. Returns two dicts of {channel number: stream number or address}: destinations and sources.
+
+    CSV rows are 'DST,channel,stream' or 'SRC,channel,stream' ('channel,stream' is a destination).
+    JSON is {"destinations": {channel: stream}, "sources": {channel: stream}}, or just {channel: stream} for destinations."""
+    destinations = {}
+    sources = {}
+
+    with open(filename, "rb") as routingFile:
+        if filename.lower().endswith(".json"):
+            data = json.load(routingFile)
+
+            if "destinations" in data or "sources" in data:
+                destinations = data.get("destinations", {})
+                sources = data.get("sources", {})
+            else:
+                destinations = data
+
+            return destinations, sources
+
+        for rowNum, row in enumerate(csv.reader(routingFile)):
+            row = [col.strip() for col in row]
+
+            if len(row) == 0 or row[0] == "" or row[0].startswith("#"):
+                continue
 
+            if len(row) == 2:
+                row.insert(0, "DST")
+
+            if len(row) != 3:
+                raise ValueError("Routing file line " + str(rowNum + 1) + " should be TYPE,CHANNEL,STREAM")
+
+            if rowNum == 0 and not row[1].isdigit():
+                # Skip a header row
+                continue
+
+            if row[0].upper() == "DST":
+                destinations[row[1]] = row[2]
+            elif row[0].upper() == "SRC":
+                sources[row[1]] = row[2]
+            else:
+                raise ValueError("Routing file line " + str(rowNum + 1) + " has an unknown type: " + row[0])
+
+    return destinations, sources
+
+def buildParser(parserClass=argparse.ArgumentParser):
+    """Setup the command line arguments."""
     description = "Livewire Routing Command Line Interface (CLI). " + "\r\n"
     description += __copyright__ + ". \r\n"
     description += "Version " + __version__ + ". \r\n"
     description += "This software is sold under a proprietary license. Please purchase a license from https://mediarealm.com.au/. " + "\r\n"
 
     # Setup Argparser
-    parser = argparse.ArgumentParser(description=description)
+    parser = parserClass(description=description)
 
     # Default connection parameters
-    parser.add_argument("lwrp_ip", help="Enter the IP Address of your LWRP Device")
+    parser.add_argument("lwrp_ip", nargs="?", help="Enter the IP Address of your LWRP Device (not needed with --salvo)")
     parser.add_argument("-p", "--lwrp_password", metavar="PASSWORD", help="The Password for your LWRP Device")
     #parser.add_argument("-f", "--format", choices=["TEXT", "JSON"], default="TEXT", help="Enter 'json' or 'text'")
     
@@ -56,38 +107,29 @@ if __name__ == "__main__":
     #parser.add_argument('--set_gpoportstate', type=str, metavar="XXXXX", help="Change the state of all pins on the GPIO port")
     parser.add_argument('--set_gpopinstate', type=str, choices=["HIGH", "LOW"], help="Change the state of one specified pin on the GPO port")
     parser.add_argument('--set_gpiomomentary', default=False, action='store_true', help="Specify this option to make this a momentary GPIO trigger")
+    parser.add_argument('--routing_file', type=str, metavar="FILE", help="Apply all the source/destination changes in a CSV or JSON file (stream numbers use --set_chlwtype)")
+    parser.add_argument('--batch', type=str, metavar="FILE", help="Run each line of a file (or - for stdin) as a command, using the same options as above, all over one connection")
+
+    # Salvos - changes across many devices at once
+    parser.add_argument('--salvo', type=str, metavar="NAME", help="Run a named salvo from the salvo file on all its devices at once")
+    parser.add_argument('--salvo_file', type=str, metavar="FILE", default="salvos.json", help="The JSON file defining the salvos (default: salvos.json)")
+    parser.add_argument('--salvo_timeout', type=float, metavar="SECONDS", default=5, help="How long to wait for every device to confirm the salvo")
+
+    # Daemon mode - keep the device connections open between commands
+    parser.add_argument('--daemon', default=False, action='store_true', help="Run as a daemon, holding connections open for commands sent with --via_daemon")
+    parser.add_argument('--via_daemon', default=False, action='store_true', help="Send this command to the daemon (or run it directly if the daemon isn't running)")
+    parser.add_argument('--daemon_port', type=int, metavar="PORT", default=9393, help="Which daemon to use: the number in its socket file name, or its local TCP port on Windows (default: 9393)")
 
     # Logging parameters
     parser.add_argument('--debug', default=False, action='store_true', help="Specify this option to see debug/error output on the console")
     parser.add_argument('--disable_logging', default=False, action='store_true', help="Specify this option to disable logging to a file")
     
-    # Parse parameters
-    args = parser.parse_args()
+    return parser
 
-    # Setup the logger
-    if args.debug:
-        LivewireCLILogging.setupLogger(True)
-    else:
-        LivewireCLILogging.setupLogger(False)
-    
-    if args.disable_logging:
-        LivewireCLILogging.disableLogging()
-    
-    # Log all exceptions
-    sys.excepthook = LivewireCLILogging.exception
-
-    # Trim all arguments
-    for arg in vars(args):
-        if isinstance(getattr(args, arg), str):
-            setattr(args, arg, getattr(args, arg).strip())
-
-    # Attempt to connect
-    try:
-        LivewireCLILogging.info("Attempting to connect to IP", args.lwrp_ip)
-        device = LWRPClient(args.lwrp_ip, 93)
-    except Exception, e:
-        LivewireCLILogging.critical("Unable to connect", e.message)
-        sys.exit(1)
+def connectDevice(args):
+    """Connect and login to the LWRP device given in the arguments."""
+    LivewireCLILogging.info("Attempting to connect to IP", args.lwrp_ip)
+    device = LWRPClient(args.lwrp_ip, 93)
 
     device.errorSub(LivewireCLILogging.error)
 
@@ -98,39 +140,155 @@ if __name__ == "__main__":
         LivewireCLILogging.info("Attempting to login without password")
         device.login()
 
+    return device
+
+def runSalvo(args, output):
+    """Run a salvo across many devices. Returns the exit code."""
+    try:
+        salvo = loadSalvos(args.salvo_file, [args.salvo])[args.salvo]
+    except KeyError:
+        LivewireCLILogging.critical("Unknown salvo", args.salvo)
+        return 1
+    except (IOError, ValueError), e:
+        LivewireCLILogging.critical("Unable to load salvo file", str(e))
+        return 1
+
+    LivewireCLILogging.info("Running salvo", args.salvo)
+
+    pool = LWRPClientPool(salvo.hosts(), 93, args.lwrp_password, args.salvo_timeout)
+    results = salvo.execute(pool, args.salvo_timeout)
+    pool.stop()
+
+    # One line per host: HOST OK|FAILED LATENCY_MS [failed changes or error]
+    exitCode = 0
+    for host in sorted(results):
+        result = results[host]
+
+        if result['error'] is not None:
+            LivewireCLILogging.error("Salvo " + args.salvo + " failed on " + host + ": " + result['error'])
+            output.append(host + " FAILED - " + result['error'])
+            exitCode = 1
+        elif len(result['failed']) > 0:
+            LivewireCLILogging.error("Salvo " + args.salvo + " not confirmed on " + host + ": " + ", ".join(result['failed']))
+            output.append(host + " FAILED - " + ", ".join(result['failed']))
+            exitCode = 1
+        else:
+            output.append(host + " OK " + str(int(result['latency'] * 1000)) + "ms")
+
+    return exitCode
+
+def runBatch(args, output, getDevice):
+    """Run every line of a batch over one connection, with all their commands pipelined. Returns the exit code."""
+    commands, errors = parseBatch(buildParser(BatchArgumentParser), args.batch)
+    exitCode = 0
+
+    for error in errors:
+        LivewireCLILogging.error(error)
+        exitCode = 1
+
+    for lineArgs in commands:
+        # Every line runs on this command's connection
+        lineArgs.lwrp_ip = args.lwrp_ip
+        lineArgs.lwrp_password = args.lwrp_password
+        lineArgs.batch = None
+
+    try:
+        device = getDevice(args)
+    except Exception, e:
+        LivewireCLILogging.critical("Unable to connect", e.message)
+        return 1
+
+    # Channel lookups go through the device state (LWRPDeviceState), which already waits for earlier changes - so no
+    # replies are shared between lines, and changes have nothing to invalidate. They're still listed, so they're only
+    # sent once rather than again when the output is produced
+    batch = LivewireBatch(device, {
+        "sourceChannel": None,
+        "destinationChannel": None,
+        "GPIChannel": None,
+        "GPOChannel": None,
+    }, {
+        "setSource": [],
+        "setDestination": [],
+        "setGPI": [],
+        "setGPO": [],
+    })
+
+    # Momentary GPIO needs the pin state before it can send its changes, and files & salvos wait for confirmations
+    def sequential(lineArgs):
+        return lineArgs.set_gpiomomentary or lineArgs.routing_file or lineArgs.salvo
+
+    for lineOutput, lineExitCode in batch.run(commands, executeCommand, sequential):
+        output.extend(lineOutput)
+        exitCode = max(exitCode, lineExitCode)
+
+    return exitCode
+
+def executeCommand(args, output, getDevice):
+    """Run the gets and sets given in the arguments, adding each line of output to the output list. Returns the exit code.
+
+    getDevice(args) returns a connected LWRPClient - a new connection, or one the daemon has kept open."""
+    if args.salvo:
+        return runSalvo(args, output)
+
+    if args.batch:
+        return runBatch(args, output, getDevice)
+
+    # Attempt to connect
+    try:
+        device = getDevice(args)
+    except Exception, e:
+        LivewireCLILogging.critical("Unable to connect", e.message)
+        return 1
+
+    # Apply a whole routing file
+    exitCode = 0
+    if args.routing_file:
+        try:
+            routeDestinations, routeSources = loadRoutingFile(args.routing_file)
+            results = device.applyRouting(routeDestinations, routeSources, args.set_chlwtype)
+        except (IOError, ValueError), e:
+            LivewireCLILogging.critical("Unable to apply routing file", str(e))
+            return 1
+
+        for routeType, chnum in sorted(results):
+            if results[(routeType, chnum)] is True:
+                output.append(routeType + " " + str(chnum) + " OK")
+            else:
+                LivewireCLILogging.error(routeType + " " + str(chnum) + " change was not confirmed by the device")
+                output.append(routeType + " " + str(chnum) + " UNCONFIRMED")
+                exitCode = 1
+
     # Source information
     if args.sourcenum and (args.get_name or args.get_ch or args.get_chlw or args.get_chlwtype):
-        sources = device.sourceData()
-        for source in sources:
-            if int(source['num']) == args.sourcenum:
-                if args.get_name:
-                    print source['attributes']['name']
-                
-                if args.get_ch:
-                    print source['attributes']['rtp_destination']
-                
-                if args.get_chlw:
-                    print AxiaLivewireAddressHelper.multicastAddrToStreamNum(source['attributes']['rtp_destination'])
-                
-                if args.get_chlwtype:
-                    print AxiaLivewireAddressHelper.streamFormatFromMulticastAddr(source['attributes']['rtp_destination'])
+        source = device.sourceChannel(args.sourcenum)
+        if source:
+            if args.get_name:
+                output.append(source['attributes']['name'])
+            
+            if args.get_ch:
+                output.append(source['attributes']['rtp_destination'])
+            
+            if args.get_chlw:
+                output.append(AxiaLivewireAddressHelper.multicastAddrToStreamNum(source['attributes']['rtp_destination']))
+            
+            if args.get_chlwtype:
+                output.append(AxiaLivewireAddressHelper.streamFormatFromMulticastAddr(source['attributes']['rtp_destination']))
 
     # Destination information
     if args.destinationnum and (args.get_name or args.get_ch or args.get_chlw or args.get_chlwtype):
-        destinations = device.destinationData()
-        for destination in destinations:
-            if int(destination['num']) == args.destinationnum:
-                if args.get_name:
-                    print destination['attributes']['name']
-                
-                if args.get_ch:
-                    print destination['attributes']['address']
-                
-                if args.get_chlw:
-                    print AxiaLivewireAddressHelper.multicastAddrToStreamNum(destination['attributes']['address'])
-                
-                if args.get_chlwtype:
-                    print AxiaLivewireAddressHelper.streamFormatFromMulticastAddr(destination['attributes']['address'])
+        destination = device.destinationChannel(args.destinationnum)
+        if destination:
+            if args.get_name:
+                output.append(destination['attributes']['name'])
+            
+            if args.get_ch:
+                output.append(destination['attributes']['address'])
+            
+            if args.get_chlw:
+                output.append(AxiaLivewireAddressHelper.multicastAddrToStreamNum(destination['attributes']['address']))
+            
+            if args.get_chlwtype:
+                output.append(AxiaLivewireAddressHelper.streamFormatFromMulticastAddr(destination['attributes']['address']))
 
     # Set source
     if args.sourcenum and args.set_ch:
@@ -156,37 +314,35 @@ if __name__ == "__main__":
 
     # Get GPI Port/Pin data
     if args.gpio_port_num and (args.get_gpiportstate or (args.gpio_pin_num and args.get_gpipinstate)):
-        ports = device.GPIData()
-        for port in ports:
-            if int(port['num']) == args.gpio_port_num and args.get_gpiportstate:
-                # Combine all pins into one string XXXXX
-                pinStr = ""
-                for pin in port['pin_states']:
-                    if pin['state'] == "high":
-                        pinStr += "H"
-                    elif pin['state'] == "low":
-                        pinStr += "L"
-                print pinStr
-            elif int(port['num']) == args.gpio_port_num and args.get_gpipinstate:
-                # Output one string as 'HIGH' or 'LOW'
-                print port['pin_states'][args.gpio_pin_num]['state'].upper()
+        port = device.GPIChannel(args.gpio_port_num)
+        if port and args.get_gpiportstate:
+            # Combine all pins into one string XXXXX
+            pinStr = ""
+            for pin in port['pin_states']:
+                if pin['state'] == "high":
+                    pinStr += "H"
+                elif pin['state'] == "low":
+                    pinStr += "L"
+            output.append(pinStr)
+        elif port and args.get_gpipinstate:
+            # Output one string as 'HIGH' or 'LOW'
+            output.append(port['pin_states'][args.gpio_pin_num]['state'].upper())
     
     # Get GPO Port/Pin data
     if args.gpio_port_num and (args.get_gpoportstate or (args.gpio_pin_num and args.get_gpopinstate)):
-        ports = device.GPOData()
-        for port in ports:
-            if int(port['num']) == args.gpio_port_num and args.get_gpoportstate:
-                # Combine all pins into one string XXXXX
-                pinStr = ""
-                for pin in port['pin_states']:
-                    if pin['state'] == "high":
-                        pinStr += "H"
-                    elif pin['state'] == "low":
-                        pinStr += "L"
-                print pinStr
-            elif int(port['num']) == args.gpio_port_num and args.get_gpopinstate:
-                # Output one string as 'HIGH' or 'LOW'
-                print port['pin_states'][args.gpio_pin_num]['state'].upper()
+        port = device.GPOChannel(args.gpio_port_num)
+        if port and args.get_gpoportstate:
+            # Combine all pins into one string XXXXX
+            pinStr = ""
+            for pin in port['pin_states']:
+                if pin['state'] == "high":
+                    pinStr += "H"
+                elif pin['state'] == "low":
+                    pinStr += "L"
+            output.append(pinStr)
+        elif port and args.get_gpopinstate:
+            # Output one string as 'HIGH' or 'LOW'
+            output.append(port['pin_states'][args.gpio_pin_num]['state'].upper())
 
     # Set GPI Pin Data
     if args.gpio_port_num and args.gpio_pin_num and args.set_gpipinstate:
@@ -194,15 +350,15 @@ if __name__ == "__main__":
         # If it's momentary, store the current state
         if args.set_gpiomomentary:
             returnState = None
-            for port in device.GPIData():
-                if int(port['num']) == args.gpio_port_num:
-                    # Get the current state
-                    returnState = port['pin_states'][args.gpio_pin_num]['state']
+            port = device.GPIChannel(args.gpio_port_num)
+            if port:
+                # Get the current state
+                returnState = port['pin_states'][args.gpio_pin_num]['state']
 
         # Change the pin state
         device.setGPI(args.gpio_port_num, args.gpio_pin_num, args.set_gpipinstate.lower())
 
-        if args.set_gpipmomentary and returnState is not None:
+        if args.set_gpiomomentary and returnState is not None:
             time.sleep(1)
             device.setGPI(args.gpio_port_num, args.gpio_pin_num, returnState)
 
@@ -212,10 +368,10 @@ if __name__ == "__main__":
         # If it's momentary, store the current state
         if args.set_gpiomomentary:
             returnState = None
-            for port in device.GPOData():
-                if int(port['num']) == args.gpio_port_num:
-                    # Get the current state
-                    returnState = port['pin_states'][args.gpio_pin_num]['state']
+            port = device.GPOChannel(args.gpio_port_num)
+            if port:
+                # Get the current state
+                returnState = port['pin_states'][args.gpio_pin_num]['state']
 
         device.setGPO(args.gpio_port_num, args.gpio_pin_num, args.set_gpopinstate.lower())
 
@@ -223,7 +379,79 @@ if __name__ == "__main__":
             time.sleep(1)
             device.setGPO(args.gpio_port_num, args.gpio_pin_num, returnState)
 
+    return exitCode
+
+if __name__ == "__main__":
+
+    # Parse parameters
+    parser = buildParser()
+    args = parser.parse_args()
+
+    # Setup the logger
+    if args.debug:
+        LivewireCLILogging.setupLogger(True)
+    else:
+        LivewireCLILogging.setupLogger(False)
+    
+    if args.disable_logging:
+        LivewireCLILogging.disableLogging()
+    
+    # Log all exceptions
+    sys.excepthook = LivewireCLILogging.exception
+
+    # Trim all arguments
+    for arg in vars(args):
+        if isinstance(getattr(args, arg), str):
+            setattr(args, arg, getattr(args, arg).strip())
+
+    if args.daemon:
+        daemon = LivewireCLIDaemon(args.daemon_port, connectDevice, executeCommand, ["lwrp_ip", "lwrp_password"])
+        daemon.serve()
+        sys.exit(0)
+
+    if not args.lwrp_ip and not args.salvo:
+        parser.error("the IP Address of your LWRP Device is required")
+
+    if args.batch:
+        # Read the batch now, so it can be sent to the daemon
+        if args.batch == "-":
+            args.batch = sys.stdin.readlines()
+        else:
+            with open(args.batch) as batchFile:
+                args.batch = batchFile.readlines()
+
+    if args.via_daemon:
+        # The daemon won't be running in the same directory as us
+        for arg in ["routing_file", "salvo_file"]:
+            if getattr(args, arg):
+                setattr(args, arg, os.path.abspath(getattr(args, arg)))
+
+        result = forwardCommand(args.daemon_port, args)
+
+        if result is not None:
+            output, exitCode = result
+            for line in output:
+                print line
+            sys.exit(exitCode)
+
+        LivewireCLILogging.warning("The CLI daemon isn't running. Running the command directly.")
+
+    # Run the command on a new connection
+    output = []
+    devices = []
+
+    def getDevice(args):
+        devices.append(connectDevice(args))
+        return devices[-1]
+
+    exitCode = executeCommand(args, output, getDevice)
+
+    for line in output:
+        print line
+
     # Disconnect from the LWRP
-    time.sleep(0.4)
-    device.stop()
-    sys.exit(0)
+    if len(devices) > 0:
+        time.sleep(0.4)
+        devices[0].stop()
+
+    sys.exit(exitCode)
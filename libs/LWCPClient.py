@@ -1,8 +1,8 @@
 """LWCP Client. An Open-Source Python Client for the Axia Livewire Control Protocol."""
 
-import time
-
 from LWCPClientComms import LWCPClientComms
+from LivewireFuture import waitForResult
+from LivewireEventStream import LivewireEventStream
 
 __author__ = "Anthony Eden"
 __copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
@@ -14,67 +14,63 @@ __version__ = "1.0"
 class LWCPClient():
     """Provides a friendly API for the Livewire Control Protocol."""
 
-    def __init__(self, host, port=4010):
-        """Init LWCP connection."""
+    # The types of message generated by INDI and EVENT updates from the console
+    eventTypes = ["ShowProfileList", "ShowProfile", "SourceProfiles", "SourceProfile", "FaderGain", "FaderState", "ChannelBus", "VMix", "DATA"]
+
+    def __init__(self, host, port=4010, reactor=None):
+        """Init LWCP connection. Pass a LivewireReactor to share its thread, instead of starting a new one."""
 
         # This is our access to the LWCP
         self.LWCP = None
 
-        # This variable gets given the callback data, ready to be processed by a waiting function
-        self.waitingForCallback = False
-        self.callbackData = None
-
         self.LWCP = LWCPClientComms(host, port)
-        self.LWCP.start()
+
+        if reactor is not None:
+            reactor.addConnection(self.LWCP)
+        else:
+            self.LWCP.start()
 
     def stop(self):
         """Close LWCP connection."""
         self.LWCP.stop()
 
-    def waitForCallback(self, timeout=5):
-        """Wait for data to be returned from the Comms class."""
-        # The time we need to stop waiting for data and return it
-        waitTimeout = time.time() + timeout
+    def running(self):
+        """Is the LWCP connection still running? (It keeps running while reconnecting)"""
+        return self.LWCP.running()
 
-        while True:
-            if self.waitingForCallback is False or waitTimeout <= time.time():
-                returnData = self.callbackData
-                self.callbackData = None
-                return returnData
+    def waitForCallback(self, future, wait=True, timeout=5):
+        """Wait for a request's data to be returned from the Comms class. If wait is False, return the future instead."""
+        if wait is False:
+            return future
 
-            else:
-                time.sleep(0.1)
+        return waitForResult(future, timeout)
 
-    def genericCallback(self, data):
-        """Generic callback receiving function."""
-        self.callbackData = data
-        self.waitingForCallback = False
+    def eventStream(self, subTypes=None):
+        """Returns a LivewireEventStream to iterate over each INDI/EVENT update from the console (or just some types)."""
+        if subTypes is None:
+            subTypes = self.eventTypes
+
+        return LivewireEventStream(self.LWCP, subTypes)
 
     def errorSub(self, callback):
         """Subscribe to error messages."""
         self.LWCP.addSubscription("ERROR", callback, False)
 
-    def getShowProfiles(self):
+    def getShowProfiles(self, wait=True):
         """Get a list of profiles on the console."""
-        self.LWCP.addSubscription("ShowProfileList", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET AppControl ShowProfList")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("ShowProfileList", "GET AppControl ShowProfList", "AppControl")
+        return self.waitForCallback(future, wait)
     
-    def getShowProfile(self):
+    def getShowProfile(self, wait=True):
         """Gets the active show profile on the console."""
-        self.LWCP.addSubscription("ShowProfile", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET AppControl ShowProfID,ShowProfName,ShowProfStat")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("ShowProfile", "GET AppControl ShowProfID,ShowProfName,ShowProfStat", "AppControl")
+        return self.waitForCallback(future, wait)
     
     def setShowProfile(self, profile_id):
         """Activates the specified Show Profile"""
         self.LWCP.sendCommand("SET AppControl ShowProfID=" + str(profile_id))
     
-    def getSourceProfiles(self, chnum, chtype = "fader"):
+    def getSourceProfiles(self, chnum, chtype = "fader", wait=True):
         """Gets the list of source profiles on the selected fader."""
         
         # Fader or Livewire
@@ -85,13 +81,10 @@ class LWCPClient():
         else:
             raise Exception("Invalid channel type provided. Use 'fader' or 'livewire'.")
         
-        self.LWCP.addSubscription("SourceProfiles", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET " + chtype_cmd + str(chnum) + " src_list")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("SourceProfiles", "GET " + chtype_cmd + str(chnum) + " src_list", chtype_cmd + str(chnum))
+        return self.waitForCallback(future, wait)
     
-    def getSourceProfile(self, chnum, chtype = "fader"):
+    def getSourceProfile(self, chnum, chtype = "fader", wait=True):
         """Gets the currently active source profile on the selected fader."""
         
         # Fader or Livewire
@@ -102,11 +95,8 @@ class LWCPClient():
         else:
             raise Exception("Invalid channel type provided. Use 'fader' or 'livewire'.")
         
-        self.LWCP.addSubscription("SourceProfile", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET " + chtype_cmd + str(chnum) + " src_id, src_name, src_lwch, src_stat")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("SourceProfile", "GET " + chtype_cmd + str(chnum) + " src_id, src_name, src_lwch, src_stat", chtype_cmd + str(chnum))
+        return self.waitForCallback(future, wait)
     
     def setSourceProfile(self, chnum, src_id, chtype = "fader"):
         """Sets a new active source profile on the selected fader."""
@@ -119,10 +109,9 @@ class LWCPClient():
         else:
             raise Exception("Invalid channel type provided. Use 'fader' or 'livewire'.")
         
-        self.LWCP.addSubscription("SourceProfile", self.genericCallback, 1)
         self.LWCP.sendCommand("SET " + chtype_cmd + str(chnum) + " src_id=" + str(src_id))
 
-    def getChannelState(self, chnum, chtype = "fader"):
+    def getChannelState(self, chnum, chtype = "fader", wait=True):
         """Gets the on/off state for the specified channel."""
         
         # Fader or Livewire
@@ -133,11 +122,8 @@ class LWCPClient():
         else:
             raise Exception("Invalid channel type provided. Use 'fader' or 'livewire'.")
         
-        self.LWCP.addSubscription("FaderState", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET " + chtype_cmd + str(chnum) + " ON_State")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("FaderState", "GET " + chtype_cmd + str(chnum) + " ON_State", chtype_cmd + str(chnum))
+        return self.waitForCallback(future, wait)
         
     def setChannelState(self, chnum, on, chtype = "fader"):
         """Sets the specified channel on/off"""
@@ -158,7 +144,7 @@ class LWCPClient():
 
         self.LWCP.sendCommand("SET " + chtype_cmd + str(chnum) + " " + on_cmd)
     
-    def getChannelGain(self, chnum, chtype = "fader"):
+    def getChannelGain(self, chnum, chtype = "fader", wait=True):
         """Gets the level for the specified channel."""
         
         # Fader or Livewire
@@ -169,11 +155,8 @@ class LWCPClient():
         else:
             raise Exception("Invalid channel type provided. Use 'fader' or 'livewire'.")
         
-        self.LWCP.addSubscription("FaderGain", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET " + chtype_cmd + str(chnum) + " Fader_Gain")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("FaderGain", "GET " + chtype_cmd + str(chnum) + " Fader_Gain", chtype_cmd + str(chnum))
+        return self.waitForCallback(future, wait)
     
     def setChannelGain(self, chnum, level, chtype = "fader"):
         """Sets the level for the specified channel"""
@@ -188,7 +171,7 @@ class LWCPClient():
 
         self.LWCP.sendCommand("SET " + chtype_cmd + str(chnum) + " Fader_Gain=" + str(level))
 
-    def getChannelBus(self, chnum, chtype = "fader"):
+    def getChannelBus(self, chnum, chtype = "fader", wait=True):
         """Gets the bus assignment for the specified channel."""
 
         # Fader or Livewire
@@ -199,11 +182,8 @@ class LWCPClient():
         else:
             raise Exception("Invalid channel type provided. Use 'fader' or 'livewire'.")
         
-        self.LWCP.addSubscription("ChannelBus", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET " + chtype_cmd + str(chnum) + " Asg_PGM1, Asg_PGM2, Asg_PGM3, Asg_PGM4, Asg_PREV")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("ChannelBus", "GET " + chtype_cmd + str(chnum) + " Asg_PGM1, Asg_PGM2, Asg_PGM3, Asg_PGM4, Asg_PREV", chtype_cmd + str(chnum))
+        return self.waitForCallback(future, wait)
         
     def setChannelBus(self, chnum, pgm1=None, pgm2=None, pgm3=None, pgm4=None, prev=None, chtype = "fader"):
         """Assign or unassign channels from each bus on the console"""
@@ -252,13 +232,10 @@ class LWCPClient():
 
         self.LWCP.sendCommand("SET " + chtype_cmd + str(chnum) + " " + str(commands_bus_text))
 
-    def getVMixChannelState(self, vmix, chnum):
+    def getVMixChannelState(self, vmix, chnum, wait=True):
         """Gets the level for the specified channel."""
-        self.LWCP.addSubscription("VMix", self.genericCallback, 1)
-        self.LWCP.sendCommand("GET VMIX.SUB#"+str(vmix)+".IN#"+str(chnum)+" State, Gain, TimeUp, TimeDown")
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWCP.request("VMix", "GET VMIX.SUB#"+str(vmix)+".IN#"+str(chnum)+" State, Gain, TimeUp, TimeDown", "VMIX.SUB#"+str(vmix)+".IN#"+str(chnum))
+        return self.waitForCallback(future, wait)
 
     def setVMixChannelState(self, vmix, chnum, on):
         """Sets the channel on/off for the specified vmix channel"""
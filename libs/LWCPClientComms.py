@@ -1,10 +1,13 @@
 """LWCP Client (Communication Class). An Open-Source Python Client for the Axia Livewire Control Protocol."""
 
-import socket
-import time
-import threading
+import re
 import xmltodict
 import json
+import logging
+logger = logging.getLogger(__name__)
+
+from LivewireClientComms import LivewireClientComms
+from LivewireSendQueue import PRIORITY_CONTROL
 
 __author__ = "Anthony Eden"
 __copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
@@ -12,146 +15,50 @@ __credits__ = ["Anthony Eden"]
 __license__ = "Commercial"
 __version__ = "1.0"
 
+# Matches an encapsulated block, including any newlines inside it
+encapBlockRegex = re.compile(r"%BeginEncap%.*?%EndEncap%", re.DOTALL)
 
-class LWCPClientComms(threading.Thread):
-    """This class handles all the communications with the LWCP server."""
-
-    def __init__(self, host, port):
-        """Create a socket connection to the LWCP server."""
-
-        # The handle for the socket connection to the LWCP server
-        self.sock = None
-
-        # A list of all commands to send to the LWCP server
-        self.sendQueue = []
-
-        # A list of data types to subscribe to (with callbacks)
-        self.dataSubscriptions = []
-
-        # Should we be shutting down this thread? Set via self.stop()
-        self._stop = False
-
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        self.sock.connect((host, port))
-        self.sock.setblocking(0)
-
-        # Start the thread
-        threading.Thread.__init__(self)
-
-    def stop(self):
-        """Attempt to close this thread."""
-        self._stop = True
-
-    def run(self):
-        """Method keeps running forever, and handles all the communication with the open LWCP socket."""
-        while True:
-
-            # Try and receive data from the LWCP server
-            recvData = self.recvUntilNewline()
-
-            if recvData is not None:
-                self.processReceivedData(recvData)
-
-            # Check if we've got data to send back to the LWCP server
-            if len(self.sendQueue) > 0:
-                dataToSend = self.sendQueue[0]
 
-                while dataToSend:
-                    sent = self.sock.send(dataToSend)
-                    dataToSend = dataToSend[sent:]
-
-                # Once the message has been sent, take it out of the queue
-                self.sendQueue.pop(0)
+class LWCPClientComms(LivewireClientComms):
+    """This class handles all the communications with the LWCP server."""
 
-            if self._stop is True:
-                # End the thread
-                self.sock.close()
-                break
+    protocolName = "LWCP"
+    blockBegin = b"%BeginEncap%"
 
-            # Lower this number to receive data quicker
-            if len(self.sendQueue) == 0:
-                time.sleep(0.1)
+    def updateBlockState(self, line, inBlock):
+        """Track %BeginEncap%/%EndEncap% blocks, so a block is only processed once it has been fully received."""
+        beginPos = line.rfind(b"%BeginEncap%")
+        endPos = line.rfind(b"%EndEncap%")
 
-    def recvUntilNewline(self):
-        """Receive data until we get to the end of a message (also accounts for encapsulation blocks)."""
-        totalData = ""
-        inBlock = False
+        if beginPos > endPos:
+            return True
 
-        while True:
-            try:
-                totalData += self.sock.recv(1024)
-            except:
-                pass
-                
-            # Check if we're in a data block
-            if "%BeginEncap%" in totalData:
-                inBlock = True
+        elif endPos > beginPos:
+            return False
 
-            # Check if the datablock is over
-            if "%EndEncap%" in totalData and inBlock is True:
-                return totalData
-
-            # If we're not in a datablock and a newline is found, return the data
-            if "\n" in totalData and inBlock is False:
-                return totalData
-
-            # We return 'None' if there's no data to return
-            if totalData == "":
-                return None
+        return inBlock
 
     def processReceivedData(self, recvData):
         """Process the received data from the LWCP server. Attempts to parse it and trigger all the subscribed callbacks."""
-        # A dict with all the different message types we've received
-        messageTypes = {}
-
-        # Remove newlines between %BeginEncap% abd %EndEncap%
+        # Remove newlines between %BeginEncap% and %EndEncap%
         if "%BeginEncap%" in recvData:
-            recvData = recvData.replace("\n", " ").replace("\r", " ")
-        
-        # Parse the data so it's in a usable format
-        # We receive a list in return (one per message - for blocks of data)
-        parsedData = self.parseMessage(recvData)
+            recvData = encapBlockRegex.sub(lambda block: block.group(0).replace("\n", " ").replace("\r", " "), recvData)
 
-        # Enumerate over all the messages
-        for dataIndex, data in enumerate(parsedData):
+        LivewireClientComms.processReceivedData(self, recvData)
 
-            # Check if messageTypes already contains a list for this type.
-            # If not, create one
-            if parsedData[dataIndex]['type'] not in messageTypes:
-                messageTypes[parsedData[dataIndex]['type']] = []
+    def replyObject(self, data):
+        """Replies are matched to requests on the object they're about (e.g. FaCH#1), as well as the message type."""
+        if "object" in data:
+            return data["object"].upper()
 
-            # Add this message to the appropriate messageTypes list
-            messageTypes[parsedData[dataIndex]['type']].append(parsedData[dataIndex])
+        return None
 
-        # Loop over every subscription
-        for subI, subX in enumerate(self.dataSubscriptions):
+    def request(self, replyType, msg, replyObject=None, priority=PRIORITY_CONTROL, replySize=None, timeout=None):
+        """Send a command and return a LivewireFuture, resolved with the next replyType message about replyObject."""
+        if replyObject is not None:
+            replyObject = replyObject.upper()
 
-            # If the subscribed command type matches the message's command type
-            if subX['commandType'] in messageTypes:
-
-                # Execute the callback!
-                subX['callback'](messageTypes[subX['commandType']])
-
-            # Check if we need to decrement the limit
-            if self.dataSubscriptions[subI]['limit'] is not False:
-                self.dataSubscriptions[subI]['limit'] = self.dataSubscriptions[subI]['limit'] - 1
-
-            # Check if we need to remove this subscription
-            if self.dataSubscriptions[subI]['limit'] <= 0 and self.dataSubscriptions[subI]['limit'] is not False:
-                self.dataSubscriptions.pop(subI)
-
-    def sendCommand(self, msg):
-        """Buffer a command to send."""
-        self.sendQueue.append(msg + "\n")
-
-    def addSubscription(self, subType, callbackObj, limit=False, filters={}):
-        """Add a subscription to the list of data subscriptions."""
-        self.dataSubscriptions.append({
-            "commandType": subType,
-            "callback": callbackObj,
-            "limit": limit
-        })
+        return LivewireClientComms.request(self, replyType, msg, replyObject, priority, replySize, timeout=timeout)
 
     def splitSegments(self, string):
         """Attempt to parse all the segments provided in return data."""
@@ -196,8 +103,10 @@ class LWCPClientComms(threading.Thread):
 
         return segments
 
-    def parseMessage(self, data):
-        """Parse the messages and put them into a list of dictionaries."""
+    def parseMessage(self, data, wantedTypes=None):
+        """Parse the messages and put them into a list of dictionaries.
+
+        LWCP message types depend on their attributes, so wantedTypes can't save any parsing here."""
         allData = []
 
         for x in data.splitlines():
@@ -207,6 +116,12 @@ class LWCPClientComms(threading.Thread):
                 segments = self.splitSegments(x[5:])
                 data['type'] = "DATA"
                 data["attributes"] = self.parseAttributes(segments)
+
+                # The object this message is about (e.g. FaCH#1 or AppControl)
+                for segment in segments:
+                    if segment != "":
+                        data["object"] = segment
+                        break
                 
                 if 'profile_list' in data['attributes']:
                     data['type'] = "ShowProfileList"
@@ -1,8 +1,13 @@
 """LWRP Client. An Open-Source Python Client for the Axia Livewire Routing Protocol."""
 
-import time
+import socket
 
 from LWRPClientComms import LWRPClientComms
+from LivewireFuture import LivewireFuture, waitForResult, whenAll
+from LivewireEventStream import LivewireEventStream
+from LWRPDeviceState import LWRPDeviceState
+from LivewireSendQueue import PRIORITY_POLL
+import AxiaLivewireAddressHelper
 
 __author__ = "Anthony Eden"
 __copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
@@ -11,126 +16,319 @@ __license__ = "GPL"
 __version__ = "0.6"
 
 
+def validateRouting(destinations=None, sources=None, streamFormat="standard"):
+    """Check a set of routes for LWRPClient.applyRouting(), and turn stream numbers into multicast addresses.
+
+    Raises a ValueError listing every bad entry. Returns a dict of ("DST" or "SRC", channel number) -> address."""
+    # Work out the base address for this stream format once, rather than for every route
+    baseAddress = AxiaLivewireAddressHelper.ipToDecimal(AxiaLivewireAddressHelper.streamFormatBaseIp(streamFormat))
+
+    routes = {}
+    errors = []
+
+    for routeType, routeMap in (("DST", destinations), ("SRC", sources)):
+        if routeMap is None:
+            continue
+
+        for chnum, target in routeMap.items():
+            try:
+                chnum = int(chnum)
+                if chnum < 1:
+                    raise ValueError()
+            except (ValueError, TypeError):
+                errors.append(routeType + " " + str(chnum) + ": invalid channel number")
+                continue
+
+            target = str(target).strip()
+
+            if target.isdigit():
+                # A Livewire stream number
+                if not 1 <= int(target) <= 32767:
+                    errors.append(routeType + " " + str(chnum) + ": stream number out of range: " + target)
+                    continue
+
+                target = AxiaLivewireAddressHelper.decimalToIp(baseAddress + int(target))
+
+            elif target.count(".") == 3:
+                # A multicast (or unicast) address
+                try:
+                    socket.inet_aton(target)
+                except socket.error:
+                    errors.append(routeType + " " + str(chnum) + ": invalid address: " + target)
+                    continue
+
+            else:
+                errors.append(routeType + " " + str(chnum) + ": not a stream number or address: " + target)
+                continue
+
+            routes[(routeType, chnum)] = target
+
+    if len(errors) > 0:
+        raise ValueError("Invalid routing: " + "; ".join(errors))
+
+    return routes
+
+
 class LWRPClient():
     """Provides a friendly API for the Livewire Routing Protocol."""
 
-    def __init__(self, host, port):
-        """Init LWRP connection."""
+    # The command which starts each type of subscription
+    subscriptionCommands = {
+        "SOURCE": "SRC",
+        "DESTINATION": "DST",
+        "GPI": "ADD GPI",
+        "GPO": "ADD GPO",
+        "MATRIX": "MIX",
+        "LEVEL_ALERT": None,
+        "ERROR": None,
+    }
+
+    # Table -> the VER attribute with the number of channels in it
+    tableCounts = {
+        "SOURCE": "source_count",
+        "DESTINATION": "destination_count",
+        "GPI": "GPI_count",
+        "GPO": "GPO_count",
+    }
+
+    def __init__(self, host, port, reactor=None, connectTimeout=None):
+        """Init LWRP connection. Pass a LivewireReactor to share its thread, instead of starting a new one."""
 
         # This is our access to the LWRP
         self.LWRP = None
 
-        # This variable gets given the callback data, ready to be processed by a waiting function
-        self.waitingForCallback = False
-        self.callbackData = None
+        self.LWRP = LWRPClientComms(host, port, connectTimeout)
+
+        # The device's channel counts, so we know how long each table is (see tableRequest)
+        self.deviceInfo = self.LWRP.request("DEVICE", "VER")
 
-        self.LWRP = LWRPClientComms(host, port)
-        self.LWRP.start()
+        # ...and so a meter reading split across several reads is still one reading
+        self.LWRP.meterFrame.readingSize = self.meterCount
+
+        # A local copy of the device's channels, for the *Channel() methods
+        self.state = LWRPDeviceState(self)
+
+        if reactor is not None:
+            reactor.addConnection(self.LWRP)
+        else:
+            self.LWRP.start()
 
     def stop(self):
         """Close LWRP connection."""
         self.LWRP.stop()
 
-    def waitForCallback(self, timeout=5):
-        """Wait for data to be returned from the Comms class."""
-        # The time we need to stop waiting for data and return it
-        waitTimeout = time.time() + timeout
-
-        while True:
-            if self.waitingForCallback is False or waitTimeout <= time.time():
-                returnData = self.callbackData
-                self.callbackData = None
-                return returnData
+    def running(self):
+        """Is the LWRP connection still running? (It keeps running while reconnecting)"""
+        return self.LWRP.running()
 
-            else:
-                time.sleep(0.1)
+    def waitForCallback(self, future, wait=True, timeout=5):
+        """Wait for a request's data to be returned from the Comms class. If wait is False, return the future instead."""
+        if wait is False:
+            return future
 
-    def genericCallback(self, data):
-        """Generic callback receiving function."""
-        self.callbackData = data
-        self.waitingForCallback = False
+        return waitForResult(future, timeout)
 
     def login(self, password=None):
         """Login to the device/server. Required for non-info commands."""
         if password is not None:
-            self.LWRP.sendCommand("LOGIN " + password)
+            self.LWRP.setLoginCommand("LOGIN " + password)
         else:
-            self.LWRP.sendCommand("LOGIN")
+            self.LWRP.setLoginCommand("LOGIN")
+
+    def eventStream(self, subType):
+        """Subscribe to a type of data (e.g. 'GPI'), returning a LivewireEventStream to iterate over for each message."""
+        if subType not in self.subscriptionCommands:
+            raise ValueError("Unknown subscription type. Use one of: " + ", ".join(sorted(self.subscriptionCommands)))
+
+        stream = LivewireEventStream(self.LWRP, subType)
+
+        if self.subscriptionCommands[subType] is not None:
+            self.LWRP.sendCommand(self.subscriptionCommands[subType], replay=True)
+
+        return stream
 
     def errorSub(self, callback):
         """Subscribe to error messages."""
         self.LWRP.addSubscription("ERROR", callback, False)
 
-    def deviceData(self):
-        """Get core data about the device/server."""
-        self.LWRP.addSubscription("DEVICE", self.genericCallback, 1)
-        self.LWRP.sendCommand("VER")
+    def tableSize(self, table):
+        """The number of channels the device has in a table, from its VER reply. None if we don't know (yet)."""
+        if table not in self.tableCounts or not self.deviceInfo.done():
+            return None
 
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        data = self.deviceInfo.result(0)
 
-    def networkData(self):
-        """Get networking data about the device/server."""
-        self.LWRP.addSubscription("NETWORK", self.genericCallback, 1)
-        self.LWRP.sendCommand("IP")
+        if data is None:
+            return None
 
-        self.waitingForCallback = True
-        data1 = self.waitForCallback()
+        try:
+            return int(data[0]['attributes'][self.tableCounts[table]])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def tableRequest(self, table, replay=False):
+        """Ask for every channel in a table (e.g. 'SOURCE'). Returns a future resolved with all their messages.
+
+        Nothing marks the end of the device's reply, so it's complete once we have as many channels as VER said there are.
+        The device answers in order, so by the time this reply starts, the VER reply sent on connecting has arrived."""
+        replySize = lambda: self.tableSize(table)
+        return self.LWRP.request(table, self.subscriptionCommands[table], replySize=replySize, replay=replay)
+
+    def deviceData(self, wait=True):
+        """Get core data about the device/server."""
+        future = self.LWRP.request("DEVICE", "VER")
+        return self.waitForCallback(future, wait)
+
+    def networkData(self, wait=True):
+        """Get networking data about the device/server."""
+        networkFuture = self.LWRP.request("NETWORK", "IP")
 
         # Some extra data is available via the 'SET' command. Find this and append it to the NETWORK data.
-        self.LWRP.addSubscription("SET", self.genericCallback, 1)
-        self.LWRP.sendCommand("SET")
+        setFuture = self.LWRP.request("SET", "SET")
 
-        self.waitingForCallback = True
-        data2 = self.waitForCallback()
+        future = LivewireFuture()
 
-        data1[0]['attributes'].update(data2[0]['attributes'])
-        return data1
+        def combine(_):
+            if networkFuture.done() and setFuture.done():
+                data1 = networkFuture.result(0)
+                data2 = setFuture.result(0)
 
+                if data1 is not None and data2 is not None:
+                    data1[0]['attributes'].update(data2[0]['attributes'])
 
-    def sourceData(self):
-        """Get current audio source data."""
-        self.LWRP.addSubscription("SOURCE", self.genericCallback, 1)
-        self.LWRP.sendCommand("SRC")
+                future.setResult(data1)
 
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        networkFuture.addDoneCallback(combine)
+        setFuture.addDoneCallback(combine)
+
+        return self.waitForCallback(future, wait)
+
+    def sourceData(self, wait=True):
+        """Get current audio source data."""
+        future = self.tableRequest("SOURCE")
+        return self.waitForCallback(future, wait)
 
     def sourceDataSub(self, callback):
         """Subscribe to audio source data updates."""
         self.LWRP.addSubscription("SOURCE", callback, False)
-        self.LWRP.sendCommand("SRC")
+        self.LWRP.sendCommand("SRC", replay=True)
 
-    def destinationData(self):
-        """Get current audio destination data."""
-        self.LWRP.addSubscription("DESTINATION", self.genericCallback, 1)
-        self.LWRP.sendCommand("DST")
+    def sourceChannel(self, chnum, wait=True):
+        """Get one audio source's data, from the local copy of the device state (downloaded on first use)."""
+        return self.waitForCallback(self.state.lookup("SOURCE", chnum), wait)
 
-        self.waitingForCallback = True
-        return self.waitForCallback()
+    def destinationData(self, wait=True):
+        """Get current audio destination data."""
+        future = self.tableRequest("DESTINATION")
+        return self.waitForCallback(future, wait)
 
     def destinationDataSub(self, callback):
         """Subscribe to audio destination data updates."""
         self.LWRP.addSubscription("DESTINATION", callback, False)
-        self.LWRP.sendCommand("DST")
+        self.LWRP.sendCommand("DST", replay=True)
 
-    def meterData(self):
-        """Get the current audio level meter data."""
-        self.LWRP.addSubscription("METER", self.genericCallback, 1)
-        self.LWRP.sendCommand("MTR")
+    def destinationChannel(self, chnum, wait=True):
+        """Get one audio destination's data, from the local copy of the device state (downloaded on first use)."""
+        return self.waitForCallback(self.state.lookup("DESTINATION", chnum), wait)
+
+    def meterCount(self):
+        """The number of meters in an MTR reply - one for each source and one for each destination. None if we don't know (yet)."""
+        sources = self.tableSize("SOURCE")
+        destinations = self.tableSize("DESTINATION")
 
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        if sources is None or destinations is None:
+            return None
 
-    def setSource(self, chnum, multicast_addr): 
-        """Set the source address for a specified channel"""
-        self.LWRP.sendCommand("SRC " + str(chnum) + " RTPA:" + str(multicast_addr))
+        return sources + destinations
+
+    def meterData(self, wait=True):
+        """Get the current audio level meter data."""
+        # Meters are polled often, so don't let them hold up routing changes.
+        # Like a table, the reply is complete once every meter has arrived (see tableRequest)
+        future = self.LWRP.request("METER", "MTR", priority=PRIORITY_POLL, replySize=self.meterCount)
+        return self.waitForCallback(future, wait)
+
+    def pollMeters(self):
+        """Ask for a meter reading without waiting for it. It's delivered to meterFrameSub() callbacks."""
+        self.LWRP.sendCommand("MTR", priority=PRIORITY_POLL)
+
+    def meterFrameSub(self, callback):
+        """Subscribe to meter readings as an LWRPMeterFrame of numeric levels, rather than a message for every meter.
+
+        The callback usually gets the same frame object every time, updated in place - use frame.copy() to keep a reading."""
+        def frames(data):
+            for message in data:
+                callback(message['frame'])
+
+        return self.LWRP.addSubscription("METER_FRAME", frames, False)
+
+    def setSource(self, chnum, multicast_addr, wait=False):
+        """Set the source address for a specified channel. Returns a future for the device's echo of the change, unless wait is True."""
+        # The device echoes the change back - claim it (by channel), so it isn't mistaken for part of a SRC query's reply
+        future = self.LWRP.request("SOURCE", "SRC " + str(chnum) + " RTPA:" + str(multicast_addr), str(int(chnum)), replySize=1)
+        self.state.expectChange("SOURCE", future)
+        return self.waitForCallback(future, wait)
     
-    def setDestination(self, chnum, multicast_addr): 
-        """Set the output address for a specified channel"""
-        self.LWRP.sendCommand("DST " + str(chnum) + " ADDR:" + str(multicast_addr))
+    def setDestination(self, chnum, multicast_addr, wait=False):
+        """Set the output address for a specified channel. Returns a future for the device's echo of the change, unless wait is True."""
+        future = self.LWRP.request("DESTINATION", "DST " + str(chnum) + " ADDR:" + str(multicast_addr), str(int(chnum)), replySize=1)
+        self.state.expectChange("DESTINATION", future)
+        return self.waitForCallback(future, wait)
+
+    def applyRouting(self, destinations=None, sources=None, streamFormat="standard", wait=True, timeout=5):
+        """Route many channels at once. Takes dicts of {channel number: Livewire stream number or multicast address}.
+
+        Every command is sent in one go, then confirmed against the device's echo of the change.
+        Returns a dict of ("DST" or "SRC", channel number) -> True if the change was confirmed, False if not.
+        If wait is False, a future is returned instead - it's resolved once every change is echoed (or timed out).
+        Until then, the future's 'confirmed' attribute shows which changes have been confirmed so far."""
+        routes = validateRouting(destinations, sources, streamFormat)
+        confirmed = dict((route, False) for route in routes)
+
+        future = LivewireFuture()
+        future.confirmed = confirmed
+        echoes = []
+
+        def confirm(echo, route, addressAttribute):
+            data = echo.result(0)
+
+            if data:
+                # An unrouted channel is parsed as None. Some firmware versions include the port number in the address
+                address = str(data[0]['attributes'].get(addressAttribute) or "0.0.0.0").split(":")[0]
+                confirmed[route] = address == routes[route]
+
+        def cancel(_):
+            for echo in echoes:
+                echo.cancel()
+
+        for (routeType, chnum), address in sorted(routes.items()):
+            # Each echo is claimed by channel number, so it can't be mistaken for part of a SRC/DST query's reply
+            if routeType == "DST":
+                echo = self.LWRP.request("DESTINATION", "DST " + str(chnum) + " ADDR:" + address, str(chnum), replySize=1, timeout=timeout)
+                self.state.expectChange("DESTINATION", echo)
+                addressAttribute = "address"
+            else:
+                echo = self.LWRP.request("SOURCE", "SRC " + str(chnum) + " RTPA:" + address, str(chnum), replySize=1, timeout=timeout)
+                self.state.expectChange("SOURCE", echo)
+                addressAttribute = "rtp_destination"
+
+            echo.addDoneCallback(lambda echo, route=(routeType, chnum), addressAttribute=addressAttribute: confirm(echo, route, addressAttribute))
+            echoes.append(echo)
+
+        whenAll(echoes).addDoneCallback(lambda _: future.setResult(confirmed))
+
+        # Giving up on the routing stops waiting for the echoes
+        future.addDoneCallback(cancel)
+
+        if wait is False:
+            return future
 
-    def setSilenceThreshold(self, io, chnum, threshold, timems):
+        future.result(timeout)
+        future.cancel()
+
+        return dict(confirmed)
+
+    def setSilenceThreshold(self, io, chnum, threshold, timems, wait=True):
         """Set a silence threshold and time for a specific I/O channel."""
         if io == "in":
             ioch = "ICH"
@@ -143,13 +341,10 @@ class LWRPClient():
         threshold = str(int(threshold))
         timems = str(int(timems))
 
-        self.LWRP.addSubscription("LEVEL_ALERT", self.genericCallback, 1)
-        self.LWRP.sendCommand("LVL " + ioch + " " + chnum + " LOW.LEVEL:" + threshold + " LOW.TIME:" + timems)
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWRP.request("LEVEL_ALERT", "LVL " + ioch + " " + chnum + " LOW.LEVEL:" + threshold + " LOW.TIME:" + timems, replySize=1)
+        return self.waitForCallback(future, wait)
 
-    def setClippingThreshold(self, io, chnum, threshold, timems):
+    def setClippingThreshold(self, io, chnum, threshold, timems, wait=True):
         """Set a clipping threshold and time for a specific I/O channel."""
         if io == "in":
             ioch = "ICH"
@@ -162,42 +357,41 @@ class LWRPClient():
         threshold = str(int(threshold))
         timems = str(int(timems))
 
-        self.LWRP.addSubscription("LEVEL_ALERT", self.genericCallback, 1)
-        self.LWRP.sendCommand("LVL " + ioch + " " + chnum + " CLIP.LEVEL:" + threshold + " CLIP.TIME:" + timems)
-
-        self.waitingForCallback = True
-        return self.waitForCallback()
+        future = self.LWRP.request("LEVEL_ALERT", "LVL " + ioch + " " + chnum + " CLIP.LEVEL:" + threshold + " CLIP.TIME:" + timems, replySize=1)
+        return self.waitForCallback(future, wait)
 
 
     def levelAlertSub(self, callback):
         """Subscribe to Level Alerts (Silence & Clipping detection)."""
         self.LWRP.addSubscription("LEVEL_ALERT", callback, False)
 
-    def GPIData(self):
+    def GPIData(self, wait=True):
         """Get current GPI state data."""
-        self.LWRP.addSubscription("GPI", self.genericCallback, 1)
-        self.LWRP.sendCommand("ADD GPI")
+        future = self.tableRequest("GPI")
+        return self.waitForCallback(future, wait)
 
-        self.waitingForCallback = True
-        return self.waitForCallback()
+    def GPIChannel(self, chnum, wait=True):
+        """Get one GPI port's state, from the local copy of the device state (downloaded on first use)."""
+        return self.waitForCallback(self.state.lookup("GPI", chnum), wait)
 
     def GPIDataSub(self, callback):
         """Subscribe to GPI data updates."""
         self.LWRP.addSubscription("GPI", callback, False)
-        self.LWRP.sendCommand("ADD GPI")
+        self.LWRP.sendCommand("ADD GPI", replay=True)
 
-    def GPOData(self):
+    def GPOData(self, wait=True):
         """Get current GPO state data."""
-        self.LWRP.addSubscription("GPO", self.genericCallback, 1)
-        self.LWRP.sendCommand("ADD GPO")
+        future = self.tableRequest("GPO")
+        return self.waitForCallback(future, wait)
 
-        self.waitingForCallback = True
-        return self.waitForCallback()
+    def GPOChannel(self, chnum, wait=True):
+        """Get one GPO port's state, from the local copy of the device state (downloaded on first use)."""
+        return self.waitForCallback(self.state.lookup("GPO", chnum), wait)
 
     def GPODataSub(self, callback):
         """Subscribe to GPO data updates."""
         self.LWRP.addSubscription("GPO", callback, False)
-        self.LWRP.sendCommand("ADD GPO")
+        self.LWRP.sendCommand("ADD GPO", replay=True)
 
     def setGPO(self, chnum, pin, state, type = "GPO"):
         """Set the GPO pin state for a specific channel."""
@@ -219,6 +413,9 @@ class LWRPClient():
                 pinstr += "x"
 
         self.LWRP.sendCommand(type + " " + chnum + " " + pinstr)
+
+        # There's no reply to a pin change we can wait on, so download the port states again before the next lookup
+        self.state.refresh(type)
     
     def setGPI(self, chnum, pin, state):
         """Set the GPI pin state for a specific channel."""
@@ -230,6 +427,7 @@ class LWRPClient():
         commandText = str(commandText).replace('"', '\"')[:128]
 
         self.LWRP.sendCommand("GPI " + chnum + " CMD:\"" + commandText + "\"")
+        self.state.refresh("GPI")
 
     def setGPOText(self, chnum, commandText):
         """Set the GPO text command for a specific channel."""
@@ -237,11 +435,16 @@ class LWRPClient():
         commandText = str(commandText).replace('"', '\"')[:128]
 
         self.LWRP.sendCommand("GPO " + chnum + " CMD:\"" + commandText + "\"")
+        self.state.refresh("GPO")
     
     def matrixSub(self, callback):
         """Subscribe to matrix changes."""
         self.LWRP.addSubscription("MATRIX", callback, False)
-        self.LWRP.sendCommand("MIX")
+        self.LWRP.sendCommand("MIX", replay=True)
+
+    def matrixChannel(self, dstchnum, wait=True):
+        """Get the mix points of one matrix destination, from the local copy of the device state (downloaded on first use)."""
+        return self.waitForCallback(self.state.lookup("MATRIX", dstchnum), wait)
 
     def matrixSet(self, dstchnum, srcchnum, srclevel):
         """Sets a matrix mix point for a specific destination channel."""
@@ -258,6 +461,7 @@ class LWRPClient():
             changes = str(int(srcchnum)) + ":" + srclevel
 
         self.LWRP.sendCommand("MIX " + chnum + " " + changes)
+        self.state.refresh("MATRIX")
     
     def matrixRelease(self, dstchnum, srcchnum):
         """ Releases a matrix mix point. """
@@ -1,11 +1,11 @@
 """LWRP Client (Communication Class). An Open-Source Python Client for the Axia Livewire Routing Protocol."""
 
-import socket
-import time
-import threading
 import logging
 logger = logging.getLogger(__name__)
 
+from LivewireClientComms import LivewireClientComms
+from LWRPMeterFrame import LWRPMeterFrame
+
 __author__ = "Anthony Eden"
 __copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
 __credits__ = ["Anthony Eden"]
@@ -13,404 +13,344 @@ __license__ = "GPL"
 __version__ = "0.6-loggingpatch"
 
 
-class LWRPClientComms(threading.Thread):
+# Handlers for each attribute found in LWRP data. Each receives the attrs dict being built,
+# the value following the attribute name, and the list of sections (for space-separated values).
+
+def attrPeak(attrs, value, sections, i):
+    # Peak level meters
+    # These stay as strings for meterData() - meterFrameSub() gets them as numbers
+    levels = value.split(":")
+    attrs["PEAK_L"] = levels[0]
+    attrs["PEAK_R"] = levels[1]
+
+def attrRMS(attrs, value, sections, i):
+    # RMS level meters
+    levels = value.split(":")
+    attrs["RMS_L"] = levels[0]
+    attrs["RMS_R"] = levels[1]
+
+def attrSourceCount(attrs, value, sections, i):
+    # only parse source type if available
+    if '/' in value:
+        attrs["source_count"], attrs["source_type"] = value.split("/")[:2]
+    else:
+        attrs["source_count"] = value
+        attrs["source_type"] = ''
+
+def attrMatrixConfig(attrs, value, sections, i):
+    if value == "1":
+        attrs["matrix_enabled"] = True
+    elif value == "0":
+        attrs["matrix_enabled"] = False
+    else:
+        # Not a value we understand, so treat it like any other MIX attribute
+        attrs["matrix_channels"] = sections[i][4:]
+
+def attrAddress(attrs, value, sections, i):
+    if value[:7] == "0.0.0.0" or value == "":
+        attrs["address"] = None
+    elif " " in value:
+        # Sometimes other data is provides in this field after the actual address
+        # Discard that extra info and just return the address
+        attrs['address'] = value.split(" ")[0]
+    else:
+        attrs["address"] = value
+
+def attrString(key):
+    """Make a handler which stores the attribute value as-is."""
+    def handler(attrs, value, sections, i):
+        attrs[key] = value
+    return handler
+
+def attrBoolean(key):
+    """Make a handler which stores True if the attribute value is '1'."""
+    def handler(attrs, value, sections, i):
+        attrs[key] = value == "1"
+    return handler
+
+def attrFlag(key, state):
+    """Make a handler for attributes which are a flag on their own (e.g. CLIP / NO-CLIP)."""
+    def handler(attrs, value, sections, i):
+        attrs[key] = state
+    return handler
+
+def attrNextSection(key):
+    """Make a handler for attributes where the value is the following space-separated section."""
+    def handler(attrs, value, sections, i):
+        attrs[key] = sections[i + 1]
+    return handler
+
+# Attribute name prefixes, in order of precedence
+attributePrefixes = [
+    ("PEEK", attrPeak),
+    ("RMS", attrRMS),
+    ("LWRP", attrString("protocol_version")),
+    ("DEVN", attrString("device_name")),
+    ("SYSV", attrString("system_version")),
+    ("NSRC", attrSourceCount),
+    ("NDST", attrString("destination_count")),
+    ("NGPI", attrString("GPI_count")),
+    ("NGPO", attrString("GPO_count")),
+    ("MIX", attrString("matrix_channels")),
+    ("address", attrNextSection("ip_address")),
+    ("netmask", attrNextSection("ip_netmask")),
+    ("gateway", attrNextSection("ip_gateway")),
+    ("hostname", attrNextSection("ip_hostname")),
+    ("ADIP", attrString("advertisment_ipaddress")),
+    ("IPCLK_ADDR", attrString("clock_ipaddress")),
+    ("NIC_IPADDR", attrString("nic_ipaddress")),
+    ("NIC_NAME", attrString("nic_name")),
+    ("PSNM", attrString("name")),
+    ("LWSE", attrBoolean("livestream")),
+    ("LWSA", attrString("livestream_destination")),
+    ("RTPE", attrBoolean("rtp")),
+    ("RTPA", attrString("rtp_destination")),
+    # Unknown attributes
+    ("SHAB", attrString("_SHAB")),
+    ("FASM", attrString("_FASM")),
+    ("BSID", attrString("_BSID")),
+    ("LPID", attrString("_LPID")),
+    ("INGN", attrString("_INGN")),
+    ("ADDR", attrAddress),
+    ("NAME", attrString("name")),
+    ("CLIP", attrFlag("clip", True)),
+    ("NO-CLIP", attrFlag("clip", False)),
+    ("LOW", attrFlag("silence", True)),
+    ("NO-LOW", attrFlag("silence", False)),
+    ("CMD", attrString("command_text")),
+]
+
+# Attribute name -> (offset of the value in the section, handler)
+# Names not listed here are looked up against attributePrefixes the first time they're seen
+attributeHandlers = {
+    "MIXCFG": (7, attrMatrixConfig),
+}
+
+def findAttributeHandler(name):
+    """Find the handler for an attribute name, by matching it against the known prefixes."""
+    for prefix, handlerFunc in attributePrefixes:
+        if name[:len(prefix)] == prefix:
+            return (len(prefix) + 1, handlerFunc)
+
+    # We don't know about this attribute
+    return None
+
+
+class LWRPClientComms(LivewireClientComms):
     """This class handles all the communications with the LWRP server."""
 
-    def __init__(self, host, port):
-        """Create a socket connection to the LWRP server."""
-
-        # The handle for the socket connection to the LWRP server
-        self.sock = None
-
-        # A list of all commands to send to the LWRP server
-        self.sendQueue = []
-
-        # A list of data types to subscribe to (with callbacks)
-        self.dataSubscriptions = []
-
-        # Should we be shutting down this thread? Set via self.stop()
-        self._stop = False
-
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        logger.info("Attempting to connect: " + str(host) + ":" + str(port))
-
-        self.sock.connect((host, port))
-        self.sock.setblocking(0)
-
-        # Start the thread
-        threading.Thread.__init__(self)
-
-    def stop(self):
-        """Attempt to close this thread."""
-        self._stop = True
-
-    def run(self):
-        """Method keeps running forever, and handles all the communication with the open LWRP socket."""
-        while True:
+    protocolName = "LWRP"
+    blockBegin = b"BEGIN"
 
-            # Try and receive data from the LWRP server
-            recvData = self.recvUntilNewline()
+    # Nothing marks the end of a list of channels, so wait for the device to go quiet (if we don't know how many there are)
+    replyIdleTime = 0.2
 
-            if recvData is not None:
-                self.processReceivedData(recvData)
+    def __init__(self, host, port, connectTimeout=None):
+        """Setup the connection, and the storage for meter readings."""
 
-            # Check if we've got data to send back to the LWRP server
-            if len(self.sendQueue) > 0:
-                dataToSend = self.sendQueue[0]
+        # The latest meter levels. MTR messages are stored here, for METER_FRAME subscribers
+        self.meterFrame = LWRPMeterFrame()
 
-                while dataToSend:
-                    logger.info("Sending command: " + str(dataToSend))
-                    sent = self.sock.send(dataToSend)
-                    dataToSend = dataToSend[sent:]
+        LivewireClientComms.__init__(self, host, port, connectTimeout)
 
-                # Once the message has been sent, take it out of the queue
-                self.sendQueue.pop(0)
-
-            if self._stop is True:
-                # End the thread
-                self.sock.close()
-                break
-
-            # Lower this number to receive data quicker
-            if len(self.sendQueue) == 0:
-                time.sleep(0.1)
-
-    def recvUntilNewline(self):
-        """Receive data until we get to the end of a message (also accounts for BEGIN/END blocks)."""
-        totalData = ""
-        inBlock = False
-
-        while True:
+    def replyObject(self, data):
+        """Messages about one channel are matched to requests on the channel number, so the echo of a change can be
+        told apart from a list of channels."""
+        if data['type'] in ("SOURCE", "DESTINATION", "GPI", "GPO"):
             try:
-                totalData += self.sock.recv(1024)
-            except:
-                pass
-
-            # Check if we're in a data block
-            if totalData[:5] == "BEGIN":
-                inBlock = True
-
-            # Check if the datablock is over
-            if "END" in totalData[-5:]:
-                return totalData
-
-            # If we're not in a datablock and a newline is found, return the data
-            if "\n" in totalData and inBlock is False:
-                return totalData
-
-            # We return 'None' if there's no data to return
-            if totalData == "":
+                return str(int(data['num']))
+            except (KeyError, ValueError):
                 return None
 
-    def processReceivedData(self, recvData):
-        """Process the received data from the LWRP server. Attempts to parse it and trigger all the subscribed callbacks."""
-        # A dict with all the different message types we've received
-        messageTypes = {}
-
-        # Parse the data so it's in a usable format
-        # We receive a list in return (one per message - for blocks of data)
-        parsedData = self.parseMessage(recvData)
-
-        # Enumerate over all the messages
-        for dataIndex, data in enumerate(parsedData):
+        return None
 
-            # Check if messageTypes already contains a list for this type.
-            # If not, create one
-            if parsedData[dataIndex]['type'] not in messageTypes:
-                messageTypes[parsedData[dataIndex]['type']] = []
+    def updateBlockState(self, line, inBlock):
+        """Track BEGIN/END blocks, so a block is only processed once it has been fully received."""
+        if line[:5] == b"BEGIN":
+            return True
 
-            # Add this message to the appropriate messageTypes list
-            messageTypes[parsedData[dataIndex]['type']].append(parsedData[dataIndex])
+        elif line[:3] == b"END":
+            return False
 
-        # Loop over every subscription
-        for subI, subX in enumerate(self.dataSubscriptions):
-
-            # If the subscribed command type matches the message's command type
-            if subX['commandType'] in messageTypes:
-
-                # Execute the callback!
-                subX['callback'](messageTypes[subX['commandType']])
-
-            # Check if we need to decrement the limit
-            if self.dataSubscriptions[subI]['limit'] is not False:
-                self.dataSubscriptions[subI]['limit'] = self.dataSubscriptions[subI]['limit'] - 1
-
-            # Check if we need to remove this subscription
-            if self.dataSubscriptions[subI]['limit'] <= 0 and self.dataSubscriptions[subI]['limit'] is not False:
-                self.dataSubscriptions.pop(subI)
-
-    def sendCommand(self, msg):
-        """Buffer a command to send."""
-        self.sendQueue.append(msg + "\n")
-
-    def addSubscription(self, subType, callbackObj, limit=False, filters={}):
-        """Add a subscription to the list of data subscriptions."""
-        self.dataSubscriptions.append({
-            "commandType": subType,
-            "callback": callbackObj,
-            "limit": limit
-        })
+        return inBlock
 
     def splitSegments(self, string):
         """Attempt to parse all the segments provided in return data."""
+        if '"' not in string:
+            # No quoted substrings, so every space ends a segment
+            return string.split(" ")
+
         segments = []
         currentText = ""
-        inSubStr = False
-        string += " "
 
-        for char in string:
+        # Every odd-numbered part sits inside a pair of quotes, so its spaces don't split the segment
+        parts = string.split('"')
 
-            if char == " " and inSubStr is False:
-                # Finish the segment
-                segments.append(currentText)
-                currentText = ""
+        for i, part in enumerate(parts):
+            if i % 2 == 1:
+                currentText += part
+                continue
 
-            else:
-                # Continue the segment
-                if char == '"' and inSubStr is False:
-                    inSubStr = True
+            pieces = part.split(" ")
+            currentText += pieces[0]
 
-                elif char == '"' and inSubStr is True:
-                    inSubStr = False
+            if len(pieces) > 1:
+                # Finish the segment, and any whole segments between the spaces
+                segments.append(currentText)
+                segments.extend(pieces[1:-1])
+                currentText = pieces[-1]
 
-                else:
-                    currentText += char
+        if len(parts) % 2 == 1:
+            # An unterminated quoted substring is discarded, along with the segment it started in
+            segments.append(currentText)
 
         return segments
 
-    def parseMessage(self, data):
-        """Parse the messages and put them into a list of dictionaries."""
+    def parseMessage(self, data, wantedTypes=None):
+        """Parse the messages and put them into a list of dictionaries.
+
+        If wantedTypes is given, messages of any other type are skipped without being parsed.
+        MTR messages are also stored in self.meterFrame, which is returned as a METER_FRAME message for each reading."""
         allData = []
+        wantsFrames = wantedTypes is None or "METER_FRAME" in wantedTypes
+        meterLines = []
 
         for x in data.splitlines():
-            data = {}
-
-            if x[:3] == "VER":
-                segments = self.splitSegments(x[4:])
-                data['type'] = "DEVICE"
-                data["attributes"] = self.parseAttributes(segments)
-
-            elif x[:2] == "IP":
-                segments = self.splitSegments(x[3:])
-                data['type'] = "NETWORK"
-                data["attributes"] = self.parseAttributes(segments)
-
-            elif x[:3] == "SET":
-                segments = self.splitSegments(x[4:])
-                data['type'] = "SET"
-                data["attributes"] = self.parseAttributes(segments)
-
-            elif x[:3] == "SRC":
-                segments = self.splitSegments(x[4:])
-                data['type'] = "SOURCE"
-                data["num"] = segments[0]
-                data["attributes"] = self.parseAttributes(segments[1:])
-
-            elif x[:3] == "DST":
-                segments = self.splitSegments(x[4:])
-                data['type'] = "DESTINATION"
-                data["num"] = segments[0]
-                data["attributes"] = self.parseAttributes(segments[1:])
-
-            elif x[:3] == "MTR":
-                segments = self.splitSegments(x[4:])
-
-                data["type"] = "METER"
-
-                if segments[0] == "ICH":
-                    data["io"] = "in"
-                elif segments[0] == "OCH":
-                    data["io"] = "out"
-                else:
-                    data["io"] = "unknown"
-
-                data["num"] = segments[1]
-                data["attributes"] = self.parseAttributes(segments[2:])
-
-            elif x[:3] == "LVL":
-                segments = self.splitSegments(x[4:])
-
-                data["type"] = "LEVEL_ALERT"
-
-                if segments[0] == "ICH":
-                    data["io"] = "in"
-                elif segments[0] == "OCH":
-                    data["io"] = "out"
-                else:
-                    data["io"] = "unknown"
-
-                data["num"] = segments[1].split(".")[0]
-                data["side"] = segments[1].split(".")[1]
-                data["attributes"] = self.parseAttributes(segments[2:])
-
-            elif x[:3] == "GPI":
-                segments = self.splitSegments(x[4:])
-
-                data["type"] = "GPI"
-                data["num"] = segments[0]
-
-                if "CMD:" in x:
-                    # We have a text command
-                    data["attributes"] = self.parseAttributes(segments[1:])
-                else:
-                    data["pin_states"] = self.parseGPIOStates(segments[1])
-
-            elif x[:3] == "GPO":
-                segments = self.splitSegments(x[4:])
-
-                data["type"] = "GPO"
-                data["num"] = segments[0]
-
-                if "CMD:" in x:
-                    # We have a text command
-                    data["attributes"] = self.parseAttributes(segments[1:])
-                else:
-                    data["pin_states"] = self.parseGPIOStates(segments[1])
-
-            elif x[:3] == "MIX":
-                segments = self.splitSegments(x[4:])
-
-                data["type"] = "MATRIX"
-                data["dst"] = int(segments[0])
-                data["src"] = []
-
-                for point in segments[1:]:
-                    point = point.split(":")
-                    if len(point) >= 2 and point[0] != "" and point[1] != "-":
-                        data["src"].append({
-                            "num": int(point[0]),
-                            "level": int(point[1]),
-                        })
-
-            if x[:5] == "ERROR":
-                data['type'] = "ERROR"
-                data["message"] = x[6:]
-
-            elif x[:5] == "BEGIN":
-                pass
+            verb, _, body = x.partition(" ")
 
-            elif x[:3] == "END":
-                pass
-
-            if data != {}:
-                allData.append(data)
+            if verb == "MTR" and wantsFrames:
+                # These go straight into the frame's arrays, without building a dict for every meter
+                meterLines.append(body)
+
+                if wantedTypes is not None and "METER" not in wantedTypes:
+                    continue
+
+            try:
+                messageType, parser = self.messageParsers[verb]
+            except KeyError:
+                # BEGIN, END and anything else we don't understand
+                continue
+
+            if wantedTypes is not None and messageType not in wantedTypes:
+                continue
+
+            data = parser(self, body)
+            data['type'] = messageType
+            allData.append(data)
+
+        if len(meterLines) > 0:
+            for frame in self.meterFrame.parseLines(meterLines):
+                allData.append({"type": "METER_FRAME", "frame": frame})
 
         return allData
 
+    def parseAttributesMessage(self, body):
+        """Parse a message which only contains attributes (VER, IP & SET)."""
+        return {"attributes": self.parseAttributes(self.splitSegments(body))}
+
+    def parseChannelMessage(self, body):
+        """Parse a message for a numbered channel (SRC & DST)."""
+        segments = self.splitSegments(body)
+
+        return {
+            "num": segments[0],
+            "attributes": self.parseAttributes(segments[1:]),
+        }
+
+    def parseMeterMessage(self, body):
+        """Parse an audio level meter message (MTR)."""
+        segments = self.splitSegments(body)
+
+        return {
+            "io": self.parseIODirection(segments[0]),
+            "num": segments[1],
+            "attributes": self.parseAttributes(segments[2:]),
+        }
+
+    def parseLevelAlertMessage(self, body):
+        """Parse a silence/clipping alert message (LVL)."""
+        segments = self.splitSegments(body)
+        num, side = segments[1].split(".")[:2]
+
+        return {
+            "io": self.parseIODirection(segments[0]),
+            "num": num,
+            "side": side,
+            "attributes": self.parseAttributes(segments[2:]),
+        }
+
+    def parseGPIOMessage(self, body):
+        """Parse a GPI or GPO pin state or text command message."""
+        segments = self.splitSegments(body)
+        data = {"num": segments[0]}
+
+        if "CMD:" in body:
+            # We have a text command
+            data["attributes"] = self.parseAttributes(segments[1:])
+        else:
+            data["pin_states"] = self.parseGPIOStates(segments[1])
+
+        return data
+
+    def parseMatrixMessage(self, body):
+        """Parse a matrix mix point message (MIX)."""
+        segments = self.splitSegments(body)
+        data = {"dst": int(segments[0]), "src": []}
+
+        for point in segments[1:]:
+            point = point.split(":")
+            if len(point) >= 2 and point[0] != "" and point[1] != "-":
+                data["src"].append({
+                    "num": int(point[0]),
+                    "level": int(point[1]),
+                })
+
+        return data
+
+    def parseErrorMessage(self, body):
+        """Parse an error message."""
+        return {"message": body}
+
+    def parseIODirection(self, ioch):
+        """Turn ICH/OCH into 'in' or 'out'."""
+        if ioch == "ICH":
+            return "in"
+        elif ioch == "OCH":
+            return "out"
+        else:
+            return "unknown"
+
+    # Message verb -> (message type, parser)
+    messageParsers = {
+        "VER": ("DEVICE", parseAttributesMessage),
+        "IP": ("NETWORK", parseAttributesMessage),
+        "SET": ("SET", parseAttributesMessage),
+        "SRC": ("SOURCE", parseChannelMessage),
+        "DST": ("DESTINATION", parseChannelMessage),
+        "MTR": ("METER", parseMeterMessage),
+        "LVL": ("LEVEL_ALERT", parseLevelAlertMessage),
+        "GPI": ("GPI", parseGPIOMessage),
+        "GPO": ("GPO", parseGPIOMessage),
+        "MIX": ("MATRIX", parseMatrixMessage),
+        "ERROR": ("ERROR", parseErrorMessage),
+    }
+
     def parseAttributes(self, sections):
         """Parse all known attributes for a command and return in a dictionary."""
         attrs = {}
 
         for i, x in enumerate(sections):
-            if x[:4] == "PEEK":
-                # Peak level meters
-                # TODO: Convert to a proper format
-                attrs["PEAK_L"] = x[5:].split(":")[0]
-                attrs["PEAK_R"] = x[5:].split(":")[1]
-            elif x[:3] == "RMS":
-                # RMS level meters
-                # TODO: Convert to a proper format
-                attrs["RMS_L"] = x[4:].split(":")[0]
-                attrs["RMS_R"] = x[4:].split(":")[1]
-
-            elif x[:4] == "LWRP":
-                attrs["protocol_version"] = x[5:]
-            elif x[:4] == "DEVN":
-                attrs["device_name"] = x[5:]
-            elif x[:4] == "SYSV":
-                attrs["system_version"] = x[5:]
-            elif x[:4] == "NSRC":
-                # only parse source type if available
-                if '/' in x[5:]:
-                    attrs["source_count"] = x[5:].split("/")[0]
-                    attrs["source_type"] = x[5:].split("/")[1]
-                else:
-                    attrs["source_count"] = x[5:]
-                    attrs["source_type"] = ''
-            elif x[:4] == "NDST":
-                attrs["destination_count"] = x[5:]
-            elif x[:4] == "NGPI":
-                attrs["GPI_count"] = x[5:]
-            elif x[:4] == "NGPO":
-                attrs["GPO_count"] = x[5:]
-            elif x == "MIXCFG:1":
-                attrs["matrix_enabled"] = True
-            elif x == "MIXCFG:0":
-                attrs["matrix_enabled"] = False
-            elif x[:3] == "MIX":
-                attrs["matrix_channels"] = x[4:]
-            elif x[:7] == "address":
-                attrs["ip_address"] = sections[i + 1]
-            elif x[:7] == "netmask":
-                attrs["ip_netmask"] = sections[i + 1]
-            elif x[:7] == "gateway":
-                attrs["ip_gateway"] = sections[i + 1]
-            elif x[:8] == "hostname":
-                attrs["ip_hostname"] = sections[i + 1]
-            elif x[:4] == "ADIP":
-                attrs["advertisment_ipaddress"] = x[5:]
-            elif x[:10] == "IPCLK_ADDR":
-                attrs["clock_ipaddress"] = x[11:]
-            elif x[:10] == "NIC_IPADDR":
-                attrs["nic_ipaddress"] = x[11:]
-            elif x[:8] == "NIC_NAME":
-                attrs["nic_name"] = x[9:]
-            elif x[:4] == "PSNM":
-                attrs["name"] = x[5:]
-            elif x[:4] == "LWSE":
-                if x[5:] == "1":
-                    attrs["livestream"] = True
-                else:
-                    attrs["livestream"] = False
-            elif x[:4] == "LWSA":
-                attrs["livestream_destination"] = x[5:]
-            elif x[:4] == "RTPE":
-                if x[5:] == "1":
-                    attrs["rtp"] = True
-                else:
-                    attrs["rtp"] = False
-            elif x[:4] == "RTPA":
-                attrs["rtp_destination"] = x[5:]
-            elif x[:4] == "PSNM":
-                # Unknown attribute
-                attrs["_PSNM"] = x[5:]
-            elif x[:4] == "SHAB":
-                # Unknown attribute
-                attrs["_SHAB"] = x[5:]
-            elif x[:4] == "FASM":
-                # Unknown attribute
-                attrs["_FASM"] = x[5:]
-            elif x[:4] == "BSID":
-                # Unknown attribute
-                attrs["_BSID"] = x[5:]
-            elif x[:4] == "LPID":
-                # Unknown attribute
-                attrs["_LPID"] = x[5:]
-            elif x[:4] == "INGN":
-                # Unknown attribute
-                attrs["_INGN"] = x[5:]
-            elif x[:4] == "ADDR":
-                if x[5:12] == "0.0.0.0" or x[5:] == "":
-                    attrs["address"] = None
-                elif " " in x[5:]:
-                    # Sometimes other data is provides in this field after the actual address
-                    # Discard that extra info and just return the address
-                    attrs['address'] = x[5:].split(" ")[0]
-                else:
-                    attrs["address"] = x[5:]
-            elif x[:4] == "NAME":
-                attrs["name"] = x[5:]
-            elif x[:4] == "CLIP":
-                attrs["clip"] = True
-            elif x[:7] == "NO-CLIP":
-                attrs["clip"] = False
-            elif x[:3] == "LOW":
-                attrs["silence"] = True
-            elif x[:6] == "NO-LOW":
-                attrs["silence"] = False
-            elif x[:3] == "CMD":
-                attrs["command_text"] = x[4:]
+            # The attribute name is everything before the first colon
+            name = x.split(":", 1)[0]
+
+            try:
+                handler = attributeHandlers[name]
+            except KeyError:
+                handler = attributeHandlers[name] = findAttributeHandler(name)
+
+            if handler is not None:
+                valueStart, handlerFunc = handler
+                handlerFunc(attrs, x[valueStart:], sections, i)
 
         return attrs
 
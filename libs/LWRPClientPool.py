@@ -0,0 +1,144 @@
+"""LWRP Client Pool. Keeps connections open to many LWRP devices and queries them all at once."""
+
+import time
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from LWRPClient import LWRPClient
+from LivewireReactor import LivewireReactor
+from LWRPStreamIndex import LWRPStreamIndex
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LWRPClientPool():
+    """Holds an LWRPClient for each host, all running on one shared LivewireReactor thread."""
+
+    def __init__(self, hosts, port=93, password=None, timeout=5):
+        """Connect to every host in parallel. Hosts which can't be connected to are listed in self.failed."""
+
+        # How long to wait for each device to reply to a query
+        self.timeout = timeout
+        self.password = password
+
+        # Host -> LWRPClient for every connected device
+        self.clients = {}
+
+        # Host -> the exception raised when connecting failed
+        self.failed = {}
+
+        self.reactor = LivewireReactor()
+        self.reactor.start()
+
+        self.connect(hosts, port)
+
+    def connect(self, hosts, port=93):
+        """Open connections to any hosts we're not already connected to. Connects are done in parallel."""
+        lock = threading.Lock()
+        threads = []
+
+        def connectHost(host):
+            try:
+                client = LWRPClient(host, port, reactor=self.reactor, connectTimeout=self.timeout)
+            except Exception as e:
+                logger.warning("Unable to connect to " + str(host) + ": " + str(e))
+                with lock:
+                    self.failed[host] = e
+                return
+
+            client.login(self.password)
+
+            with lock:
+                self.clients[host] = client
+                self.failed.pop(host, None)
+
+        for host in hosts:
+            if host in self.clients:
+                continue
+
+            thread = threading.Thread(target=connectHost, args=(host,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        """Close all connections."""
+        for client in self.clients.values():
+            client.stop()
+
+        self.reactor.stop()
+        self.reactor.join(self.timeout)
+        self.clients = {}
+
+    def streamIndex(self, timeout=None):
+        """Index every device's sources and destinations by stream, for finding who's sending or listening to a stream.
+
+        The index is kept current as the devices change."""
+        return LWRPStreamIndex(self, timeout)
+
+    def fanOut(self, method, *args, **kwargs):
+        """Call an LWRPClient query method on every device at once. Returns a dict of host -> data.
+
+        Hosts which don't reply within the timeout return None."""
+        timeout = kwargs.pop("timeout", None)
+        if timeout is None:
+            timeout = self.timeout
+
+        kwargs["wait"] = False
+
+        futures = {}
+        for host, client in self.clients.items():
+            futures[host] = getattr(client, method)(*args, **kwargs)
+
+        # Every device has been asked, so they're all working on it at the same time
+        deadline = time.time() + timeout
+        results = {}
+
+        for host, future in futures.items():
+            results[host] = future.result(max(0, deadline - time.time()))
+
+            if results[host] is None:
+                future.cancel()
+
+        return results
+
+    def deviceData(self, timeout=None):
+        """Get core data about every device."""
+        return self.fanOut("deviceData", timeout=timeout)
+
+    def networkData(self, timeout=None):
+        """Get networking data about every device."""
+        return self.fanOut("networkData", timeout=timeout)
+
+    def sourceData(self, timeout=None):
+        """Get the audio source data from every device."""
+        return self.fanOut("sourceData", timeout=timeout)
+
+    def destinationData(self, timeout=None):
+        """Get the audio destination data from every device."""
+        return self.fanOut("destinationData", timeout=timeout)
+
+    def meterData(self, timeout=None):
+        """Get the audio level meter data from every device."""
+        return self.fanOut("meterData", timeout=timeout)
+
+    def pollMeters(self):
+        """Ask every device for a meter reading, delivered to each client's meterFrameSub() callbacks."""
+        for client in self.clients.values():
+            client.pollMeters()
+
+    def GPIData(self, timeout=None):
+        """Get the GPI state data from every device."""
+        return self.fanOut("GPIData", timeout=timeout)
+
+    def GPOData(self, timeout=None):
+        """Get the GPO state data from every device."""
+        return self.fanOut("GPOData", timeout=timeout)
@@ -0,0 +1,209 @@
+"""LWRP Device State. A local copy of an LWRP device's channels, kept up to date by subscriptions."""
+
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from LivewireFuture import LivewireFuture, whenAll
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LWRPDeviceState():
+    """Holds the sources, destinations, GPIO and matrix of one device, so reading a channel doesn't need a round-trip.
+
+    Each table is downloaded the first time it's read, then kept current by the change messages the device sends.
+    Messages are stored exactly as LWRPClient returns them, and are replaced (never modified) when they change."""
+
+    # Table (message type) -> the message key holding the channel number
+    tables = {
+        "SOURCE": "num",
+        "DESTINATION": "num",
+        "GPI": "num",
+        "GPO": "num",
+        "MATRIX": "dst",
+    }
+
+    def __init__(self, client, timeout=2):
+        """Setup the state for an LWRPClient. Nothing is downloaded until a table is read (or track() is called).
+
+        timeout is how long lookups wait for a change's echo. It's shorter than the lookups' own timeout, so a missing
+        echo delays them rather than making them fail."""
+        self.client = client
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+        # Table -> {channel number: latest message}
+        self.data = {}
+
+        # Table -> a future resolved once the table has been downloaded (or downloaded again, after a refresh)
+        self.loads = {}
+
+        # Table -> futures for changes we've sent but haven't seen the device echo yet (cancelled after the timeout)
+        self.pending = {}
+
+        # Functions to call with (table, channel number, old message, new message) whenever a channel changes
+        self.listeners = []
+
+    def track(self, table):
+        """Start keeping a table up to date, if we aren't already. Returns a future resolved once it's downloaded."""
+        if table not in self.tables:
+            raise ValueError("Unknown table. Use one of: " + ", ".join(sorted(self.tables)))
+
+        with self.lock:
+            if table in self.loads:
+                return self.loads[table]
+
+            self.data[table] = {}
+            self.loads[table] = LivewireFuture()
+            future = self.loads[table]
+
+        self.client.LWRP.addSubscription(table, lambda data: self.update(table, data), False)
+        self.load(table, future)
+
+        return future
+
+    def load(self, table, future):
+        """Download a whole table, then resolve the future."""
+        # Only complete once every channel has arrived (see LWRPClient.tableRequest), so lookups never see half a table.
+        # Sent again after reconnecting, so anything we missed while disconnected is caught up
+        request = self.client.tableRequest(table, replay=True)
+
+        def loaded(request):
+            # Requests are answered before subscriptions, so apply the reply now - readers will be waiting for it
+            data = request.result(0)
+            if data is not None:
+                self.update(table, data)
+
+            future.setResult(True)
+
+        request.addDoneCallback(loaded)
+
+    def refresh(self, table):
+        """Download a table again (e.g. after a change the device doesn't echo). Lookups wait for the new copy."""
+        with self.lock:
+            if table not in self.loads:
+                return
+
+            self.loads[table] = LivewireFuture()
+            future = self.loads[table]
+
+        self.load(table, future)
+
+    def expectChange(self, table, future):
+        """Hold back lookups of a table until a change's echo (the future) arrives, so they read the change.
+
+        If the echo doesn't arrive within the timeout, lookups (including any already waiting) stop waiting for it."""
+        with self.lock:
+            if table not in self.loads:
+                return
+
+        applied = LivewireFuture()
+
+        def echoed(future):
+            data = future.result(0)
+            if data is not None:
+                self.update(table, data)
+
+            applied.setResult(True)
+
+        future.addDoneCallback(echoed)
+        self.client.LWRP.callLater(self.timeout, applied.cancel)
+
+        with self.lock:
+            self.pending.setdefault(table, []).append(applied)
+
+    def update(self, table, messages):
+        """Merge a list of messages into a table, and tell the listeners about every channel which changed."""
+        key = self.tables[table]
+        changes = []
+
+        with self.lock:
+            channels = self.data.get(table)
+            if channels is None:
+                return
+
+            for message in messages:
+                try:
+                    num = int(message[key])
+                except (KeyError, ValueError):
+                    continue
+
+                old = channels.get(num)
+                new = self.mergeMessage(old, message)
+
+                if new != old:
+                    channels[num] = new
+                    changes.append((num, old, new))
+
+            listeners = list(self.listeners)
+
+        for num, old, new in changes:
+            for listener in listeners:
+                try:
+                    listener(table, num, old, new)
+                except Exception:
+                    logger.exception("Error in device state listener")
+
+    def mergeMessage(self, old, message):
+        """Combine a channel's stored message with a new one. Change messages may only include some attributes."""
+        if old is None or "attributes" not in old or "attributes" not in message:
+            return message
+
+        merged = dict(old)
+        merged.update(message)
+        merged['attributes'] = dict(old['attributes'])
+        merged['attributes'].update(message['attributes'])
+
+        return merged
+
+    def ready(self, table):
+        """Returns a future resolved once a table is downloaded, and every change sent so far has been echoed."""
+        self.track(table)
+
+        with self.lock:
+            self.pending[table] = [future for future in self.pending.get(table, []) if not future.done()]
+            waits = [self.loads[table]] + self.pending[table]
+
+        return whenAll(waits)
+
+    def lookup(self, table, num):
+        """Returns a future resolved with one channel's message (or None if the device doesn't have that channel)."""
+        future = LivewireFuture()
+        self.ready(table).addDoneCallback(lambda _: future.setResult(self.get(table, num)))
+        return future
+
+    def channels(self, table):
+        """Returns a future resolved with a list of every channel's message, in channel order."""
+        future = LivewireFuture()
+        self.ready(table).addDoneCallback(lambda _: future.setResult(self.getAll(table)))
+        return future
+
+    def get(self, table, num):
+        """Get one channel's message straight from the local copy, without waiting for anything."""
+        with self.lock:
+            return self.data.get(table, {}).get(int(num))
+
+    def getAll(self, table):
+        """Get every channel's message straight from the local copy, in channel order."""
+        with self.lock:
+            channels = self.data.get(table, {})
+            return [channels[num] for num in sorted(channels)]
+
+    def addListener(self, callback):
+        """Call callback(table, channel number, old message, new message) whenever a tracked channel changes.
+
+        The old message is None the first time a channel is seen. Callbacks run on the connection's thread."""
+        with self.lock:
+            self.listeners.append(callback)
+
+        return callback
+
+    def removeListener(self, callback):
+        """Stop calling a listener added with addListener()."""
+        with self.lock:
+            self.listeners = [listener for listener in self.listeners if listener is not callback]
@@ -0,0 +1,208 @@
+"""LWRP Level Detector. Silence and clipping detection worked out locally from meter readings, instead of on the device."""
+
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from LWRPMeterFrame import METER_FLOOR
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LWRPLevelDetector():
+    """Checks every channel of each meter reading against silence and clipping thresholds, all at once.
+
+    Feed it with client.meterFrameSub(detector.processFrame). Alerts are delivered to levelAlertSub() callbacks as
+    lists of messages shaped like the device's own LEVEL_ALERT messages (see LWRPClient.levelAlertSub()).
+    Thresholds are in tenths of a dB like the meter levels, and changing them doesn't involve the device at all."""
+
+    # Which meter each check looks at
+    silenceMeter = "peak"
+    clipMeter = "peak"
+
+    def __init__(self):
+        """Setup the detector, with no thresholds set."""
+        if numpy is None:
+            raise ImportError("LWRPLevelDetector needs NumPy. Install it with: pip install numpy")
+
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+        # Check ("silence" or "clip") -> direction -> dict of arrays, one item for each side of each channel
+        self.checks = {}
+
+        # Check -> direction -> the (threshold, time) given for every channel, which new channels start with
+        self.defaults = {}
+
+        for check in ("silence", "clip"):
+            self.checks[check] = {}
+            self.defaults[check] = {"in": None, "out": None}
+
+            for io in ("in", "out"):
+                self.checks[check][io] = {
+                    # Is there a threshold set? The threshold level, and how long it has to be crossed for
+                    "enabled": numpy.zeros(0, bool),
+                    "level": numpy.zeros(0, numpy.int16),
+                    "time": numpy.zeros(0),
+
+                    # When the threshold was first crossed (NaN if it isn't now), and are we alerting?
+                    "since": numpy.zeros(0),
+                    "active": numpy.zeros(0, bool),
+                }
+
+    def levelAlertSub(self, callback):
+        """Subscribe to the alerts, which start and end like the device's (e.g. {"attributes": {"silence": True}})."""
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def setSilenceThreshold(self, io, chnum, threshold, timems):
+        """Alert when a channel stays below a level for a time. chnum can be a list, or None for every channel.
+
+        A threshold of None removes it."""
+        self.setThreshold("silence", io, chnum, threshold, timems)
+
+    def setClippingThreshold(self, io, chnum, threshold, timems):
+        """Alert when a channel stays above a level for a time. chnum can be a list, or None for every channel.
+
+        A threshold of None removes it."""
+        self.setThreshold("clip", io, chnum, threshold, timems)
+
+    def setThreshold(self, check, io, chnum, threshold, timems):
+        """Set a threshold for one check on some channels."""
+        if io not in ("in", "out"):
+            raise ValueError("IO Direction set incorrectly. Use 'in' or 'out'.")
+
+        with self.lock:
+            state = self.checks[check][io]
+
+            if chnum is None:
+                indexes = slice(None)
+
+                if threshold is None:
+                    self.defaults[check][io] = None
+                else:
+                    self.defaults[check][io] = (int(threshold), int(timems) / 1000.0)
+            else:
+                if not isinstance(chnum, (list, tuple)):
+                    chnum = [chnum]
+
+                chnums = numpy.array([int(x) for x in chnum])
+
+                if len(chnums) > 0 and chnums.min() < 1:
+                    raise ValueError("Channel numbers start at 1")
+
+                if len(chnums) > 0:
+                    self.grow(io, chnums.max())
+
+                # Both sides of each channel
+                indexes = numpy.concatenate([(chnums - 1) * 2, (chnums - 1) * 2 + 1])
+
+            if threshold is None:
+                state['enabled'][indexes] = False
+            else:
+                state['enabled'][indexes] = True
+                state['level'][indexes] = int(threshold)
+                state['time'][indexes] = int(timems) / 1000.0
+
+            # Start timing again with the new threshold
+            state['since'][indexes] = numpy.nan
+
+    def grow(self, io, channels):
+        """Make room for at least this many channels in one direction."""
+        for check in self.checks:
+            state = self.checks[check][io]
+            missing = channels * 2 - len(state['enabled'])
+
+            if missing <= 0:
+                continue
+
+            # New channels get any threshold which was set for every channel
+            if self.defaults[check][io] is None:
+                enabled, level, time = False, 0, 0
+            else:
+                enabled = True
+                level, time = self.defaults[check][io]
+
+            state['enabled'] = numpy.concatenate([state['enabled'], numpy.full(missing, enabled, bool)])
+            state['level'] = numpy.concatenate([state['level'], numpy.full(missing, level, numpy.int16)])
+            state['time'] = numpy.concatenate([state['time'], numpy.full(missing, time)])
+            state['since'] = numpy.concatenate([state['since'], numpy.full(missing, numpy.nan)])
+            state['active'] = numpy.concatenate([state['active'], numpy.zeros(missing, bool)])
+
+    def processFrame(self, frame):
+        """Check a meter reading (an LWRPMeterFrame) against every threshold, and send out any alerts."""
+        alerts = []
+
+        with self.lock:
+            for io in ("in", "out"):
+                for check, meter in (("silence", self.silenceMeter), ("clip", self.clipMeter)):
+                    levels = numpy.frombuffer(getattr(frame, meter)[io], numpy.int16)
+                    alerts.extend(self.check(check, io, levels, frame.timestamp))
+
+            callbacks = list(self.callbacks)
+
+        if len(alerts) == 0:
+            return
+
+        for callback in callbacks:
+            try:
+                callback(alerts)
+            except Exception:
+                logger.exception("Error in level alert callback")
+
+    def check(self, check, io, levels, timestamp):
+        """Update one check's timers from a reading's levels. Returns the alerts which start or end."""
+        self.grow(io, len(levels) // 2)
+        state = self.checks[check][io]
+
+        # Sides without a reading (or beyond the end of this one) never cross a threshold
+        crossing = numpy.zeros(len(state['enabled']), bool)
+        enabled = state['enabled'][:len(levels)]
+
+        if check == "silence":
+            crossing[:len(levels)] = enabled & (levels < state['level'][:len(levels)]) & (levels != METER_FLOOR)
+        else:
+            crossing[:len(levels)] = enabled & (levels > state['level'][:len(levels)])
+
+        since = state['since']
+        since[crossing & numpy.isnan(since)] = timestamp
+        since[~crossing] = numpy.nan
+
+        with numpy.errstate(invalid="ignore"):
+            started = crossing & ~state['active'] & (timestamp - since >= state['time'])
+
+        ended = state['active'] & ~crossing
+        state['active'] = (state['active'] | started) & ~ended
+
+        alerts = []
+        for index in numpy.flatnonzero(started | ended):
+            alerts.append({
+                "type": "LEVEL_ALERT",
+                "io": io,
+                "num": str(index // 2 + 1),
+                "side": "L" if index % 2 == 0 else "R",
+                "attributes": {check: bool(started[index])},
+            })
+
+        return alerts
+
+    def activeAlerts(self):
+        """Get the alerts which have started and not yet ended, as (check, io, channel number, side)."""
+        active = []
+
+        with self.lock:
+            for check in sorted(self.checks):
+                for io in ("in", "out"):
+                    for index in numpy.flatnonzero(self.checks[check][io]['active']):
+                        active.append((check, io, index // 2 + 1, "L" if index % 2 == 0 else "R"))
+
+        return active
@@ -0,0 +1,265 @@
+"""LWRP Meter Frame. The audio levels of every channel on a device, stored as numbers in preallocated arrays."""
+
+import time
+import json
+from array import array
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+# LWRP sends meter levels in tenths of a dB
+METER_SCALE = 10
+
+# The level stored for channels we haven't had a reading for yet
+METER_FLOOR = -32768
+
+# MTR direction -> the key used for it, as in the "io" of parsed messages
+meterDirections = {
+    "ICH": "in",
+    "OCH": "out",
+}
+
+
+class LWRPMeterFrame():
+    """The latest peak and RMS levels of every input and output channel on a device.
+
+    peak and rms are dicts of "in"/"out" -> array('h') of levels in tenths of a dBFS. The left and right levels of
+    channel n are at index 2 * (n - 1) and 2 * (n - 1) + 1. The arrays are updated in place by each MTR reply, so
+    use copy() to keep a reading that won't change."""
+
+    def __init__(self, channels=0, readingSize=None):
+        """Setup storage for a number of channels in each direction. It grows if the device has more.
+
+        readingSize is the number of meters in a reading (inputs + outputs), or a function returning it (None if it
+        isn't known yet). Without it, a reading ends when a channel repeats or at the end of the lines received together."""
+        self.peak = {"in": array('h'), "out": array('h')}
+        self.rms = {"in": array('h'), "out": array('h')}
+        self.readingSize = readingSize
+
+        # When the last reading arrived, and how many readings there have been
+        self.timestamp = None
+        self.sequence = 0
+
+        # The channels (and how many meters) stored so far for the reading in progress
+        self.startReading()
+
+        for io in ("in", "out"):
+            self.grow(io, channels)
+
+    def grow(self, io, channels):
+        """Make room for at least this many channels in one direction."""
+        missing = channels * 2 - len(self.peak[io])
+
+        if missing > 0:
+            self.peak[io].extend(array('h', [METER_FLOOR]) * missing)
+            self.rms[io].extend(array('h', [METER_FLOOR]) * missing)
+
+    def channels(self, io):
+        """The number of channels stored for a direction."""
+        return len(self.peak[io]) // 2
+
+    def parseLines(self, bodies):
+        """Store the levels from the bodies of MTR messages (e.g. 'ICH 1 PEEK:-200:-210 RMS:-300:-310').
+
+        Returns a list of frames - one for each reading completed. When the reading size is known, a reading is complete
+        once that many meters have arrived, even if they were split across several calls. Otherwise, the bodies received
+        together are one reading, unless a channel repeats - then another reading has started. When there are several
+        readings, all but the last are copies, and this frame holds the last one."""
+        # 'ICH 1 PEEK:-200:-210 RMS:-300:-310' -> ['ICH', '1', 'PEEK', '-200', '-210', 'RMS', '-300', '-310']
+        sections = " ".join(bodies).replace(":", " ").split(" ")
+        count = len(bodies)
+        frames = []
+
+        readingSize = self.readingSize
+        if callable(readingSize):
+            readingSize = readingSize()
+
+        if len(sections) == count * 8 and sections[2::8].count("PEEK") == count and sections[5::8].count("RMS") == count:
+            # Every message has the usual layout, so they can all be converted at once
+            try:
+                self.storeAll(sections, count, frames, readingSize)
+                return frames
+            except (KeyError, ValueError, TypeError, OverflowError):
+                pass
+
+        self.storeEach(bodies, frames, readingSize)
+        return frames
+
+    def startReading(self):
+        """Start counting the channels for a new reading."""
+        self.seen = {"in": set(), "out": set()}
+        self.received = 0
+
+    def beforeStore(self, io, chnums, frames, readingSize, now):
+        """Called before storing the levels for some channels, to find where one reading ends and the next starts."""
+        if len(frames) > 0 and frames[-1] is self:
+            # These levels will overwrite the reading we've just finished, so keep a copy of it
+            frames[-1] = self.copy()
+
+        # A channel we already have is the start of another reading. So are inputs after outputs, as the device sends the
+        # inputs first - we only look for that when we know the size, as the first reading we're given can be a partial one
+        restart = not self.seen[io].isdisjoint(chnums)
+
+        if readingSize is not None and io == "in" and len(self.seen["out"]) > 0:
+            restart = True
+
+        if restart:
+            # If we know the size, the last reading was cut short, so it's dropped. Otherwise, keep the one we've finished
+            if readingSize is None:
+                self.finishReading(now)
+                frames.append(self.copy())
+
+            self.startReading()
+
+        self.seen[io].update(chnums)
+
+    def afterStore(self, count, frames, readingSize, now):
+        """Called after storing the levels for some channels. Finishes the reading once every meter has arrived."""
+        self.received += count
+
+        if readingSize is not None and self.received >= readingSize:
+            self.finishReading(now)
+            frames.append(self)
+            self.startReading()
+
+    def storeAll(self, sections, count, frames, readingSize):
+        """Store the sections of messages which all have the usual layout, a run of consecutive channels at a time."""
+        directions = [meterDirections[ioch] for ioch in sections[0::8]]
+
+        # JSON's C decoder turns them all into numbers much faster than int() on each one
+        numbers = json.loads("[" + ",".join(sections[1::8] + sections[3::8] + sections[4::8] + sections[6::8] + sections[7::8]) + "]")
+        chnums = numbers[:count]
+
+        # Left & right peak, then left & right RMS
+        levels = [numbers[count * i:count * (i + 1)] for i in range(1, 5)]
+
+        if min(chnums) < 1 or not all(isinstance(chnum, int) for chnum in chnums):
+            raise ValueError("Invalid channel number")
+
+        now = time.time()
+        runStart = 0
+
+        for i in range(1, count + 1):
+            if i < count and directions[i] == directions[i - 1] and chnums[i] == chnums[i - 1] + 1:
+                # Runs also end with a reading, so the next one can be told apart
+                if readingSize is None or self.received + i - runStart < readingSize:
+                    continue
+
+            io = directions[runStart]
+            run = chnums[runStart:i]
+
+            self.beforeStore(io, run, frames, readingSize, now)
+            self.storeRun(io, chnums[runStart], [channelLevels[runStart:i] for channelLevels in levels])
+            self.afterStore(len(run), frames, readingSize, now)
+            runStart = i
+
+        self.finishUnsized(frames, readingSize, now)
+
+    def storeRun(self, io, chnum, levels):
+        """Store the (left peak, right peak, left RMS, right RMS) lists for consecutive channels, starting at chnum."""
+        index = (chnum - 1) * 2
+        end = index + len(levels[0]) * 2
+
+        if end > len(self.peak[io]):
+            self.grow(io, end // 2)
+
+        for levelArray, left, right in ((self.peak[io], levels[0], levels[1]), (self.rms[io], levels[2], levels[3])):
+            pairs = [0] * (end - index)
+            pairs[0::2] = left
+            pairs[1::2] = right
+            levelArray[index:end] = array('h', pairs)
+
+    def storeEach(self, bodies, frames, readingSize):
+        """Store MTR message bodies one at a time - for messages without the usual layout."""
+        now = time.time()
+
+        for body in bodies:
+            # 'ICH 1 PEEK:-200:-210 RMS:-300:-310' -> ['ICH', '1', 'PEEK', '-200', '-210', 'RMS', '-300', '-310']
+            sections = body.replace(":", " ").split(" ")
+
+            try:
+                io = meterDirections[sections[0]]
+                chnum = int(sections[1])
+            except (KeyError, IndexError, ValueError):
+                continue
+
+            if chnum < 1:
+                continue
+
+            self.beforeStore(io, (chnum,), frames, readingSize, now)
+            self.storeMeter(io, chnum, sections)
+            self.afterStore(1, frames, readingSize, now)
+
+        self.finishUnsized(frames, readingSize, now)
+
+    def storeMeter(self, io, chnum, sections):
+        """Store the levels from the sections of one MTR message."""
+        index = (chnum - 1) * 2
+        peak = self.peak[io]
+
+        if index + 2 > len(peak):
+            self.grow(io, chnum)
+            peak = self.peak[io]
+
+        try:
+            if len(sections) == 8 and sections[2] == "PEEK" and sections[5] == "RMS":
+                # The usual layout, without searching for each meter
+                rms = self.rms[io]
+                peak[index] = int(sections[3])
+                peak[index + 1] = int(sections[4])
+                rms[index] = int(sections[6])
+                rms[index + 1] = int(sections[7])
+                return
+
+            for i in range(2, len(sections) - 2, 3):
+                if sections[i] == "PEEK":
+                    levelArray = peak
+                elif sections[i] == "RMS":
+                    levelArray = self.rms[io]
+                else:
+                    continue
+
+                levelArray[index] = int(sections[i + 1])
+                levelArray[index + 1] = int(sections[i + 2])
+
+        except (ValueError, OverflowError):
+            pass
+
+    def finishUnsized(self, frames, readingSize, now):
+        """Without a reading size, the meters received together are a reading."""
+        if readingSize is None and self.received > 0:
+            self.finishReading(now)
+            frames.append(self)
+            self.startReading()
+
+    def finishReading(self, timestamp):
+        """Mark the levels stored so far as a complete reading."""
+        self.timestamp = timestamp
+        self.sequence += 1
+
+    def level(self, io, chnum, meter="peak"):
+        """Get one channel's (left, right) level in dBFS. Returns None for channels we haven't had a reading for."""
+        levels = self.peak[io] if meter == "peak" else self.rms[io]
+        index = (int(chnum) - 1) * 2
+
+        if index < 0 or index + 2 > len(levels) or levels[index] == METER_FLOOR:
+            return None
+
+        return (float(levels[index]) / METER_SCALE, float(levels[index + 1]) / METER_SCALE)
+
+    def copy(self):
+        """Get a copy of this frame which won't be changed by later readings."""
+        frame = LWRPMeterFrame()
+
+        for io in ("in", "out"):
+            frame.peak[io] = array('h', self.peak[io])
+            frame.rms[io] = array('h', self.rms[io])
+
+        frame.timestamp = self.timestamp
+        frame.sequence = self.sequence
+
+        return frame
@@ -0,0 +1,151 @@
+"""LWRP Meter History. A ring buffer of meter readings, with statistics worked out over every channel at once."""
+
+import threading
+import warnings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from LWRPMeterFrame import METER_SCALE, METER_FLOOR
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LWRPMeterHistory():
+    """Keeps the last few hundred meter readings from one device, for level statistics and dead-air detection.
+
+    Feed it with client.meterFrameSub(history.add). Readings are stored in NumPy arrays of samples x (channels * 2),
+    in tenths of a dB like LWRPMeterFrame. Queries return arrays of (channels, 2) - left and right - in dBFS,
+    with NaN for channels which had no reading. Time windows are measured back from the newest reading."""
+
+    def __init__(self, samples=600, channels=0):
+        """Setup storage for a number of readings. It's widened if a reading has more channels than given here."""
+        if numpy is None:
+            raise ImportError("LWRPMeterHistory needs NumPy. Install it with: pip install numpy")
+
+        self.samples = samples
+        self.lock = threading.Lock()
+
+        # Direction -> samples x (channels * 2) levels
+        self.peak = {}
+        self.rms = {}
+
+        # When each reading arrived, and how many readings have been added in total
+        self.timestamps = numpy.zeros(samples)
+        self.count = 0
+
+        for io in ("in", "out"):
+            self.peak[io] = numpy.full((samples, channels * 2), METER_FLOOR, numpy.int16)
+            self.rms[io] = numpy.full((samples, channels * 2), METER_FLOOR, numpy.int16)
+
+    def add(self, frame):
+        """Store a reading from an LWRPMeterFrame."""
+        with self.lock:
+            row = self.count % self.samples
+
+            for io in ("in", "out"):
+                for history, levels in ((self.peak, frame.peak[io]), (self.rms, frame.rms[io])):
+                    levels = numpy.frombuffer(levels, numpy.int16)
+
+                    if len(levels) > history[io].shape[1]:
+                        self.widen(history, io, len(levels))
+
+                    history[io][row, :len(levels)] = levels
+
+            self.timestamps[row] = frame.timestamp
+            self.count += 1
+
+    def widen(self, history, io, width):
+        """Make room for more channels, keeping the readings stored so far."""
+        wider = numpy.full((self.samples, width), METER_FLOOR, numpy.int16)
+        wider[:, :history[io].shape[1]] = history[io]
+        history[io] = wider
+
+    def window(self, seconds=None, samples=None):
+        """Get the rows of the readings within a window (the last few seconds, or last few samples), oldest first."""
+        stored = min(self.count, self.samples)
+        rows = numpy.arange(self.count - stored, self.count) % self.samples
+
+        if samples is not None:
+            rows = rows[-samples:]
+
+        if seconds is not None and len(rows) > 0:
+            times = self.timestamps[rows]
+            rows = rows[numpy.searchsorted(times, times[-1] - seconds):]
+
+        return rows
+
+    def levels(self, io, meter="peak", seconds=None, samples=None):
+        """Get the readings within a window as a samples x channels x 2 array of dBFS (NaN where there's no reading)."""
+        history = self.peak if meter == "peak" else self.rms
+
+        with self.lock:
+            rows = self.window(seconds, samples)
+            data = history[io][rows]
+
+        levels = data.astype(numpy.float32) / METER_SCALE
+        levels[data == METER_FLOOR] = numpy.nan
+
+        return levels.reshape(len(rows), -1, 2)
+
+    def minimum(self, io, meter="peak", seconds=None, samples=None):
+        """The lowest level of each channel within a window."""
+        return self.reduce(numpy.nanmin, io, meter, seconds, samples)
+
+    def maximum(self, io, meter="peak", seconds=None, samples=None):
+        """The highest level of each channel within a window."""
+        return self.reduce(numpy.nanmax, io, meter, seconds, samples)
+
+    def mean(self, io, meter="rms", seconds=None, samples=None):
+        """The average of each channel's dB levels within a window."""
+        return self.reduce(numpy.nanmean, io, meter, seconds, samples)
+
+    def percentile(self, io, percent, meter="rms", seconds=None, samples=None):
+        """The level each channel is below for a percentage of the window (e.g. 95 for a near-peak level)."""
+        return self.reduce(lambda levels, axis: numpy.nanpercentile(levels, percent, axis=axis), io, meter, seconds, samples)
+
+    def reduce(self, function, io, meter, seconds, samples):
+        """Apply a NaN-ignoring NumPy reduction across the readings in a window."""
+        levels = self.levels(io, meter, seconds, samples)
+
+        if len(levels) == 0:
+            return numpy.full(levels.shape[1:], numpy.nan)
+
+        # Channels with no readings at all give NaN, which is what we want - so don't warn about them
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return function(levels, axis=0)
+
+    def belowFor(self, io, threshold, seconds, meter="rms"):
+        """Get the channel numbers whose left and right levels have both stayed below a threshold (dBFS) for a time.
+
+        Channels are only listed once we have readings covering the whole time."""
+        return self.heldFor(io, seconds, meter, lambda levels: levels < threshold)
+
+    def aboveFor(self, io, threshold, seconds, meter="peak"):
+        """Get the channel numbers whose left or right level has stayed above a threshold (dBFS) for a time."""
+        return self.heldFor(io, seconds, meter, lambda levels: (levels > threshold).any(axis=2))
+
+    def heldFor(self, io, seconds, meter, condition):
+        """Get the channel numbers where condition(levels) has been true for every reading in the last few seconds."""
+        with self.lock:
+            stored = self.window()
+
+            if len(stored) == 0 or self.timestamps[stored[-1]] - self.timestamps[stored[0]] < seconds:
+                # We haven't been listening for long enough
+                return []
+
+        levels = self.levels(io, meter, seconds)
+        held = condition(levels)
+
+        if held.ndim == 3:
+            # A condition on each side - both sides have to meet it
+            held = held.all(axis=2)
+
+        return (numpy.flatnonzero(held.all(axis=0)) + 1).tolist()
@@ -0,0 +1,168 @@
+"""LWRP Salvo. Named sets of routing changes, applied across many LWRP devices at once."""
+
+import time
+import json
+import logging
+logger = logging.getLogger(__name__)
+
+from LWRPClient import validateRouting
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+def loadSalvos(filename, names=None):
+    """Read a JSON file of salvos. Returns a dict of salvo name -> LWRPSalvo (only for the given names, if any).
+
+    The file looks like: {"Salvo Name": {"host": [{"type": "DST", "channel": 1, "stream": 101}, ...]}}
+    Each change has a type of DST or SRC (with a 'stream' number or an 'address'), or GPO or GPI (with a 'pin' and 'state')."""
+    with open(filename, "rb") as salvoFile:
+        data = json.load(salvoFile)
+
+    salvos = {}
+    for name in data:
+        if names is None or name in names:
+            salvos[name] = LWRPSalvo(name, data[name])
+
+    return salvos
+
+
+class LWRPSalvo():
+    """A named set of changes for one or more devices. Every change is checked before anything is sent."""
+
+    def __init__(self, name, changes, streamFormat="standard"):
+        """Setup the salvo from a dict of host -> list of changes. Raises a ValueError if any change is invalid."""
+        self.name = name
+
+        # Host -> ({dst channel: address}, {src channel: address}, [(type, channel, pin, state)])
+        self.changes = {}
+
+        errors = []
+        for host in changes:
+            try:
+                self.changes[host] = self.parseChanges(changes[host], streamFormat)
+            except ValueError as e:
+                errors.append(str(host) + ": " + str(e))
+
+        if len(errors) > 0:
+            raise ValueError("Invalid salvo '" + str(name) + "': " + "; ".join(errors))
+
+    def parseChanges(self, changes, streamFormat):
+        """Validate one host's list of changes, and split them into routing and GPIO changes."""
+        destinations = {}
+        sources = {}
+        gpio = []
+        errors = []
+
+        for change in changes:
+            changeType = str(change.get("type", "")).upper()
+
+            if changeType in ("DST", "SRC"):
+                if "stream" in change:
+                    target = change["stream"]
+                else:
+                    target = change.get("address")
+
+                if changeType == "DST":
+                    destinations[change.get("channel")] = target
+                else:
+                    sources[change.get("channel")] = target
+
+            elif changeType in ("GPO", "GPI"):
+                try:
+                    channel = int(change.get("channel"))
+                    pin = int(change.get("pin"))
+                except (ValueError, TypeError):
+                    errors.append(changeType + " needs a channel and pin number")
+                    continue
+
+                state = str(change.get("state", "")).lower()
+
+                if not 1 <= pin <= 5 or state not in ("high", "low"):
+                    errors.append(changeType + " " + str(channel) + " needs a pin from 1-5 and a state of high or low")
+                    continue
+
+                gpio.append((changeType, channel, pin, state))
+
+            else:
+                errors.append("Unknown change type: " + str(change.get("type")))
+
+        # Convert the stream numbers to addresses now, so a mistake is found before anything is sent
+        try:
+            routes = validateRouting(destinations, sources, streamFormat)
+        except ValueError as e:
+            errors.append(str(e))
+
+        if len(errors) > 0:
+            raise ValueError("; ".join(errors))
+
+        destinations = dict((chnum, address) for (routeType, chnum), address in routes.items() if routeType == "DST")
+        sources = dict((chnum, address) for (routeType, chnum), address in routes.items() if routeType == "SRC")
+
+        return destinations, sources, gpio
+
+    def hosts(self):
+        """All the hosts this salvo changes."""
+        return list(self.changes)
+
+    def execute(self, pool, timeout=5):
+        """Apply the salvo to every host at once, using an LWRPClientPool already connected to them.
+
+        Returns a dict of host -> {"latency": seconds until every change was confirmed (or None), "failed": [changes
+        not confirmed], "error": why the host couldn't be used (or None)}. GPIO changes aren't echoed, so can't fail."""
+        results = {}
+        futures = {}
+
+        # Host -> when every one of its changes was confirmed
+        finishTimes = {}
+
+        startTime = time.time()
+
+        for host in self.changes:
+            destinations, sources, gpio = self.changes[host]
+
+            if host not in pool.clients:
+                results[host] = {"latency": None, "failed": [], "error": str(pool.failed.get(host, "Not connected"))}
+                continue
+
+            client = pool.clients[host]
+
+            for changeType, channel, pin, state in gpio:
+                if changeType == "GPO":
+                    client.setGPO(channel, pin, state)
+                else:
+                    client.setGPI(channel, pin, state)
+
+            future = client.applyRouting(destinations, sources, wait=False, timeout=timeout)
+            futures[host] = future
+            results[host] = {"latency": None, "failed": [], "error": None}
+
+            def finished(future, host=host):
+                if future.cancelled is False:
+                    finishTimes[host] = time.time()
+
+            future.addDoneCallback(finished)
+
+        # Every host is working on its changes at the same time - wait for them all against one deadline
+        deadline = startTime + timeout
+
+        for host, future in futures.items():
+            confirmed = future.result(max(0, deadline - time.time()))
+
+            if confirmed is None:
+                # Timed out - stop listening, and see which changes did get confirmed
+                future.cancel()
+                confirmed = dict(future.confirmed)
+
+            results[host]["failed"] = sorted(routeType + " " + str(chnum) for (routeType, chnum), ok in confirmed.items() if ok is False)
+
+            if len(results[host]["failed"]) == 0:
+                # The done callback may not have run yet, if the future has only just been resolved
+                results[host]["latency"] = finishTimes.get(host, time.time()) - startTime
+
+            logger.info("Salvo '" + str(self.name) + "' on " + str(host) + ": " + str(len(results[host]["failed"])) + " failed")
+
+        return results
@@ -0,0 +1,162 @@
+"""LWRP Stream Index. Finds which devices are sending and receiving each Livewire stream, across a whole plant."""
+
+import time
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+import AxiaLivewireAddressHelper
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+def channelAddress(table, message):
+    """The stream address a source sends to or a destination receives from. Returns None if there isn't one."""
+    if message is None:
+        return None
+
+    attributes = message.get('attributes', {})
+
+    if table == "SOURCE":
+        if attributes.get('rtp') is False:
+            # This source isn't transmitting
+            return None
+
+        address = attributes.get('rtp_destination')
+    else:
+        address = attributes.get('address')
+
+    if not address:
+        return None
+
+    # Some firmware versions include the port number in the address
+    address = address.split(":")[0]
+
+    if address == "0.0.0.0":
+        return None
+
+    return address
+
+
+class LWRPStreamIndex():
+    """Indexes the sources and destinations of every device in an LWRPClientPool by their stream address.
+
+    Built from each device's LWRPDeviceState, and kept current by its change listeners."""
+
+    def __init__(self, pool, timeout=None):
+        """Download the sources and destinations of every device in the pool (in parallel), and index them."""
+        self.pool = pool
+        self.lock = threading.Lock()
+
+        # Stream address -> set of (host, channel number)
+        self.sources = {}
+        self.destinations = {}
+
+        # Host -> the listener added to its device state
+        self.hosts = {}
+
+        self.build(timeout)
+
+    def build(self, timeout=None):
+        """Index any devices in the pool which aren't indexed yet (e.g. after LWRPClientPool.connect()).
+
+        Devices which don't reply within the timeout are indexed as soon as they do."""
+        if timeout is None:
+            timeout = self.pool.timeout
+
+        futures = []
+
+        for host, client in self.pool.clients.items():
+            if host in self.hosts:
+                continue
+
+            self.hosts[host] = self.makeListener(host)
+            client.state.addListener(self.hosts[host])
+
+            for table in ("SOURCE", "DESTINATION"):
+                futures.append((host, client.state.track(table)))
+
+                # Anything downloaded before we started listening
+                for message in client.state.getAll(table):
+                    self.update(host, table, int(message['num']), None, message)
+
+        # Every device has been asked, so they're all downloading at the same time
+        deadline = time.time() + timeout
+
+        for host, future in futures:
+            if future.result(max(0, deadline - time.time())) is None:
+                logger.warning("Timed out downloading the stream index from " + str(host))
+
+    def makeListener(self, host):
+        """Make a device state listener which updates the index for one host."""
+        def listener(table, num, old, new):
+            self.update(host, table, num, old, new)
+
+        return listener
+
+    def update(self, host, table, num, old, new):
+        """Move a channel from its old stream address to its new one."""
+        if table == "SOURCE":
+            index = self.sources
+        elif table == "DESTINATION":
+            index = self.destinations
+        else:
+            return
+
+        oldAddress = channelAddress(table, old)
+        newAddress = channelAddress(table, new)
+
+        with self.lock:
+            if oldAddress is not None and oldAddress in index:
+                index[oldAddress].discard((host, num))
+
+                if len(index[oldAddress]) == 0:
+                    del index[oldAddress]
+
+            if newAddress is not None:
+                index.setdefault(newAddress, set()).add((host, num))
+
+    def stop(self):
+        """Stop updating the index."""
+        for host, listener in self.hosts.items():
+            if host in self.pool.clients:
+                self.pool.clients[host].state.removeListener(listener)
+
+        self.hosts = {}
+
+    def streamAddress(self, stream, streamFormat="standard"):
+        """Turn a Livewire stream number (or a multicast address) into the address used as the index key."""
+        stream = str(stream).strip()
+
+        if stream.isdigit():
+            return AxiaLivewireAddressHelper.streamNumToMulticastAddr(int(stream), streamFormat)
+
+        return stream
+
+    def sourcesOf(self, stream, streamFormat="standard"):
+        """Get the (host, source channel number) of everything sending a stream. Usually there's only one."""
+        address = self.streamAddress(stream, streamFormat)
+
+        with self.lock:
+            return sorted(self.sources.get(address, []))
+
+    def destinationsOf(self, stream, streamFormat="standard"):
+        """Get the (host, destination channel number) of everything listening to a stream."""
+        address = self.streamAddress(stream, streamFormat)
+
+        with self.lock:
+            return sorted(self.destinations.get(address, []))
+
+    def streams(self):
+        """Get every stream address which is being sent, with the number of destinations listening to it."""
+        with self.lock:
+            return dict((address, len(self.destinations.get(address, []))) for address in self.sources)
+
+    def conflicts(self):
+        """Get the stream addresses which more than one source is sending to, with the (host, channel number) of each."""
+        with self.lock:
+            return dict((address, sorted(channels)) for address, channels in self.sources.items() if len(channels) > 1)
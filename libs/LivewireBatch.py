@@ -0,0 +1,186 @@
+"""Livewire Batch. Runs many CLI commands over one connection, with all their requests pipelined."""
+
+import shlex
+import argparse
+import logging
+logger = logging.getLogger(__name__)
+
+from LivewireFuture import waitForResult
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class BatchArgumentParser(argparse.ArgumentParser):
+    """Parses one line of a batch - raising a ValueError for a bad line, instead of exiting."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+    def exit(self, status=0, message=None):
+        raise ValueError(message or "Not a command")
+
+
+# Options which can't be used on a line of a batch - a batch can't start a daemon, or contain another batch
+unbatchedOptions = ["batch", "daemon", "via_daemon"]
+
+
+def parseBatch(parser, lines):
+    """Parse each line of a batch with a BatchArgumentParser. Blank lines and # comments are skipped.
+
+    Returns a list of the parsed arguments (with strings trimmed), and a list of errors for any bad lines."""
+    commands = []
+    errors = []
+
+    for lineNum, line in enumerate(lines):
+        line = line.strip()
+
+        if line == "" or line.startswith("#"):
+            continue
+
+        try:
+            args = parser.parse_args(shlex.split(line))
+        except ValueError as e:
+            errors.append("Batch line " + str(lineNum + 1) + ": " + str(e))
+            continue
+
+        nested = [option for option in unbatchedOptions if getattr(args, option, None)]
+        if len(nested) > 0:
+            errors.append("Batch line " + str(lineNum + 1) + ": --" + nested[0] + " can't be used in a batch")
+            continue
+
+        for arg in vars(args):
+            if isinstance(getattr(args, arg), str):
+                setattr(args, arg, getattr(args, arg).strip())
+
+        commands.append(args)
+
+    return commands, errors
+
+
+class LivewireBatch():
+    """Stands in for an LWRPClient/LWCPClient while a batch of commands is run.
+
+    Each command is run twice. The first time, every query and change is sent to the device without waiting for replies,
+    and each query's future is recorded. The second time, the queries return those futures' data and changes do nothing.
+    So the whole batch goes out in one burst, and its output is still produced in order."""
+
+    def __init__(self, device, queries, updates, timeout=5):
+        """queries maps the client's query methods to the data they read (e.g. {"sourceData": "SRC"}). None means
+        never share the reply between commands. updates maps the client's change methods to a list of the data they
+        invalidate (or ["*"] for everything). Any other methods are passed straight through to the device."""
+        self.device = device
+        self.queries = queries
+        self.updates = updates
+        self.timeout = timeout
+
+        # "send" while sending the commands, then "replay" while producing the output
+        self.mode = "send"
+
+        # (method, arguments) -> (data name, future) for queries which can be answered by an earlier reply
+        self.cache = {}
+
+        # The futures each query returns, in the order they were made
+        self.calls = []
+
+    def getDevice(self, args):
+        """Pass to the CLI's executeCommand() in place of a real device getter."""
+        return self
+
+    def __getattr__(self, name):
+        if name in self.queries:
+            return lambda *args, **kwargs: self.query(name, args, kwargs)
+
+        if name in self.updates:
+            return lambda *args, **kwargs: self.update(name, args, kwargs)
+
+        return getattr(self.device, name)
+
+    def query(self, name, args, kwargs):
+        """Send a query (or reuse one still valid), or return its data."""
+        if self.mode == "replay":
+            return waitForResult(self.calls.pop(0), self.timeout)
+
+        key = (name, args, tuple(sorted(kwargs.items())))
+
+        if key in self.cache:
+            future = self.cache[key][1]
+        else:
+            kwargs['wait'] = False
+            future = getattr(self.device, name)(*args, **kwargs)
+
+            if self.queries[name] is not None:
+                self.cache[key] = (self.queries[name], future)
+
+        self.calls.append(future)
+
+        # The command carries on as if there's no data, until it's replayed
+        return []
+
+    def update(self, name, args, kwargs):
+        """Send a change, and forget any cached replies it makes out of date."""
+        if self.mode == "replay":
+            return None
+
+        invalidates = self.updates[name]
+
+        for key in list(self.cache):
+            if "*" in invalidates or self.cache[key][0] in invalidates:
+                del self.cache[key]
+
+        return getattr(self.device, name)(*args, **kwargs)
+
+    def run(self, commands, executeCommand, sequential=None):
+        """Run a list of parsed CLI arguments. Returns a list of (output lines, exit code), one per command.
+
+        Commands for which sequential(args) is True (e.g. ones which need a reply before sending their next change)
+        are run on their own, directly on the device."""
+        results = [None] * len(commands)
+        group = []
+
+        for i, args in enumerate(commands):
+            if sequential is not None and sequential(args):
+                self.runGroup(commands, group, executeCommand, results)
+                group = []
+
+                results[i] = self.runCommand(executeCommand, args, lambda args: self.device)
+            else:
+                group.append(i)
+
+        self.runGroup(commands, group, executeCommand, results)
+
+        return results
+
+    def runGroup(self, commands, group, executeCommand, results):
+        """Send every command in a group, then produce their output."""
+        calls = {}
+        self.cache = {}
+
+        self.mode = "send"
+        for i in group:
+            self.calls = []
+            self.runCommand(executeCommand, commands[i], self.getDevice)
+            calls[i] = self.calls
+
+        self.mode = "replay"
+        for i in group:
+            self.calls = calls[i]
+            results[i] = self.runCommand(executeCommand, commands[i], self.getDevice)
+
+        self.mode = "send"
+        self.cache = {}
+
+    def runCommand(self, executeCommand, args, getDevice):
+        """Run one command, so an error in it doesn't stop the rest of the batch."""
+        output = []
+
+        try:
+            exitCode = executeCommand(args, output, getDevice)
+        except Exception:
+            logger.exception("Error running batch command")
+            exitCode = 2
+
+        return output, exitCode
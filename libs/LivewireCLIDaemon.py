@@ -0,0 +1,289 @@
+"""Livewire CLI Daemon. Keeps device connections open between CLI commands, so each command doesn't need to connect and login."""
+
+import os
+import socket
+import json
+import hmac
+import threading
+import SocketServer
+import argparse
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+# Listen on a Unix socket where there is one. Windows doesn't have them, so it uses localhost TCP with a secret token
+useUnixSocket = hasattr(socket, "AF_UNIX")
+
+
+def daemonDirectory():
+    """The directory holding the daemon's socket (or token) files. Only the current user can use it."""
+    directory = os.path.join(os.path.expanduser("~"), ".livewire-cli")
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+
+    return directory
+
+
+def socketPath(port):
+    """The Unix socket the daemon for a port number listens on."""
+    return os.path.join(daemonDirectory(), "daemon-" + str(port) + ".sock")
+
+
+def tokenPath(port):
+    """The file holding the token a command has to send to the daemon for a port number (on Windows)."""
+    return os.path.join(daemonDirectory(), "daemon-" + str(port) + ".token")
+
+
+def readToken(port):
+    """Get the daemon's token, or None if it isn't running."""
+    try:
+        with open(tokenPath(port), "rb") as tokenFile:
+            return tokenFile.read().strip()
+    except IOError:
+        return None
+
+
+def encodeStrings(data):
+    """JSON gives us unicode strings - turn them back into the plain strings the CLI expects."""
+    if isinstance(data, unicode):
+        return data.encode("utf-8")
+
+    if isinstance(data, dict):
+        return dict((encodeStrings(key), encodeStrings(value)) for key, value in data.items())
+
+    if isinstance(data, list):
+        return [encodeStrings(item) for item in data]
+
+    return data
+
+
+def forwardCommand(port, args, timeout=60):
+    """Send parsed CLI arguments to the daemon. Returns (output lines, exit code), or None if the daemon isn't running."""
+    token = None
+
+    try:
+        if useUnixSocket:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(socketPath(port))
+        else:
+            token = readToken(port)
+            if token is None:
+                return None
+
+            sock = socket.create_connection(("127.0.0.1", port), timeout)
+
+    except socket.error:
+        return None
+
+    try:
+        sock.sendall(json.dumps({"token": token, "args": vars(args)}) + "\n")
+
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = sock.recv(4096)
+            if data == b"":
+                break
+            reply += data
+
+    except socket.error as e:
+        logger.warning("Lost connection to the CLI daemon: " + str(e))
+        return None
+
+    finally:
+        sock.close()
+
+    try:
+        reply = encodeStrings(json.loads(reply))
+    except ValueError:
+        return None
+
+    if reply.get('error') is not None:
+        logger.error("The CLI daemon refused the command: " + reply['error'])
+
+    return reply['output'], reply['exitCode']
+
+
+class LivewireCLIDaemon():
+    """Runs CLI commands sent by forwardCommand(), reusing one connection per device.
+
+    Commands can route every device the daemon can reach, so only the user running it may send them. It listens on a
+    Unix socket only that user can open. On Windows it listens on localhost TCP, and each command has to include a
+    random token written to a file only that user can read."""
+
+    def __init__(self, port, connectDevice, executeCommand, deviceArgs):
+        """Setup the daemon. The CLI provides connectDevice(args), executeCommand(args, output, getDevice), and the
+        names of the arguments which identify a device connection (e.g. IP address and password)."""
+        self.port = port
+        self.connectDevice = connectDevice
+        self.executeCommand = executeCommand
+        self.deviceArgs = deviceArgs
+
+        # Open device connections, and a lock for each so commands to the same device run one at a time
+        self.devices = {}
+        self.deviceLocks = {}
+        self.devicesLock = threading.Lock()
+
+        self.server = None
+
+        # The secret each command has to send, when listening on TCP
+        self.token = None
+
+    def serve(self):
+        """Listen for commands until interrupted, then close every device connection."""
+        daemon = self
+
+        class RequestHandler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                daemon.handleRequest(self.rfile, self.wfile)
+
+        if useUnixSocket:
+            self.server = self.unixServer(RequestHandler)
+        else:
+            self.server = self.tcpServer(RequestHandler)
+
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.stop()
+
+            try:
+                os.remove(socketPath(self.port) if useUnixSocket else tokenPath(self.port))
+            except OSError:
+                pass
+
+    def unixServer(self, handler):
+        """Listen on a Unix socket which only the current user can connect to."""
+        path = socketPath(self.port)
+
+        if os.path.exists(path):
+            # Left behind by a daemon which didn't shut down cleanly - unless it's still running
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                probe.connect(path)
+            except socket.error:
+                os.remove(path)
+            else:
+                raise RuntimeError("The CLI daemon is already running on " + path)
+            finally:
+                probe.close()
+
+        SocketServer.ThreadingUnixStreamServer.daemon_threads = True
+
+        # Create the socket file without permissions for anyone else, rather than fixing them afterwards
+        oldUmask = os.umask(0o177)
+        try:
+            server = SocketServer.ThreadingUnixStreamServer(path, handler)
+        finally:
+            os.umask(oldUmask)
+
+        os.chmod(path, 0o600)
+
+        logger.info("CLI daemon listening on " + path)
+        return server
+
+    def tcpServer(self, handler):
+        """Listen on localhost TCP, and write the token commands have to send to a file only the current user can read."""
+        SocketServer.ThreadingTCPServer.allow_reuse_address = True
+        SocketServer.ThreadingTCPServer.daemon_threads = True
+        server = SocketServer.ThreadingTCPServer(("127.0.0.1", self.port), handler)
+
+        self.token = os.urandom(32).encode("hex")
+
+        path = tokenPath(self.port)
+        if os.path.exists(path):
+            os.remove(path)
+
+        tokenFile = os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb")
+        with tokenFile:
+            tokenFile.write(self.token)
+
+        logger.info("CLI daemon listening on port " + str(self.port))
+        return server
+
+    def shutdown(self):
+        """Stop serve() from another thread."""
+        if self.server is not None:
+            self.server.shutdown()
+
+    def stop(self):
+        """Close every device connection."""
+        with self.devicesLock:
+            for device in self.devices.values():
+                device.stop()
+
+            self.devices = {}
+
+    def deviceKey(self, args):
+        """The arguments which identify a device connection."""
+        return tuple(getattr(args, name) for name in self.deviceArgs)
+
+    def getDevice(self, args):
+        """Get the open connection to a device, connecting to it if this is the first command for it."""
+        key = self.deviceKey(args)
+
+        with self.devicesLock:
+            device = self.devices.get(key)
+
+        if device is not None and not device.running():
+            # e.g. its thread died, or it gave up reconnecting - commands sent to it would never be answered
+            logger.warning("Connection to a device has stopped - connecting again")
+            device.stop()
+            device = None
+
+        if device is None:
+            # handleRequest holds this device's lock, so nothing else can be connecting to it at the same time
+            device = self.connectDevice(args)
+
+            with self.devicesLock:
+                self.devices[key] = device
+
+        return device
+
+    def handleRequest(self, rfile, wfile):
+        """Run one command sent by forwardCommand(), and send back the output and exit code."""
+        try:
+            request = encodeStrings(json.loads(rfile.readline()))
+            token = request.get("token")
+            args = argparse.Namespace(**request["args"])
+        except (ValueError, TypeError, KeyError, AttributeError):
+            logger.warning("Invalid command sent to the CLI daemon")
+            return
+
+        if self.token is not None and not hmac.compare_digest(str(token or ""), self.token):
+            logger.warning("Command sent to the CLI daemon without the right token")
+            self.refuse(wfile, "Invalid token")
+            return
+
+        if getattr(args, "daemon", False):
+            self.refuse(wfile, "A daemon can't be started from the daemon")
+            return
+
+        output = []
+
+        with self.devicesLock:
+            lock = self.deviceLocks.setdefault(self.deviceKey(args), threading.Lock())
+
+        try:
+            with lock:
+                exitCode = self.executeCommand(args, output, self.getDevice)
+        except Exception:
+            logger.exception("Error running CLI command")
+            exitCode = 2
+
+        wfile.write(json.dumps({"output": output, "exitCode": exitCode}) + "\n")
+
+    def refuse(self, wfile, error):
+        """Reply to a command without running it."""
+        wfile.write(json.dumps({"output": [], "exitCode": 1, "error": error}) + "\n")
@@ -0,0 +1,983 @@
+"""Livewire Client (Communication Base Class). The event-driven transport shared by the LWRP and LWCP clients."""
+
+import os
+import socket
+import select
+import errno
+import time
+import heapq
+import random
+import functools
+import itertools
+import threading
+import collections
+import logging
+logger = logging.getLogger(__name__)
+
+from LivewireFuture import LivewireFuture
+from LivewireSendQueue import LivewireSendQueue, PRIORITY_CONTROL, PRIORITY_POLL
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+def socketPair():
+    """Return a pair of connected sockets. Windows doesn't provide socket.socketpair(), so fall back to loopback TCP."""
+    if hasattr(socket, "socketpair"):
+        return socket.socketpair()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+
+    sockSend = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sockSend.connect(listener.getsockname())
+    sockRecv, _ = listener.accept()
+    listener.close()
+
+    sockSend.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sockRecv, sockSend
+
+
+class LivewireClientComms(threading.Thread):
+    """This class handles the socket, send queue and subscriptions for a Livewire protocol connection.
+
+    Subclasses provide the protocol specific parts: updateBlockState() and parseMessage()."""
+
+    # Used in log messages - overridden by each protocol
+    protocolName = "Livewire"
+
+    # The marker which opens a multi-line block of data - overridden by each protocol
+    blockBegin = b"BEGIN"
+
+    # How much to ask for from the socket in each recv() call
+    recvSize = 4096
+
+    # Skip parsing message types which have no subscribers
+    skipUnsubscribed = True
+
+    # The most queued commands to send in one write (None for no limit)
+    maxBatch = None
+
+    # How many commands can be waiting to be sent, and how long sendCommand() waits for space before raising Queue.Full
+    sendQueueSize = 10000
+    sendTimeout = 5
+
+    # Reconnect automatically if the server drops the connection
+    reconnect = True
+
+    # Seconds to wait before the first reconnect attempt. This doubles after each failure, up to reconnectMaxDelay
+    reconnectDelay = 0.5
+    reconnectMaxDelay = 30
+
+    # How long to wait for a reconnect attempt if no connectTimeout was given
+    reconnectTimeout = 10
+
+    # How long a reply can pause before we decide it's finished, for replies of unknown length.
+    # None ends each reply with the data it arrived in
+    replyIdleTime = None
+
+    # The replyRow() of a message which isn't about a channel
+    noChannel = (None, None, None, None)
+
+    # How long a request waits for its reply after being sent, before it's cancelled (if not given to request())
+    requestTimeout = 10
+
+    # The type of the messages the server sends when it can't carry out a command
+    errorType = "ERROR"
+
+    def __init__(self, host, port, connectTimeout=None):
+        """Create a socket connection to the server. connectTimeout (seconds) defaults to the OS timeout."""
+
+        # Where we're connected to - kept so we can reconnect
+        self.host = host
+        self.port = port
+        self.connectTimeout = connectTimeout
+
+        # The handle for the socket connection to the server. None while we're waiting to reconnect
+        self.sock = None
+
+        # All the commands waiting to be sent to the server, as (command, reply key, request) tuples
+        self.sendQueue = LivewireSendQueue(self.sendQueueSize)
+
+        # Data taken from the send queue which the socket hasn't accepted yet, and the queue items it was made from
+        self.sendBuffer = b""
+        self.sendBatch = []
+
+        # Data received from the server which hasn't been made into complete messages yet
+        self.recvBuffer = bytearray()
+
+        # How far into recvBuffer we've already looked for newlines, and if that left us inside a block
+        self.scanPos = 0
+        self.inBlock = False
+
+        # Data subscriptions (with callbacks), indexed by the type of message they want
+        self.dataSubscriptions = {}
+        self.subscriptionLock = threading.Lock()
+
+        # Each request waiting for a reply (see request()), indexed by the (message type, object) of the reply they want.
+        # Each is answered in the order sent
+        self.pendingRequests = {}
+        self.requestCount = itertools.count()
+
+        # Every command sent which may still be answered, in the order sent. Commands without a request have a placeholder
+        # here, as the server may still reply with an error - which mustn't be taken for the reply to a later request
+        self.sentCommands = collections.deque()
+
+        # Functions to run on the connection's thread later on, as a heap of (time, order added, function)
+        self.timers = []
+        self.timerCount = itertools.count()
+        self.timerLock = threading.Lock()
+
+        # Should we be shutting down this thread? Set via self.stop()
+        self._stop = False
+
+        # Commands to send again after reconnecting - the login first, then each subscription command
+        self.loginCommand = None
+        self.replayCommands = []
+
+        # Reconnection state: is a non-blocking connect in progress, and when to give up on it or try the next one
+        self.connecting = False
+        self.connectDeadline = None
+        self.reconnectAt = None
+        self.reconnectAttempts = 0
+
+        logger.info("Attempting to connect: " + str(host) + ":" + str(port))
+
+        # The first connection is made straight away, so the caller finds out if it fails
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(connectTimeout)
+        self.sock.connect((host, port))
+        self.sock.setblocking(0)
+
+        # Commands are small - don't let Nagle's algorithm hold them back
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # A socket pair used to wake the thread up from select() when there's a command to send
+        # These are only created if this connection runs its own thread (see start)
+        self.wakeupRecv = None
+        self.wakeupSend = None
+
+        # The LivewireReactor running this connection, if it doesn't have its own thread
+        self.reactor = None
+
+        threading.Thread.__init__(self)
+
+    def start(self):
+        """Run this connection on its own thread."""
+        self.wakeupRecv, self.wakeupSend = socketPair()
+        self.wakeupRecv.setblocking(0)
+        self.wakeupSend.setblocking(0)
+
+        threading.Thread.start(self)
+
+    def stop(self):
+        """Attempt to close this thread."""
+        self._stop = True
+        self.wakeup()
+
+    def running(self):
+        """Is this connection still being run? False once it's been stopped, or if its thread (or reactor) has died."""
+        if self._stop is True:
+            return False
+
+        if self.reactor is not None:
+            return self.reactor.is_alive()
+
+        return self.is_alive()
+
+    def wakeup(self):
+        """Interrupt the thread if it's waiting in select()."""
+        if self.reactor is not None:
+            self.reactor.wakeup()
+            return
+
+        if self.wakeupSend is None:
+            # The thread hasn't started yet - it'll see the send queue when it does
+            return
+
+        try:
+            self.wakeupSend.send(b"x")
+        except socket.error:
+            # The wakeup buffer is already full, so the thread is waking up anyway
+            pass
+
+    def close(self):
+        """Close the server connection and the wakeup sockets. Any requests still waiting (or queued) fail."""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+        self.failRequests("Connection closed")
+        self.discardCommands(self.sendQueue.getBatch(), "Connection closed")
+
+        if self.wakeupRecv is not None:
+            self.wakeupRecv.close()
+            self.wakeupSend.close()
+
+    def connected(self):
+        """Can commands be sent? False while we're waiting to reconnect (or reconnecting), and once we've stopped."""
+        return self.sock is not None and self.connecting is False and self._stop is False
+
+    def wantsWrite(self):
+        """Do we have any data waiting to go out to the server? (A connect in progress shows up as writable too)"""
+        return self.connecting or len(self.sendBuffer) > 0 or len(self.sendQueue) > 0
+
+    def run(self):
+        """Method keeps running forever, and handles all the communication with the open socket."""
+        while True:
+
+            if self._stop is True:
+                # End the thread
+                self.close()
+                break
+
+            self.handleTimeout()
+
+            sock = self.sock
+            readers = [self.wakeupRecv]
+            writers = []
+            errors = []
+
+            if sock is not None:
+                readers.append(sock)
+
+                # Only ask to be told about write-readiness if we've got something to send
+                if self.wantsWrite():
+                    writers.append(sock)
+
+                # Windows reports a failed connect as an exception, not as writable
+                if self.connecting:
+                    errors.append(sock)
+
+            # Sleep until the server sends us something, sendCommand/stop wakes us up, or it's time to reconnect
+            readable, writable, failed = select.select(readers, writers, errors, self.nextTimeout())
+
+            if self.wakeupRecv in readable:
+                self.handleWakeup()
+
+            if sock is None or sock is not self.sock:
+                continue
+
+            try:
+                if sock in readable or sock in failed:
+                    self.handleRead()
+
+                if sock in writable and sock is self.sock:
+                    self.handleWrite()
+
+            except socket.error as e:
+                # A transport error which wasn't handled where it happened
+                logger.warning("Connection to the " + self.protocolName + " server failed: " + str(e))
+                self.connectionLost()
+
+            except Exception:
+                # A bug handling the data - don't let it end the thread, which would leave every request hanging
+                logger.exception("Error handling " + self.protocolName + " connection")
+
+    def handleWakeup(self):
+        """Drain the wakeup socket so select() blocks again next time round."""
+        try:
+            self.wakeupRecv.recv(1024)
+        except socket.error:
+            pass
+
+    def nextTimeout(self):
+        """Seconds until handleTimeout() has something to do, or None to wait for socket activity."""
+        times = []
+
+        if self.reconnectAt is not None:
+            times.append(self.reconnectAt)
+
+        elif self.connecting:
+            times.append(self.connectDeadline)
+
+        with self.timerLock:
+            if len(self.timers) > 0:
+                times.append(self.timers[0][0])
+
+        if len(times) == 0:
+            return None
+
+        return max(0, min(times) - time.time())
+
+    def callLater(self, delay, callback):
+        """Run callback() on the connection's thread after a delay (in seconds)."""
+        with self.timerLock:
+            heapq.heappush(self.timers, (time.time() + delay, next(self.timerCount), callback))
+
+        if threading.current_thread() is not self and threading.current_thread() is not self.reactor:
+            # Make sure the thread isn't sleeping past it
+            self.wakeup()
+
+    def runTimers(self):
+        """Run any callLater() functions which are due."""
+        now = time.time()
+
+        while True:
+            with self.timerLock:
+                if len(self.timers) == 0 or self.timers[0][0] > now:
+                    return
+
+                callback = heapq.heappop(self.timers)[2]
+
+            try:
+                callback()
+            except Exception:
+                logger.exception("Error in " + self.protocolName + " timer")
+
+    def handleTimeout(self):
+        """Run due timers, start a reconnect attempt once its backoff delay is up, and give up on attempts which are taking too long."""
+        if self._stop is True:
+            return
+
+        self.runTimers()
+
+        if self.reconnectAt is not None and time.time() >= self.reconnectAt:
+            self.startConnect()
+
+        elif self.connecting and time.time() >= self.connectDeadline:
+            logger.warning("Timed out reconnecting to the " + self.protocolName + " server")
+            self.connectionLost()
+
+    def connectionLost(self):
+        """The connection has dropped - throw away any half-received data and schedule a reconnect.
+
+        Requests which were sent fail, as we can't tell if the server carried them out (and any reply to them is lost).
+        Commands which weren't sent are given up on too, rather than being sent whenever we manage to reconnect."""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+        unsent = self.unsentCommands() + self.sendQueue.getBatch()
+
+        self.connecting = False
+        self.sendBuffer = b""
+        self.sendBatch = []
+        self.recvBuffer = bytearray()
+        self.scanPos = 0
+        self.inBlock = False
+
+        self.failRequests("Connection lost")
+        self.discardCommands(unsent, "Connection lost")
+
+        if self.reconnect is False or self._stop is True:
+            self._stop = True
+            return
+
+        # Exponential backoff, with jitter so a whole rack of devices power-cycling doesn't get reconnected in lockstep
+        delay = min(self.reconnectMaxDelay, self.reconnectDelay * (2 ** self.reconnectAttempts))
+        delay *= random.uniform(0.5, 1.0)
+
+        self.reconnectAttempts += 1
+        self.reconnectAt = time.time() + delay
+
+        logger.info("Reconnecting to " + str(self.host) + ":" + str(self.port) + " in " + str(round(delay, 1)) + " seconds")
+
+    def unsentCommands(self):
+        """Get the queue items of the last batch which the socket hasn't fully accepted."""
+        remaining = len(self.sendBuffer)
+        unsent = []
+
+        for item in reversed(self.sendBatch):
+            if remaining <= 0:
+                break
+
+            unsent.insert(0, item)
+            remaining -= len(item[0])
+
+        return unsent
+
+    def failRequests(self, error):
+        """Fail every request waiting for a reply."""
+        with self.subscriptionLock:
+            requests = [request for pending in self.pendingRequests.values() for request in pending]
+            self.pendingRequests = {}
+            self.sentCommands.clear()
+
+        for request in requests:
+            request['future'].setError(error)
+
+    def discardCommands(self, items, error):
+        """Give up on send queue items which can't be sent. Their requests fail with the error, and other commands are
+        dropped - except the login and subscriptions, which are sent again anyway once we've reconnected."""
+        dropped = []
+
+        for msg, replyKey, request in items:
+            if request is not None:
+                request['future'].setError(error)
+
+            if msg != self.loginCommand and msg not in self.replayCommands:
+                dropped.append(msg.strip())
+
+        if len(dropped) > 0:
+            logger.warning("Not sending " + str(len(dropped)) + " commands to the " + self.protocolName + " server (" + error + "): " + ", ".join(dropped))
+
+    def startConnect(self):
+        """Begin a non-blocking connect, so waiting on it doesn't hold up any other connections on the thread."""
+        self.reconnectAt = None
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        try:
+            result = self.sock.connect_ex((self.host, self.port))
+        except socket.error as e:
+            # e.g. the hostname can't be resolved right now
+            result = e.args[0]
+
+        # 10035 is WSAEWOULDBLOCK - what Windows gives us for a connect in progress
+        if result in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035):
+            self.connecting = True
+            self.connectDeadline = time.time() + (self.connectTimeout or self.reconnectTimeout)
+        else:
+            logger.warning("Unable to reconnect to the " + self.protocolName + " server: " + os.strerror(result))
+            self.connectionLost()
+
+    def finishConnect(self):
+        """A connect in progress has completed - check it worked, then send the login and subscriptions again."""
+        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+        if error != 0:
+            logger.warning("Unable to reconnect to the " + self.protocolName + " server: " + os.strerror(error))
+            self.connectionLost()
+            return
+
+        logger.info("Reconnected to " + str(self.host) + ":" + str(self.port))
+
+        self.connecting = False
+        self.reconnectAttempts = 0
+
+        # Anything which slipped into the queue as the connection dropped is as stale as what connectionLost() discarded
+        self.discardCommands(self.sendQueue.getBatch(), "Connection lost")
+
+        replay = list(self.replayCommands)
+        if self.loginCommand is not None:
+            replay.insert(0, self.loginCommand)
+
+        # These go ahead of anything which was queued up while we were disconnected
+        self.sendQueue.putFront([(msg, None, None) for msg in replay])
+
+    def handleRead(self):
+        """The socket is readable - receive everything available and dispatch any complete messages."""
+        if self.connecting:
+            self.finishConnect()
+            return
+
+        while True:
+            try:
+                recvData = self.sock.recv(self.recvSize)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+
+                logger.warning("Connection to the " + self.protocolName + " server failed: " + str(e))
+                self.connectionLost()
+                return
+
+            if recvData == b"":
+                # The server has closed the connection
+                logger.warning("Connection closed by the " + self.protocolName + " server")
+                self.connectionLost()
+                return
+
+            self.recvBuffer += recvData
+
+            if len(recvData) < self.recvSize:
+                # We've probably emptied the socket - save a system call
+                break
+
+        recvData = self.extractFrames()
+
+        if recvData is not None:
+            self.processReceivedData(recvData)
+
+    def extractFrames(self):
+        """Take all complete messages out of the receive buffer. Partial lines and unfinished blocks stay buffered."""
+        buf = self.recvBuffer
+        pos = self.scanPos
+        completeEnd = 0
+
+        if self.inBlock is False and buf.find(self.blockBegin, pos) == -1:
+            # Nothing new can open a block, so everything up to the last newline is complete
+            lastNewline = buf.rfind(b"\n", pos)
+            if lastNewline != -1:
+                completeEnd = pos = lastNewline + 1
+
+        else:
+            # Step through the new lines, tracking where blocks start and finish
+            while True:
+                end = buf.find(b"\n", pos)
+                if end == -1:
+                    break
+
+                self.inBlock = self.updateBlockState(buf[pos:end], self.inBlock)
+                pos = end + 1
+
+                if self.inBlock is False:
+                    completeEnd = pos
+
+        if completeEnd == 0:
+            # Only remember how far we've scanned, so we don't scan it again next time
+            self.scanPos = pos
+            return None
+
+        frames = bytes(buf[:completeEnd])
+        del buf[:completeEnd]
+        self.scanPos = pos - completeEnd
+
+        return frames
+
+    def updateBlockState(self, line, inBlock):
+        """Given one received line, work out if we're inside a multi-line block. Implemented by each protocol."""
+        raise NotImplementedError()
+
+    def handleWrite(self):
+        """The socket is writable - send as much of the pending data as it will take."""
+        if self.connecting:
+            self.finishConnect()
+            return
+
+        if len(self.sendBuffer) == 0 and len(self.sendQueue) > 0:
+            # Take everything waiting in the queue, so a burst of commands goes out in one TCP write
+            batch = []
+            answered = []
+
+            with self.subscriptionLock:
+                for msg, replyKey, request in self.sendQueue.getBatch(self.maxBatch):
+                    if request is not None and request['future'].done():
+                        # Cancelled (or timed out) while it was queued - nobody is waiting for it any more
+                        logger.info("Not sending cancelled command: " + str(msg))
+                        continue
+
+                    logger.info("Sending command: " + str(msg))
+                    batch.append((msg, replyKey, request))
+
+                    if request is not None and callable(request['replySize']) and request['replySize']() is not None:
+                        request['replySize'] = request['replySize']()
+
+                    if request is None or request['replySize'] == 0:
+                        # There's nothing to wait for, but an error could still come back
+                        self.sentCommands.append({"future": None, "command": msg, "sequence": next(self.requestCount), "sentAt": time.time()})
+
+                        if request is not None:
+                            answered.append(request)
+
+                        continue
+
+                    # Higher priority commands can overtake others in the queue, so requests wait in the order they're sent
+                    request['sequence'] = next(self.requestCount)
+                    request['sentAt'] = time.time()
+                    request['replyKey'] = replyKey
+                    request['rows'] = collections.OrderedDict()
+                    self.pendingRequests.setdefault(replyKey, collections.deque()).append(request)
+                    self.sentCommands.append(request)
+
+                    # Nothing may be waiting on the future, so don't let an unanswered request wait forever
+                    self.callLater(request['timeout'], functools.partial(self.expireRequest, request))
+
+            for request in answered:
+                request['future'].setResult([])
+
+            self.sendBuffer = b"".join(msg for msg, replyKey, request in batch)
+            self.sendBatch = batch
+
+        while len(self.sendBuffer) > 0:
+            try:
+                sent = self.sock.send(self.sendBuffer)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # The socket buffer filled up - we'll carry on once it's writable again
+                    return
+
+                logger.warning("Connection to the " + self.protocolName + " server failed: " + str(e))
+                self.connectionLost()
+                return
+
+            self.sendBuffer = self.sendBuffer[sent:]
+
+        # It's all been sent
+        self.sendBatch = []
+
+    def parseMessage(self, data, wantedTypes=None):
+        """Parse the messages and put them into a list of dictionaries. Implemented by each protocol.
+
+        wantedTypes is the set of message types with subscribers (or None for all types)."""
+        raise NotImplementedError()
+
+    def processReceivedData(self, recvData):
+        """Process the received data from the server. Attempts to parse it and trigger all the subscribed callbacks."""
+        # A dict with all the different message types we've received
+        messageTypes = {}
+
+        # Don't bother parsing messages nobody has subscribed to
+        if self.skipUnsubscribed is True:
+            with self.subscriptionLock:
+                wantedTypes = set(self.dataSubscriptions)
+                wantedTypes.update(replyType for replyType, replyObject in self.pendingRequests)
+
+                if len(self.sentCommands) > 0:
+                    # An error may be the reply to a command we've sent
+                    wantedTypes.add(self.errorType)
+        else:
+            wantedTypes = None
+
+        # Parse the data so it's in a usable format
+        # We receive a list in return (one per message - for blocks of data)
+        parsedData = self.parseMessage(recvData, wantedTypes)
+
+        # Answer any requests waiting on these messages, oldest first
+        self.resolveRequests(parsedData)
+
+        # Group the messages by type
+        for data in parsedData:
+            messageTypes.setdefault(data['type'], []).append(data)
+
+        # Trigger the subscriptions for each type of message we've received
+        for commandType in messageTypes:
+            for subX in self.claimSubscriptions(commandType):
+                # Execute the callback! A bug in one shouldn't stop the others, or take down the connection
+                try:
+                    subX['callback'](messageTypes[commandType])
+                except Exception:
+                    logger.exception("Error in " + self.protocolName + " subscription callback for " + str(commandType))
+
+    def claimSubscriptions(self, commandType):
+        """Get the subscriptions to notify about a message type, using up one delivery from any limited subscriptions."""
+        with self.subscriptionLock:
+            subscriptions = self.dataSubscriptions.get(commandType)
+
+            if not subscriptions:
+                return []
+
+            remaining = []
+            for subX in subscriptions:
+                if subX['limit'] is not False:
+                    subX['limit'] -= 1
+
+                if subX['limit'] is False or subX['limit'] > 0:
+                    remaining.append(subX)
+
+            if len(remaining) > 0:
+                self.dataSubscriptions[commandType] = remaining
+            else:
+                del self.dataSubscriptions[commandType]
+
+            return subscriptions
+
+    def resolveRequests(self, messages):
+        """Give received messages (in the order they arrived) to the requests waiting for them, and resolve any finished replies."""
+        finished = []
+        failed = []
+
+        with self.subscriptionLock:
+            for data in messages:
+                if data['type'] == self.errorType:
+                    self.failRequest(data, failed, finished)
+                else:
+                    self.collectReply(data['type'], data, finished)
+
+            if self.replyIdleTime is None:
+                # Replies end with the data they arrived in
+                for replyKey in list(self.pendingRequests):
+                    request = self.oldestRequest(replyKey)
+
+                    if request is not None and len(request['rows']) > 0:
+                        self.finishRequest(replyKey, finished)
+
+        self.resolveFinished(finished)
+
+        for command, data in failed:
+            logger.warning("The " + self.protocolName + " server couldn't carry out: " + command['command'].strip())
+
+            if command['future'] is not None:
+                command['future'].setError(data.get('message'))
+
+    def failRequest(self, data, failed, finished):
+        """An error message doesn't say which command it's about. The server answers in order, so it's taken to be the
+        reply to the oldest command still waiting for one. That command is moved to failed, with the error - if it's a
+        request, the request fails. Call with subscriptionLock held."""
+        while True:
+            command = self.oldestCommand()
+
+            if command is None:
+                return
+
+            if command['future'] is not None and len(command['rows']) > 0:
+                if command['replySize'] is not None:
+                    # Part of its reply may have been a change nobody asked for, so we can't tell what the error is about
+                    return
+
+                # A reply of unknown length - the server has moved on, so it's finished
+                self.sentCommands.popleft()
+                self.finishCommand(command, finished)
+                continue
+
+            self.sentCommands.popleft()
+
+            if command['future'] is not None:
+                self.finishCommand(command, [])
+
+            failed.append((command, data))
+            return
+
+    def finishCommand(self, request, finished):
+        """Stop collecting a request's reply (see finishRequest). Call with subscriptionLock held."""
+        # Skips over any cancelled requests ahead of it
+        if self.oldestRequest(request['replyKey']) is request:
+            self.finishRequest(request['replyKey'], finished)
+
+    def oldestCommand(self):
+        """Get the oldest command sent which may still be answered, or None. Call with subscriptionLock held."""
+        now = time.time()
+
+        while len(self.sentCommands) > 0:
+            command = self.sentCommands[0]
+
+            if command['future'] is None:
+                # Commands without a request wait as long as a request would, in case there's an error
+                if now - command['sentAt'] < self.requestTimeout:
+                    return command
+
+            elif command['finished'] is False and not command['future'].done():
+                return command
+
+            self.sentCommands.popleft()
+
+        return None
+
+    def answeredBefore(self, request):
+        """A request's reply has started, so the server has finished with every command sent before it - they can't be
+        the reason for an error. Call with subscriptionLock held."""
+        while len(self.sentCommands) > 0 and self.sentCommands[0]['sequence'] < request['sequence']:
+            self.sentCommands.popleft()
+
+    def collectReply(self, commandType, data, finished):
+        """Add one message to the reply it belongs to. Requests whose reply is complete are moved to finished.
+
+        LWRP doesn't mark the end of a reply. If we know how many messages there are (replySize), the reply is complete
+        once we have that many channels - and a channel repeating is a change which arrived alongside the reply, so the
+        newest copy is kept. Otherwise, a channel repeating means the next reply has started, and a pause of
+        replyIdleTime (see replyIdle()) means it's finished. Messages which aren't about a channel are a reply on their own."""
+        rowKey = self.replyRow(data)
+        replyObject = self.replyObject(data)
+
+        while True:
+            replyKey = self.findRequest(commandType, replyObject)
+            if replyKey is None:
+                return
+
+            request = self.pendingRequests[replyKey][0]
+            rows = request['rows']
+
+            if len(rows) == 0 and callable(request['replySize']):
+                # The reply is starting, so anything it depends on has arrived by now
+                request['replySize'] = request['replySize']()
+
+            if len(rows) > 0 and (rowKey == self.noChannel or (rowKey in rows and request['replySize'] is None)):
+                self.finishRequest(replyKey, finished)
+                continue
+
+            if rowKey in rows:
+                del rows[rowKey]
+
+            rows[rowKey] = data
+            request['lastReceived'] = time.time()
+            self.answeredBefore(request)
+
+            if rowKey == self.noChannel or (request['replySize'] is not None and len(rows) >= request['replySize']):
+                self.finishRequest(replyKey, finished)
+
+            elif len(rows) == 1 and self.replyIdleTime is not None:
+                self.callLater(self.replyIdleTime, functools.partial(self.replyIdle, replyKey, request))
+
+            return
+
+    def replyRow(self, data):
+        """The channel a message is about, so we can tell when a channel repeats within a reply."""
+        return (data.get('io'), data.get('num'), data.get('side'), data.get('dst'))
+
+    def replyObject(self, data):
+        """The object a message is about, used to match replies to requests. None if the protocol doesn't need this."""
+        return None
+
+    def findRequest(self, commandType, replyObject):
+        """Get the (message type, object) key of the request a message is the reply to, or None if nothing is waiting for it.
+
+        A message about an object can answer a request about that object (e.g. the echo of a change to one channel), or
+        a request for every object of that type (e.g. a list of channels). Whichever was sent first gets it - unless the
+        list has already started arriving, as the server finishes one reply before starting the next."""
+        general = self.oldestRequest((commandType, None))
+        specific = None
+
+        if replyObject is not None:
+            specific = self.oldestRequest((commandType, replyObject))
+
+        if specific is not None and (general is None or (len(general['rows']) == 0 and specific['sequence'] < general['sequence'])):
+            return (commandType, replyObject)
+
+        if general is not None:
+            return (commandType, None)
+
+        return None
+
+    def oldestRequest(self, replyKey):
+        """Get the oldest request still waiting on a (message type, object) reply, or None. Call with subscriptionLock held."""
+        pending = self.pendingRequests.get(replyKey)
+
+        while pending and pending[0]['future'].done():
+            # This request was cancelled (e.g. it timed out)
+            pending.popleft()
+
+        if pending is None:
+            return None
+
+        if len(pending) == 0:
+            del self.pendingRequests[replyKey]
+            return None
+
+        return pending[0]
+
+    def finishRequest(self, replyKey, finished):
+        """Stop collecting the oldest request's reply, and move it to the finished list. Call with subscriptionLock held."""
+        pending = self.pendingRequests[replyKey]
+        request = pending.popleft()
+        request['finished'] = True
+        finished.append(request)
+
+        if len(pending) == 0:
+            del self.pendingRequests[replyKey]
+
+    def resolveFinished(self, finished):
+        """Resolve the futures of finished requests with their replies. Call without subscriptionLock held."""
+        for request in finished:
+            request['future'].setResult(list(request['rows'].values()))
+
+    def expireRequest(self, request):
+        """A timer set when a request is sent. Cancel it if it's still waiting - so its reply can't be given to a later one."""
+        if request['future'].cancel():
+            logger.warning("No reply from the " + self.protocolName + " server to: " + request['command'].strip())
+
+    def replyIdle(self, replyKey, request):
+        """A timer set when a reply of unknown length started. Finish it if nothing more has arrived for replyIdleTime."""
+        finished = []
+
+        with self.subscriptionLock:
+            if self.oldestRequest(replyKey) is not request:
+                # The reply has already finished
+                return
+
+            remaining = request['lastReceived'] + self.replyIdleTime - time.time()
+
+            if remaining > 0:
+                self.callLater(remaining, functools.partial(self.replyIdle, replyKey, request))
+            else:
+                self.finishRequest(replyKey, finished)
+
+        self.resolveFinished(finished)
+
+    def request(self, replyType, msg, replyObject=None, priority=PRIORITY_CONTROL, replySize=None, replay=False, timeout=None):
+        """Send a command and return a LivewireFuture, resolved with the next message of replyType (about replyObject).
+
+        replySize is the number of messages in the reply, if known (e.g. 1 for the echo of a change). It can also be a
+        function, called once the reply starts - it returns the size, or None if it's still unknown.
+        With replay=True, the command is sent again every time we reconnect (its replies then only go to subscriptions).
+        The request is cancelled if there's no reply within timeout seconds of sending it (default: requestTimeout).
+        If the server replies with an error, the future is resolved with None, and the error is in future.error."""
+        future = LivewireFuture()
+        msg = msg + "\n"
+
+        if replay is True and msg not in self.replayCommands:
+            self.replayCommands.append(msg)
+
+        if timeout is None:
+            timeout = self.requestTimeout
+
+        request = {
+            "future": future,
+            "command": msg,
+            "replySize": replySize,
+            "timeout": timeout,
+
+            # Set once it's sent: the order requests were sent in, when, the key it's waiting under, the reply's messages
+            # so far (by channel), when the last of them arrived, and if the reply is complete
+            "sequence": None,
+            "sentAt": None,
+            "replyKey": None,
+            "rows": None,
+            "lastReceived": None,
+            "finished": False,
+        }
+
+        self.queueCommand(msg, (replyType, replyObject), request, priority)
+        return future
+
+    def sendCommand(self, msg, replay=False, priority=PRIORITY_CONTROL):
+        """Buffer a command to send. With replay=True, it's sent again every time we reconnect (e.g. subscriptions).
+
+        Polling commands can use PRIORITY_POLL, so they don't hold up more important commands.
+        Raises Queue.Full if the send queue stays full for sendTimeout seconds."""
+        msg = msg + "\n"
+
+        if replay is True and msg not in self.replayCommands:
+            self.replayCommands.append(msg)
+
+        self.queueCommand(msg, None, None, priority)
+
+    def queueCommand(self, msg, replyKey, request, priority):
+        """Add a command (and the request waiting for its reply, if any) to the send queue.
+
+        While we're disconnected, commands aren't queued until we reconnect - by then they could be out of date, and
+        whoever sent them would have long since given up. Requests fail straight away, so the caller knows."""
+        if not self.connected():
+            if priority == PRIORITY_POLL:
+                # Another poll will be along soon enough
+                logger.debug("Not connected - dropping poll: " + msg.strip())
+                if request is not None:
+                    request['future'].setError("Not connected")
+            else:
+                self.discardCommands([(msg, replyKey, request)], "Not connected")
+
+            return
+
+        timeout = self.sendTimeout
+
+        if threading.current_thread() is self or threading.current_thread() is self.reactor:
+            # We're on the thread that empties the queue (e.g. in a callback), so waiting for space would never end
+            timeout = 0
+
+        self.sendQueue.put((msg, replyKey, request), priority, timeout)
+        self.wakeup()
+
+    def setLoginCommand(self, msg):
+        """Send a login command, and send it again first thing every time we reconnect."""
+        self.loginCommand = msg + "\n"
+        self.sendCommand(msg)
+
+    def addSubscription(self, subType, callbackObj, limit=False, filters={}):
+        """Add a subscription to the list of data subscriptions. Returns the subscription, for removeSubscription()."""
+        subscription = {
+            "commandType": subType,
+            "callback": callbackObj,
+            "limit": limit
+        }
+
+        with self.subscriptionLock:
+            self.dataSubscriptions.setdefault(subType, []).append(subscription)
+
+        return subscription
+
+    def removeSubscription(self, subscription):
+        """Remove a subscription returned by addSubscription()."""
+        with self.subscriptionLock:
+            subscriptions = self.dataSubscriptions.get(subscription['commandType'], [])
+            remaining = [subX for subX in subscriptions if subX is not subscription]
+
+            if len(remaining) > 0:
+                self.dataSubscriptions[subscription['commandType']] = remaining
+            elif subscription['commandType'] in self.dataSubscriptions:
+                del self.dataSubscriptions[subscription['commandType']]
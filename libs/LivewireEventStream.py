@@ -0,0 +1,58 @@
+"""Livewire Event Stream. Delivers subscribed Livewire messages through an iterable queue instead of a callback."""
+
+import Queue
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LivewireEventStream():
+    """A subscription whose messages are queued up, to be read by iterating over this object."""
+
+    def __init__(self, comms, subTypes):
+        """Subscribe to a message type (or a list of types) on a LivewireClientComms connection."""
+        self.comms = comms
+        self.queue = Queue.Queue()
+        self.closed = False
+
+        if isinstance(subTypes, basestring):
+            subTypes = [subTypes]
+
+        self.subscriptions = []
+        for subType in subTypes:
+            self.subscriptions.append(self.comms.addSubscription(subType, self.callback, False))
+
+    def callback(self, data):
+        """Receives each list of messages from the Comms class."""
+        for message in data:
+            self.queue.put(message)
+
+    def get(self, timeout=None):
+        """Get the next message. Returns None if the timeout expires or the stream is closed."""
+        try:
+            return self.queue.get(True, timeout)
+        except Queue.Empty:
+            return None
+
+    def close(self):
+        """Unsubscribe, and end any iteration over this stream."""
+        self.closed = True
+
+        for subscription in self.subscriptions:
+            self.comms.removeSubscription(subscription)
+
+        self.queue.put(None)
+
+    def __iter__(self):
+        """Yield each message as it arrives, until the stream is closed."""
+        while True:
+            message = self.get()
+
+            if message is None and self.closed is True:
+                return
+
+            if message is not None:
+                yield message
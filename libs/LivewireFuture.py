@@ -0,0 +1,132 @@
+"""Livewire Future. A placeholder for the reply to a request sent to a Livewire device."""
+
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LivewireFuture():
+    """Holds the reply to one request. The Comms thread resolves it, and any other thread can wait on it."""
+
+    def __init__(self):
+        """Create an unresolved future."""
+
+        # Set once we have a result (or the request has been cancelled)
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+
+        # The parsed reply data, or the error the server replied with instead
+        self.data = None
+        self.error = None
+        self.cancelled = False
+
+        # Functions to call once the future is resolved
+        self.doneCallbacks = []
+
+    def setResult(self, data):
+        """Resolve the future with the reply data. Returns False if it was already resolved or cancelled."""
+        with self.lock:
+            if self.event.is_set():
+                return False
+
+            self.data = data
+            self.event.set()
+            callbacks, self.doneCallbacks = self.doneCallbacks, []
+
+        self.runCallbacks(callbacks)
+
+        return True
+
+    def setError(self, error):
+        """Resolve the future with an error instead of reply data (its result is None). Returns False if already resolved."""
+        with self.lock:
+            if self.event.is_set():
+                return False
+
+            self.error = error
+            self.event.set()
+            callbacks, self.doneCallbacks = self.doneCallbacks, []
+
+        self.runCallbacks(callbacks)
+
+        return True
+
+    def cancel(self):
+        """Stop waiting for a reply - a later reply will go to the next request instead. Returns False if already resolved."""
+        with self.lock:
+            if self.event.is_set():
+                return False
+
+            self.cancelled = True
+            self.event.set()
+            callbacks, self.doneCallbacks = self.doneCallbacks, []
+
+        self.runCallbacks(callbacks)
+
+        return True
+
+    def done(self):
+        """Has this future been resolved or cancelled?"""
+        return self.event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the reply data. Returns None if the timeout expires or the request was cancelled."""
+        self.event.wait(timeout)
+        return self.data
+
+    def addDoneCallback(self, callback):
+        """Call callback(future) once this future is resolved. It runs straight away if it's already done."""
+        with self.lock:
+            if not self.event.is_set():
+                self.doneCallbacks.append(callback)
+                return
+
+        self.runCallbacks([callback])
+
+    def runCallbacks(self, callbacks):
+        """Call each done callback. One raising an exception doesn't stop the rest, or whatever resolved the future."""
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception("Error in future callback")
+
+
+def waitForResult(future, timeout=5):
+    """Wait for a future's result. If it doesn't arrive in time, cancel the request and return None."""
+    data = future.result(timeout)
+
+    if future.cancel() is False:
+        # The reply may have arrived just as we gave up waiting
+        data = future.result(0)
+
+    return data
+
+
+def whenAll(futures):
+    """Returns a future resolved (with True) once every one of the futures is resolved or cancelled."""
+    future = LivewireFuture()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def finished(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+
+        future.setResult(True)
+
+    for waitingOn in futures:
+        waitingOn.addDoneCallback(finished)
+
+    if len(futures) == 0:
+        future.setResult(True)
+
+    return future
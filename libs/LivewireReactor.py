@@ -0,0 +1,186 @@
+"""Livewire Reactor. Runs many Livewire protocol connections from a single thread."""
+
+import socket
+import select
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+from LivewireClientComms import socketPair
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class LivewireReactor(threading.Thread):
+    """One event loop thread shared by any number of LWRP/LWCP connections.
+
+    Pass it to LWRPClient or LWCPClient (reactor=...) instead of giving each connection its own thread."""
+
+    def __init__(self):
+        """Setup the reactor. Call start() to begin running it."""
+
+        # All the LivewireClientComms objects we're running
+        self.connections = []
+        self.connectionsLock = threading.Lock()
+
+        # Should we be shutting down this thread? Set via self.stop()
+        self._stop = False
+
+        # A socket pair used to wake the thread up when there's a command to send or a new connection
+        self.wakeupRecv, self.wakeupSend = socketPair()
+        self.wakeupRecv.setblocking(0)
+        self.wakeupSend.setblocking(0)
+
+        # One poll object for the life of the thread, and the events each file number is registered for with it
+        self.poller = None
+        self.pollMasks = {}
+
+        if hasattr(select, "poll"):
+            self.poller = select.poll()
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def addConnection(self, comms):
+        """Start running a LivewireClientComms connection on this reactor."""
+        comms.reactor = self
+
+        with self.connectionsLock:
+            self.connections.append(comms)
+
+        self.wakeup()
+
+    def stop(self):
+        """Close all connections and end the thread."""
+        self._stop = True
+        self.wakeup()
+
+    def wakeup(self):
+        """Interrupt the thread if it's waiting for socket activity."""
+        try:
+            self.wakeupSend.send(b"x")
+        except socket.error:
+            # The wakeup buffer is already full, so the thread is waking up anyway
+            pass
+
+    def activeConnections(self):
+        """Close and forget any connections which have been stopped. Returns the rest."""
+        with self.connectionsLock:
+            for comms in self.connections:
+                if comms._stop is True:
+                    comms.close()
+
+            self.connections = [comms for comms in self.connections if comms._stop is False]
+            return list(self.connections)
+
+    def run(self):
+        """Method keeps running forever, and handles the communication for every connection."""
+        while True:
+
+            if self._stop is True:
+                # End the thread
+                for comms in self.activeConnections():
+                    comms._stop = True
+
+                self.activeConnections()
+                self.wakeupRecv.close()
+                self.wakeupSend.close()
+                break
+
+            connections = self.activeConnections()
+
+            for comms in connections:
+                # Start any reconnects which are due
+                comms.handleTimeout()
+
+            # Connections waiting to reconnect don't have a socket
+            sockets = [(comms, comms.sock) for comms in connections if comms.sock is not None]
+            readable, writable = self.wait(connections, sockets)
+
+            if self.wakeupRecv.fileno() in readable:
+                try:
+                    self.wakeupRecv.recv(1024)
+                except socket.error:
+                    pass
+
+            for comms, sock in sockets:
+                fileno = sock.fileno()
+
+                try:
+                    if fileno in readable:
+                        comms.handleRead()
+
+                    if fileno in writable and comms.sock is sock:
+                        comms.handleWrite()
+
+                except socket.error as e:
+                    # A transport error which wasn't handled where it happened - only this connection is affected
+                    logger.warning("Connection to the " + comms.protocolName + " server failed: " + str(e))
+                    comms.connectionLost()
+
+                except Exception:
+                    # A bug handling the data - log it, but keep the connection (and all the others) running
+                    logger.exception("Error handling " + comms.protocolName + " connection")
+
+    def wait(self, connections, sockets):
+        """Sleep until there's socket activity or a reconnect is due. Returns sets of the readable and writable file numbers."""
+        # Wake up in time for the next reconnect attempt (or connect timeout)
+        timeouts = [comms.nextTimeout() for comms in connections]
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+
+        if len(timeouts) > 0:
+            timeout = min(timeouts)
+        else:
+            timeout = None
+
+        if self.poller is None:
+            # Windows only has select(), and it reports a failed connect as an exception
+            readers = [self.wakeupRecv.fileno()] + [sock.fileno() for comms, sock in sockets]
+            writers = [sock.fileno() for comms, sock in sockets if comms.wantsWrite()]
+            errors = [sock.fileno() for comms, sock in sockets if comms.connecting]
+            readable, writable, failed = select.select(readers, writers, errors, timeout)
+            return set(readable) | set(failed), set(writable)
+
+        # poll() doesn't have select()'s limit on the number of sockets
+        masks = {self.wakeupRecv.fileno(): select.POLLIN}
+
+        for comms, sock in sockets:
+            if comms.wantsWrite():
+                masks[sock.fileno()] = select.POLLIN | select.POLLOUT
+            else:
+                masks[sock.fileno()] = select.POLLIN
+
+        self.updatePoller(masks)
+
+        readable = set()
+        writable = set()
+
+        if timeout is not None:
+            # poll() wants milliseconds
+            timeout = timeout * 1000
+
+        for fileno, event in self.poller.poll(timeout):
+            if event & (select.POLLIN | select.POLLHUP | select.POLLERR):
+                readable.add(fileno)
+
+            if event & select.POLLOUT:
+                writable.add(fileno)
+
+        return readable, writable
+
+    def updatePoller(self, masks):
+        """Bring the poll object up to date with a dict of file number -> events, only changing what's different."""
+        for fileno in list(self.pollMasks):
+            if fileno not in masks:
+                self.poller.unregister(fileno)
+                del self.pollMasks[fileno]
+
+        for fileno, mask in masks.items():
+            if self.pollMasks.get(fileno) != mask:
+                # Registering a file number again changes its events
+                self.poller.register(fileno, mask)
+                self.pollMasks[fileno] = mask
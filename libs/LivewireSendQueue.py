@@ -0,0 +1,72 @@
+"""Livewire Send Queue. A bounded, prioritised queue of commands waiting to be sent to a Livewire device."""
+
+import time
+import threading
+import collections
+import Queue
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+# Priority classes - lower numbers are sent first
+PRIORITY_CONTROL = 0
+PRIORITY_POLL = 1
+
+
+class LivewireSendQueue():
+    """Commands waiting to be sent. Control & routing commands go ahead of polling queries, and each class is sent in order.
+
+    Any thread can add to the queue. When it's full, put() waits for space, then raises Queue.Full."""
+
+    def __init__(self, maxSize=10000):
+        """Setup an empty queue, holding up to maxSize commands."""
+        self.maxSize = maxSize
+
+        # One FIFO for each priority class
+        self.queues = [collections.deque(), collections.deque()]
+
+        self.lock = threading.Lock()
+        self.notFull = threading.Condition(self.lock)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def put(self, item, priority=PRIORITY_CONTROL, timeout=None):
+        """Add an item to the queue. Waits up to timeout seconds (forever if None) for space, then raises Queue.Full."""
+        with self.lock:
+            if timeout is not None:
+                deadline = time.time() + timeout
+
+            while len(self) >= self.maxSize:
+                if timeout is None:
+                    self.notFull.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Queue.Full()
+
+                self.notFull.wait(remaining)
+
+            self.queues[priority].append(item)
+
+    def putFront(self, items):
+        """Put items at the very front of the queue, in order. These don't count against maxSize (e.g. replaying the login)."""
+        with self.lock:
+            self.queues[PRIORITY_CONTROL].extendleft(reversed(items))
+
+    def getBatch(self, maxItems=None):
+        """Take up to maxItems (or all) items out of the queue, highest priority first."""
+        batch = []
+
+        with self.lock:
+            for queue in self.queues:
+                while len(queue) > 0 and (maxItems is None or len(batch) < maxItems):
+                    batch.append(queue.popleft())
+
+            self.notFull.notify_all()
+
+        return batch
@@ -0,0 +1,64 @@
+"""Benchmark for LWRP segment splitting. Checks splitSegments against the original per-character loop on recorded LWRP
+traffic, and times both.
+
+Run: python tests/benchmark_lwrp_parsing.py [passes]"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libs"))
+
+from LWRPClientComms import LWRPClientComms
+from test_lwrp_split_segments import splitSegmentsReference, loadBodies
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+def trafficBodies():
+    """The recorded lines, plus the source list and meter poll of a 64 channel device, which make up most LWRP traffic."""
+    bodies = loadBodies()
+
+    for i in range(1, 65):
+        bodies.append('%d PSNM:"Studio %d Mic" FASM:1 RTPE:1 RTPA:239.192.0.%d INGN:0 SHAB:0 NCHN:2 LWSE:0 LWSA:239.192.128.%d' % (i, i, i, i))
+
+    for io in ("ICH", "OCH"):
+        for i in range(1, 65):
+            bodies.append('%s %d PEEK:-%d:-%d RMS:-%d:-%d' % (io, i, 100 + i, 110 + i, 200 + i, 210 + i))
+
+    return bodies
+
+
+def main(passes=200):
+    comms = LWRPClientComms.__new__(LWRPClientComms)
+    bodies = trafficBodies()
+
+    for body in bodies:
+        if comms.splitSegments(body) != splitSegmentsReference(body):
+            print "Different segments for: " + repr(body)
+            return 1
+
+    print "Same segments as the original for all " + str(len(bodies)) + " lines"
+
+    def runOriginal():
+        for body in bodies:
+            splitSegmentsReference(body)
+
+    def runCurrent():
+        for body in bodies:
+            comms.splitSegments(body)
+
+    original = min(timeit.repeat(runOriginal, number=passes, repeat=3))
+    current = min(timeit.repeat(runCurrent, number=passes, repeat=3))
+
+    print "Original: %.3fs  Current: %.3fs  (%d passes)  Speedup: %.1fx" % (original, current, passes, original / current)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
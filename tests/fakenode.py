@@ -0,0 +1,222 @@
+"""Fake Livewire node. A small LWRP server on localhost for the tests to connect real clients to."""
+
+import os
+import re
+import sys
+import time
+import socket
+import threading
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libs"))
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+# The clients log failures the tests cause on purpose - keep them out of the test output
+logging.getLogger().addHandler(logging.NullHandler())
+
+
+def waitUntil(condition, timeout=5):
+    """Wait for condition() to be true. Returns its final value."""
+    deadline = time.time() + timeout
+
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+    return condition()
+
+
+class FakeNode():
+    """Answers LWRP commands like a small xNode: VER, SRC, DST, ADD GPI/GPO, MTR, channel changes and pin changes.
+
+    Every command received is recorded in self.received. Anything it doesn't understand gets an ERROR, as a real
+    device does. Replies can be split into pieces (splitReplies), so they arrive across several reads."""
+
+    def __init__(self, sources=8, destinations=8, gpio=2):
+        """Start listening on a free localhost port (self.port)."""
+        self.sources = dict((i, "239.192.0.%d" % (100 + i)) for i in range(1, sources + 1))
+        self.destinations = dict((i, "239.192.0.%d" % i) for i in range(1, destinations + 1))
+        self.gpi = dict((i, "hhhhh") for i in range(1, gpio + 1))
+        self.gpo = dict((i, "hhhhh") for i in range(1, gpio + 1))
+
+        # Commands received, in order
+        self.received = []
+        self.lock = threading.Lock()
+
+        # Split each reply into this many pieces, sent splitDelay seconds apart
+        self.splitReplies = 1
+        self.splitDelay = 0.05
+
+        # While True, commands are recorded but not answered
+        self.silent = False
+
+        self.connections = []
+        self.port = None
+        self.listen()
+
+    def listen(self, port=0):
+        """Start accepting connections (again, on the same port after stopListening())."""
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", port or self.port or 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+
+        thread = threading.Thread(target=self.accept, args=(self.listener,))
+        thread.daemon = True
+        thread.start()
+
+    def stopListening(self):
+        """Stop accepting connections, so clients can't reconnect."""
+        try:
+            # Wakes up the accept() thread, which otherwise keeps the port in use
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        self.listener.close()
+
+    def dropConnections(self):
+        """Close every client connection, as a device rebooting would."""
+        with self.lock:
+            connections, self.connections = self.connections, []
+
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+            conn.close()
+
+    def close(self):
+        """Stop the node."""
+        self.stopListening()
+        self.dropConnections()
+
+    def commands(self, prefix=""):
+        """The commands received so far which start with prefix."""
+        with self.lock:
+            return [command for command in self.received if command.startswith(prefix)]
+
+    def accept(self, listener):
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except socket.error:
+                return
+
+            with self.lock:
+                self.connections.append(conn)
+
+            thread = threading.Thread(target=self.serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve(self, conn):
+        buf = b""
+
+        while True:
+            try:
+                data = conn.recv(4096)
+            except socket.error:
+                return
+
+            if data == b"":
+                return
+
+            buf += data
+
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+
+                with self.lock:
+                    self.received.append(line)
+
+                if self.silent:
+                    continue
+
+                reply = self.respond(line)
+
+                if reply:
+                    self.send(conn, reply)
+
+    def push(self, data):
+        """Send data to every connected client, as the device does when something changes."""
+        with self.lock:
+            connections = list(self.connections)
+
+        for conn in connections:
+            self.send(conn, data)
+
+    def send(self, conn, data):
+        """Send a reply, in splitReplies pieces."""
+        pieceSize = max(1, -(-len(data) // self.splitReplies))
+
+        try:
+            for i in range(0, len(data), pieceSize):
+                if i > 0:
+                    time.sleep(self.splitDelay)
+
+                conn.sendall(data[i:i + pieceSize])
+        except socket.error:
+            pass
+
+    def sourceLine(self, i):
+        return 'SRC %d PSNM:"Source %d" RTPE:1 RTPA:%s\n' % (i, i, self.sources[i])
+
+    def destinationLine(self, i):
+        return 'DST %d NAME:"Destination %d" ADDR:"%s"\n' % (i, i, self.destinations[i])
+
+    def meterLines(self):
+        lines = ["MTR ICH %d PEEK:-%d:-%d RMS:-%d:-%d\n" % (i, 100 + i, 110 + i, 200 + i, 210 + i) for i in sorted(self.sources)]
+        lines += ["MTR OCH %d PEEK:-%d:-%d RMS:-%d:-%d\n" % (i, 300 + i, 310 + i, 400 + i, 410 + i) for i in sorted(self.destinations)]
+        return "".join(lines)
+
+    def respond(self, line):
+        """The device's reply to one command, or None."""
+        if line == "VER":
+            return 'VER LWRP:1.4.3 DEVN:"Fake Node" SYSV:1.0 NSRC:%d/2 NDST:%d NGPI:%d NGPO:%d\n' % (
+                len(self.sources), len(self.destinations), len(self.gpi), len(self.gpo))
+
+        if line == "SRC":
+            return "".join(self.sourceLine(i) for i in sorted(self.sources))
+
+        if line == "DST":
+            return "".join(self.destinationLine(i) for i in sorted(self.destinations))
+
+        if line == "MTR":
+            return self.meterLines()
+
+        if line in ("ADD GPI", "ADD GPO"):
+            pins = self.gpi if line == "ADD GPI" else self.gpo
+            return "".join("%s %d %s\n" % (line[4:], i, pins[i]) for i in sorted(pins))
+
+        if line == "LOGIN" or line.startswith("LOGIN "):
+            return None
+
+        match = re.match(r"SRC (\d+) RTPA:(\S+)$", line)
+        if match and int(match.group(1)) in self.sources:
+            self.sources[int(match.group(1))] = match.group(2)
+            return self.sourceLine(int(match.group(1)))
+
+        match = re.match(r"DST (\d+) ADDR:(\S+)$", line)
+        if match and int(match.group(1)) in self.destinations:
+            self.destinations[int(match.group(1))] = match.group(2)
+            return self.destinationLine(int(match.group(1)))
+
+        match = re.match(r"(GPI|GPO) (\d+) ([hlx]{5})$", line)
+        if match:
+            pins = self.gpi if match.group(1) == "GPI" else self.gpo
+            num = int(match.group(2))
+
+            if num in pins:
+                # Pin changes aren't answered (unless something has subscribed to them)
+                pins[num] = "".join(old if new == "x" else new for old, new in zip(pins[num], match.group(3)))
+                return None
+
+        return "ERROR 1000 bad command\n"
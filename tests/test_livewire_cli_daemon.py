@@ -0,0 +1,136 @@
+"""Tests for the CLI daemon: only the user running it can send it commands, and commands can't nest."""
+
+import os
+import stat
+import json
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import unittest
+
+from fakenode import waitUntil
+import LivewireCLIDaemon
+from LivewireCLIDaemon import LivewireCLIDaemon as Daemon, forwardCommand
+from LivewireBatch import BatchArgumentParser, parseBatch
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+def executeCommand(args, output, getDevice):
+    """Stands in for the CLI's executeCommand(), echoing the channel it was given."""
+    output.append("channel " + str(args.sourcenum))
+    return 0
+
+
+class DaemonTest(unittest.TestCase):
+    """Run a daemon (with a stand-in CLI) in a temporary home directory."""
+
+    useUnixSocket = LivewireCLIDaemon.useUnixSocket
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.oldHome = os.environ.get("HOME")
+        os.environ["HOME"] = self.home
+
+        self.oldUseUnixSocket = LivewireCLIDaemon.useUnixSocket
+        LivewireCLIDaemon.useUnixSocket = self.useUnixSocket
+
+        self.daemon = Daemon(19393, lambda args: None, executeCommand, ["lwrp_ip"])
+        self.thread = threading.Thread(target=self.daemon.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        self.assertTrue(waitUntil(lambda: self.daemon.server is not None))
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join(5)
+
+        LivewireCLIDaemon.useUnixSocket = self.oldUseUnixSocket
+
+        if self.oldHome is None:
+            del os.environ["HOME"]
+        else:
+            os.environ["HOME"] = self.oldHome
+
+        shutil.rmtree(self.home)
+
+    def command(self, **kwargs):
+        args = {"lwrp_ip": "127.0.0.1", "sourcenum": 3, "daemon": False}
+        args.update(kwargs)
+        return argparse.Namespace(**args)
+
+    def testForward(self):
+        """A forwarded command is run, and its output sent back."""
+        self.assertEqual(forwardCommand(19393, self.command()), (["channel 3"], 0))
+
+    def testNoNestedDaemon(self):
+        """A forwarded command can't start another daemon."""
+        self.assertEqual(forwardCommand(19393, self.command(daemon=True)), ([], 1))
+
+
+class UnixSocketTest(DaemonTest):
+
+    useUnixSocket = True
+
+    def testSocketPermissions(self):
+        """Only the current user can open the socket."""
+        path = LivewireCLIDaemon.socketPath(19393)
+
+        self.assertTrue(stat.S_ISSOCK(os.stat(path).st_mode))
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+
+
+class TokenTest(DaemonTest):
+    """Localhost TCP with a token, as used on Windows."""
+
+    useUnixSocket = False
+
+    def send(self, request):
+        sock = socket.create_connection(("127.0.0.1", 19393), 5)
+        sock.sendall(json.dumps(request) + "\n")
+        reply = sock.makefile().readline()
+        sock.close()
+        return json.loads(reply)
+
+    def testTokenFile(self):
+        """The token is in a file only the current user can read."""
+        path = LivewireCLIDaemon.tokenPath(19393)
+
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        self.assertEqual(open(path).read(), self.daemon.token)
+
+    def testWrongToken(self):
+        """Commands without the right token aren't run."""
+        for token in (None, "", "0" * 64):
+            reply = self.send({"token": token, "args": vars(self.command())})
+            self.assertEqual((reply['output'], reply['exitCode']), ([], 1))
+
+        reply = self.send({"token": self.daemon.token, "args": vars(self.command())})
+        self.assertEqual((reply['output'], reply['exitCode']), (["channel 3"], 0))
+
+
+class BatchNestingTest(unittest.TestCase):
+
+    def testNestedOptions(self):
+        """A batch line can't start a daemon, send to one, or run another batch."""
+        parser = BatchArgumentParser()
+        parser.add_argument("--sourcenum", type=int)
+        parser.add_argument("--batch", type=str)
+        parser.add_argument("--daemon", default=False, action="store_true")
+        parser.add_argument("--via_daemon", default=False, action="store_true")
+
+        commands, errors = parseBatch(parser, ["--sourcenum 1", "--batch other.txt", "--daemon", "--sourcenum 2 --via_daemon"])
+
+        self.assertEqual([args.sourcenum for args in commands], [1])
+        self.assertEqual(len(errors), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Tests for framing received data: partial lines and BEGIN/END blocks are held back until they're complete."""
+
+import time
+import unittest
+
+from fakenode import FakeNode, waitUntil
+from LWRPClient import LWRPClient
+from LWRPClientComms import LWRPClientComms
+from LWCPClientComms import LWCPClientComms
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class ExtractFramesTest(unittest.TestCase):
+    """Feed the receive buffer a piece at a time, as separate recv() calls would, without running the connection."""
+
+    def setUp(self):
+        self.node = FakeNode()
+        self.comms = []
+
+    def tearDown(self):
+        for comms in self.comms:
+            comms.close()
+
+        self.node.close()
+
+    def connect(self, commsClass):
+        comms = commsClass("127.0.0.1", self.node.port)
+        self.comms.append(comms)
+        return comms
+
+    def feed(self, comms, data):
+        comms.recvBuffer += data
+        return comms.extractFrames()
+
+    def testPartialLine(self):
+        """A line split across reads is only returned once its newline arrives."""
+        comms = self.connect(LWRPClientComms)
+
+        self.assertEqual(self.feed(comms, b'SRC 1 PSNM:"Mic'), None)
+        self.assertEqual(self.feed(comms, b' 1" RTPA:239.192.0.1\nSRC 2'), b'SRC 1 PSNM:"Mic 1" RTPA:239.192.0.1\n')
+        self.assertEqual(self.feed(comms, b' PSNM:"Mic 2"\n'), b'SRC 2 PSNM:"Mic 2"\n')
+        self.assertEqual(len(comms.recvBuffer), 0)
+
+    def testBlockAcrossReads(self):
+        """A BEGIN/END block is held back until END arrives, then returned whole with the lines after it."""
+        comms = self.connect(LWRPClientComms)
+
+        self.assertEqual(self.feed(comms, b"BEGIN\nSRC 1\n"), None)
+        self.assertEqual(self.feed(comms, b"SRC 2\nEN"), None)
+        self.assertEqual(self.feed(comms, b"D\nVER LWRP:1.0\nDST"), b"BEGIN\nSRC 1\nSRC 2\nEND\nVER LWRP:1.0\n")
+        self.assertEqual(comms.inBlock, False)
+        self.assertEqual(bytes(comms.recvBuffer), b"DST")
+
+    def testLinesBeforeBlock(self):
+        """Complete lines before an unfinished block are returned straight away."""
+        comms = self.connect(LWRPClientComms)
+
+        self.assertEqual(self.feed(comms, b"VER LWRP:1.0\nBEGIN\nSRC 1\n"), b"VER LWRP:1.0\n")
+        self.assertEqual(self.feed(comms, b"END\n"), b"BEGIN\nSRC 1\nEND\n")
+
+    def testEncapsulatedBlock(self):
+        """LWCP's %BeginEncap% blocks can contain newlines, and are held back the same way."""
+        comms = self.connect(LWCPClientComms)
+
+        self.assertEqual(self.feed(comms, b"indi Studio value=%BeginEncap%<a>\n"), None)
+        self.assertEqual(self.feed(comms, b"</a>%EndEncap%\nevent x\n"), b"indi Studio value=%BeginEncap%<a>\n</a>%EndEncap%\nevent x\n")
+
+
+class ReceiveTest(unittest.TestCase):
+    """Replies from a fake node which arrive in several pieces."""
+
+    def setUp(self):
+        self.node = FakeNode(sources=32)
+        self.client = LWRPClient("127.0.0.1", self.node.port)
+
+    def tearDown(self):
+        self.client.stop()
+        self.node.close()
+
+    def testFragmentedLines(self):
+        """Messages pushed a few bytes at a time reach subscribers whole."""
+        received = []
+        self.client.LWRP.addSubscription("GPO", received.extend)
+
+        # The node has accepted the connection once the client's first command arrives
+        self.assertTrue(waitUntil(lambda: len(self.node.commands("VER")) > 0))
+
+        self.node.splitReplies = 20
+        self.node.splitDelay = 0.005
+        self.node.push(b"GPO 1 hlhlh\nGPO 2 lllll\n")
+
+        self.assertTrue(waitUntil(lambda: len(received) == 2))
+        self.assertEqual([message['num'] for message in received], ["1", "2"])
+        self.assertEqual(received[1]['pin_states'][0]['state'], "low")
+
+    def testTableSplitAcrossReads(self):
+        """A table reply split across several reads is still one reply, with every channel."""
+        self.assertNotEqual(self.client.deviceData(), None)
+
+        self.node.splitReplies = 4
+        sources = self.client.sourceData()
+
+        self.assertEqual([message['num'] for message in sources], [str(i) for i in range(1, 33)])
+
+    def testMeterReadingSplitAcrossReads(self):
+        """A meter reply split across two reads is one reading, with the inputs and outputs."""
+        self.assertNotEqual(self.client.deviceData(), None)
+
+        readings = []
+        self.client.meterFrameSub(lambda frame: readings.append(frame.copy()))
+
+        self.node.splitReplies = 2
+        self.client.pollMeters()
+
+        self.assertTrue(waitUntil(lambda: len(readings) > 0))
+        time.sleep(self.node.splitDelay * 2)
+
+        self.assertEqual(len(readings), 1)
+        self.assertEqual(readings[0].level("in", 32), (-13.2, -14.2))
+        self.assertEqual(readings[0].level("out", 8, "rms"), (-40.8, -41.8))
+
+
+if __name__ == "__main__":
+    unittest.main()
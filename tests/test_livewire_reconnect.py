@@ -0,0 +1,117 @@
+"""Tests for losing the connection: pending requests fail, nothing stale is sent on reconnecting, and the login and
+subscriptions are replayed."""
+
+import time
+import unittest
+
+from fakenode import FakeNode, waitUntil
+from LWRPClient import LWRPClient
+from LWRPClientComms import LWRPClientComms
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class ReconnectTest(unittest.TestCase):
+    """A real client whose fake node drops the connection."""
+
+    def setUp(self):
+        self.node = FakeNode()
+        self.client = LWRPClient("127.0.0.1", self.node.port)
+        self.client.LWRP.reconnectDelay = 0.05
+        self.client.login("secret")
+        self.assertNotEqual(self.client.deviceData(), None)
+
+    def tearDown(self):
+        self.client.stop()
+        self.node.close()
+
+    def disconnect(self):
+        """Drop the connection, and don't let the client reconnect until reconnect() is called."""
+        self.node.stopListening()
+        self.node.dropConnections()
+        self.assertTrue(waitUntil(lambda: not self.client.LWRP.connected()))
+
+    def reconnect(self):
+        self.node.listen()
+        self.assertTrue(waitUntil(lambda: self.client.LWRP.connected()))
+
+    def testPendingRequestFails(self):
+        """A request waiting for its reply fails as soon as the connection drops."""
+        self.node.silent = True
+        future = self.client.sourceData(wait=False)
+        self.assertTrue(waitUntil(lambda: "SRC" in self.node.commands()))
+
+        self.disconnect()
+
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(0), None)
+        self.assertEqual(future.error, "Connection lost")
+
+    def testReplayAfterReconnect(self):
+        """The login and subscriptions are sent again once reconnected, and requests work again."""
+        received = []
+        self.client.sourceDataSub(received.extend)
+        self.assertTrue(waitUntil(lambda: len(received) == 8))
+
+        self.disconnect()
+        self.reconnect()
+
+        self.assertTrue(waitUntil(lambda: len(received) == 16))
+        self.assertEqual(self.node.commands("LOGIN"), ["LOGIN secret"] * 2)
+        self.assertEqual(len(self.client.destinationData()), 8)
+
+    def testNothingQueuedWhileDisconnected(self):
+        """Changes made while disconnected fail straight away, and neither they nor polls are sent after reconnecting."""
+        self.disconnect()
+
+        echo = self.client.setDestination(3, "239.192.1.1")
+        self.assertTrue(echo.done())
+        self.assertEqual(echo.error, "Not connected")
+
+        meters = self.client.meterData(wait=False)
+        self.assertEqual(meters.error, "Not connected")
+
+        self.client.pollMeters()
+        self.client.setGPO(1, 1, "low")
+        self.assertEqual(len(self.client.LWRP.sendQueue), 0)
+
+        self.reconnect()
+        self.assertEqual(len(self.client.sourceData()), 8)
+
+        self.assertEqual(self.node.commands("DST 3"), [])
+        self.assertEqual(self.node.commands("GPO 1"), [])
+        self.assertEqual(self.node.commands("MTR"), [])
+        self.assertEqual(self.node.destinations[3], "239.192.0.3")
+
+
+class SendTest(unittest.TestCase):
+    """Send queue handling, driven directly rather than on the connection's thread."""
+
+    def setUp(self):
+        self.node = FakeNode()
+        self.comms = LWRPClientComms("127.0.0.1", self.node.port)
+
+    def tearDown(self):
+        self.comms.close()
+        self.node.close()
+
+    def testCancelledRequestNotSent(self):
+        """A request cancelled (or timed out) while it was queued is skipped when the queue is sent."""
+        cancelled = self.comms.request("SOURCE", "SRC 1 RTPA:239.192.5.5", "1", replySize=1)
+        kept = self.comms.request("SOURCE", "SRC 2 RTPA:239.192.6.6", "2", replySize=1)
+        cancelled.cancel()
+
+        self.comms.handleWrite()
+
+        self.assertTrue(waitUntil(lambda: len(self.node.commands()) == 1))
+        time.sleep(0.05)
+        self.assertEqual(self.node.commands(), ["SRC 2 RTPA:239.192.6.6"])
+        self.assertFalse(kept.done())
+
+
+if __name__ == "__main__":
+    unittest.main()
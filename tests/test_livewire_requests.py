@@ -0,0 +1,148 @@
+"""Tests for matching replies to requests: table queries, change echoes and messages nobody asked for."""
+
+import time
+import unittest
+
+from fakenode import FakeNode, waitUntil
+from LWRPClient import LWRPClient
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class RequestTest(unittest.TestCase):
+    """Requests made with a real client against a fake node."""
+
+    def setUp(self):
+        self.node = FakeNode()
+        self.client = LWRPClient("127.0.0.1", self.node.port)
+
+        # Table replies are sized from the VER reply
+        self.assertNotEqual(self.client.deviceData(), None)
+
+    def tearDown(self):
+        self.client.stop()
+        self.node.close()
+
+    def timed(self, function):
+        """Call a function, returning (its result, how long it took)."""
+        startTime = time.time()
+        result = function()
+        return result, time.time() - startTime
+
+    def testTableReply(self):
+        """A table query returns every channel once the last one arrives, without waiting for the device to go quiet."""
+        sources, elapsed = self.timed(self.client.sourceData)
+
+        self.assertEqual([message['num'] for message in sources], [str(i) for i in range(1, 9)])
+        self.assertLess(elapsed, self.client.LWRP.replyIdleTime)
+
+    def testMeterReply(self):
+        """A meter query returns a meter for each source and destination, without waiting for the device to go quiet."""
+        meters, elapsed = self.timed(self.client.meterData)
+
+        self.assertEqual(len(meters), 16)
+        self.assertEqual([message['io'] for message in meters], ["in"] * 8 + ["out"] * 8)
+        self.assertLess(elapsed, self.client.LWRP.replyIdleTime)
+
+    def testUnknownSizeReply(self):
+        """Without a channel count, a reply is finished by the device going quiet."""
+        gpo = self.client.LWRP.request("GPO", "ADD GPO").result(2)
+
+        self.assertEqual([message['num'] for message in gpo], ["1", "2"])
+
+    def testEchoBeforeTable(self):
+        """A change's echo goes to the change, not to a table query sent after it."""
+        echo = self.client.setDestination(3, "239.192.1.1")
+        table = self.client.destinationData(wait=False)
+
+        self.assertEqual([message['num'] for message in echo.result(2)], ["3"])
+        self.assertEqual(echo.result(0)[0]['attributes']['address'], "239.192.1.1")
+        self.assertEqual(len(table.result(2)), 8)
+        self.assertEqual(table.result(0)[2]['attributes']['address'], "239.192.1.1")
+
+    def testTableBeforeEcho(self):
+        """A table query sent before a change gets the whole table, and the change still gets its echo."""
+        table = self.client.destinationData(wait=False)
+        echo = self.client.setDestination(3, "239.192.1.1")
+
+        self.assertEqual(len(table.result(2)), 8)
+        self.assertEqual(table.result(0)[2]['attributes']['address'], "239.192.0.3")
+        self.assertEqual([message['num'] for message in echo.result(2)], ["3"])
+
+    def testUnsolicitedChange(self):
+        """A change pushed by the device just before a table reply isn't counted as an extra channel."""
+        self.node.silent = True
+        table = self.client.sourceData(wait=False)
+        self.assertTrue(waitUntil(lambda: "SRC" in self.node.commands()))
+
+        self.node.push(b'SRC 2 PSNM:"Changed" RTPE:1 RTPA:239.192.0.2\n')
+        time.sleep(0.05)
+        self.node.push(self.node.respond("SRC"))
+
+        sources = table.result(2)
+        self.assertEqual([message['num'] for message in sources], [str(i) for i in range(1, 9)])
+        self.assertEqual(sources[1]['attributes']['name'], "Source 2")
+
+    def testRepliesInOrder(self):
+        """Several queries of the same type each get their own reply."""
+        futures = [self.client.sourceData(wait=False) for _ in range(5)]
+
+        for future in futures:
+            self.assertEqual(len(future.result(2)), 8)
+
+    def testErrorForRequest(self):
+        """An error in reply to a request fails it, and the next request still gets its own reply."""
+        bad = self.client.LWRP.request("SOURCE", "SRC 99 RTPA:239.192.5.5", "99", replySize=1)
+        table = self.client.sourceData(wait=False)
+
+        self.assertEqual(bad.result(2), None)
+        self.assertEqual(bad.error, "1000 bad command")
+        self.assertEqual(len(table.result(2)), 8)
+
+    def testErrorAfterCommand(self):
+        """An error in reply to a command sent without a request doesn't fail the next request."""
+        errors = []
+        self.client.errorSub(errors.extend)
+
+        self.client.setGPO(99, 1, "high")
+        table = self.client.sourceData(wait=False)
+
+        self.assertEqual(len(table.result(2)), 8)
+        self.assertEqual(table.error, None)
+        self.assertTrue(waitUntil(lambda: len(errors) == 1))
+
+    def testErrorsInOrder(self):
+        """Errors for commands and requests sent together each go to the right one."""
+        self.client.setGPO(99, 1, "high")
+        first = self.client.LWRP.request("DESTINATION", "DST 99 ADDR:239.192.5.5", "99", replySize=1)
+        echo = self.client.setDestination(2, "239.192.1.2")
+        self.client.setGPI(99, 1, "low")
+        second = self.client.LWRP.request("SOURCE", "SRC 99 RTPA:239.192.5.5", "99", replySize=1)
+        table = self.client.sourceData(wait=False)
+
+        self.assertEqual(first.result(2), None)
+        self.assertEqual(first.error, "1000 bad command")
+        self.assertEqual(echo.result(2)[0]['attributes']['address'], "239.192.1.2")
+        self.assertEqual(second.result(2), None)
+        self.assertEqual(second.error, "1000 bad command")
+        self.assertEqual(len(table.result(2)), 8)
+
+    def testTimeout(self):
+        """A request with no reply is cancelled once its timeout is up, and a late reply doesn't go to the next one."""
+        self.node.silent = True
+        future = self.client.LWRP.request("SOURCE", "SRC 1 RTPA:239.192.5.5", "1", replySize=1, timeout=0.2)
+
+        self.assertEqual(future.result(1), None)
+        self.assertTrue(future.cancelled)
+
+        self.node.silent = False
+        self.node.push(self.node.sourceLine(1))
+        self.assertEqual(len(self.client.sourceData()), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests for the send queue: priority classes, ordering and bounds."""
+
+import os
+import sys
+import time
+import threading
+import unittest
+import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libs"))
+
+from LivewireSendQueue import LivewireSendQueue, PRIORITY_CONTROL, PRIORITY_POLL
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class SendQueueTest(unittest.TestCase):
+
+    def testPriority(self):
+        """Control commands go ahead of polls, and each class stays in the order it was added."""
+        queue = LivewireSendQueue()
+        queue.put("MTR 1", PRIORITY_POLL)
+        queue.put("DST 1", PRIORITY_CONTROL)
+        queue.put("MTR 2", PRIORITY_POLL)
+        queue.put("DST 2")
+
+        self.assertEqual(len(queue), 4)
+        self.assertEqual(queue.getBatch(), ["DST 1", "DST 2", "MTR 1", "MTR 2"])
+        self.assertEqual(len(queue), 0)
+
+    def testPutFront(self):
+        """Items put at the front go ahead of everything, in the order given, even when the queue is full."""
+        queue = LivewireSendQueue(2)
+        queue.put("DST 1")
+        queue.put("MTR", PRIORITY_POLL)
+        queue.putFront(["LOGIN", "SRC"])
+
+        self.assertEqual(queue.getBatch(), ["LOGIN", "SRC", "DST 1", "MTR"])
+
+    def testBatchSize(self):
+        """A batch holds at most maxItems, and the rest are left for the next one."""
+        queue = LivewireSendQueue()
+        for i in range(5):
+            queue.put("MTR %d" % i, PRIORITY_POLL)
+        queue.put("DST 1")
+
+        self.assertEqual(queue.getBatch(3), ["DST 1", "MTR 0", "MTR 1"])
+        self.assertEqual(queue.getBatch(3), ["MTR 2", "MTR 3", "MTR 4"])
+        self.assertEqual(queue.getBatch(3), [])
+
+    def testFull(self):
+        """Adding to a full queue gives up with Queue.Full once the timeout is up."""
+        queue = LivewireSendQueue(2)
+        queue.put("DST 1")
+        queue.put("DST 2")
+
+        startTime = time.time()
+        self.assertRaises(Queue.Full, queue.put, "DST 3", timeout=0.1)
+        self.assertGreaterEqual(time.time() - startTime, 0.1)
+        self.assertEqual(len(queue), 2)
+
+    def testWaitForSpace(self):
+        """Adding to a full queue waits until a batch is taken out."""
+        queue = LivewireSendQueue(1)
+        queue.put("DST 1")
+
+        timer = threading.Timer(0.05, queue.getBatch)
+        timer.start()
+        queue.put("DST 2", timeout=2)
+        timer.join()
+
+        self.assertEqual(queue.getBatch(), ["DST 2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
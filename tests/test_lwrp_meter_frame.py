@@ -0,0 +1,92 @@
+"""Tests for where meter readings start and end, when MTR replies are split or run together."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libs"))
+
+from LWRPMeterFrame import LWRPMeterFrame
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+def meterBodies(inputs, outputs, level=0):
+    """The bodies of the MTR messages in one reading, with every level offset by level."""
+    bodies = ["ICH %d PEEK:-%d:-%d RMS:-%d:-%d" % (i, 100 + level, 110 + level, 200 + level, 210 + level) for i in range(1, inputs + 1)]
+    bodies += ["OCH %d PEEK:-%d:-%d RMS:-%d:-%d" % (i, 300 + level, 310 + level, 400 + level, 410 + level) for i in range(1, outputs + 1)]
+    return bodies
+
+
+def irregular(bodies):
+    """The same meters, without the usual layout (RMS before PEEK)."""
+    return [body.replace("PEEK", "X").replace("RMS", "PEEK").replace("X", "RMS") for body in bodies]
+
+
+class ReadingSizeTest(unittest.TestCase):
+    """A reading ends once every meter has arrived, when we know how many there are."""
+
+    def setUp(self):
+        self.frame = LWRPMeterFrame(readingSize=lambda: 128)
+
+    def testSplitReading(self):
+        """A reading split in two is only complete after the second half, with the outputs."""
+        bodies = meterBodies(64, 64)
+
+        self.assertEqual(self.frame.parseLines(bodies[:100]), [])
+
+        frames = self.frame.parseLines(bodies[100:])
+        self.assertEqual(frames, [self.frame])
+        self.assertEqual(self.frame.sequence, 1)
+        self.assertEqual(self.frame.level("in", 1), (-10.0, -11.0))
+        self.assertEqual(self.frame.level("out", 64, "rms"), (-40.0, -41.0))
+
+    def testSplitIrregularReading(self):
+        """The same, for meters which have to be stored one at a time."""
+        bodies = irregular(meterBodies(64, 64))
+
+        self.assertEqual(self.frame.parseLines(bodies[:30]), [])
+        self.assertEqual(self.frame.parseLines(bodies[30:]), [self.frame])
+        self.assertEqual(self.frame.level("out", 64, "peak"), (-40.0, -41.0))
+
+    def testSeveralReadings(self):
+        """Readings received together are each returned, and the earlier ones are copies which don't change."""
+        bodies = meterBodies(64, 64) + meterBodies(64, 64, 1) + meterBodies(64, 64, 2)[:10]
+
+        frames = self.frame.parseLines(bodies)
+
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(frames[0].level("out", 1), (-30.0, -31.0))
+        self.assertEqual(frames[1].level("out", 1), (-30.1, -31.1))
+        self.assertEqual([frame.sequence for frame in frames], [1, 2])
+
+    def testCutShortReading(self):
+        """A reading that's cut short (another one starts before it's complete) is dropped."""
+        self.assertEqual(self.frame.parseLines(meterBodies(64, 64)[:50]), [])
+        self.assertEqual(len(self.frame.parseLines(meterBodies(64, 64, 1))), 1)
+        self.assertEqual(self.frame.sequence, 1)
+
+    def testJoinedPartWay(self):
+        """Receiving the end of a reply (as when meters are first subscribed to part way through one) isn't a reading, and
+        the next reply still is."""
+        self.assertEqual(self.frame.parseLines(meterBodies(64, 64)[100:]), [])
+        self.assertEqual(len(self.frame.parseLines(meterBodies(64, 64, 1))), 1)
+        self.assertEqual(len(self.frame.parseLines(meterBodies(64, 64, 2))), 1)
+        self.assertEqual(self.frame.level("in", 1), (-10.2, -11.2))
+
+    def testUnknownSize(self):
+        """Until the size is known, the meters received together are one reading."""
+        frame = LWRPMeterFrame(readingSize=lambda: None)
+        bodies = meterBodies(64, 64)
+
+        self.assertEqual(len(frame.parseLines(bodies[:100])), 1)
+        self.assertEqual(len(frame.parseLines(bodies[100:])), 1)
+        self.assertEqual(len(frame.parseLines(bodies + bodies)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
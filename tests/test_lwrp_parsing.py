@@ -0,0 +1,115 @@
+"""Golden tests for LWRP message parsing. Recorded LWRP lines are parsed and compared with the output of the original parser."""
+
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libs"))
+
+from LWRPClientComms import LWRPClientComms
+from LWRPMeterFrame import LWRPMeterFrame
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+dataDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def loadCapture():
+    """Get the recorded lines, and what the original parser returned for each one."""
+    with open(os.path.join(dataDir, "lwrp_capture_parsed.json")) as f:
+        golden = json.load(f)
+
+    # JSON gives unicode strings, but the parser is given (and returns) byte strings
+    return [(str(item["line"]), item["messages"]) for item in golden]
+
+
+def makeComms():
+    """Get an LWRPClientComms which can parse messages, without connecting to anything."""
+    comms = LWRPClientComms.__new__(LWRPClientComms)
+    comms.meterFrame = LWRPMeterFrame()
+    return comms
+
+
+def withoutFrames(messages):
+    """Remove the METER_FRAME messages, which the original parser didn't have."""
+    return [message for message in messages if message["type"] != "METER_FRAME"]
+
+
+class LWRPParsingTest(unittest.TestCase):
+    """Check the parser still gives the same messages and attributes as the original one."""
+
+    def setUp(self):
+        self.comms = makeComms()
+        self.capture = loadCapture()
+
+    def testCaptureFile(self):
+        """The golden output is for the lines in the capture file."""
+        with open(os.path.join(dataDir, "lwrp_capture.txt")) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines, [line for line, _ in self.capture])
+
+    def testEachLine(self):
+        """Every recorded line parses the same as it did with the original parser."""
+        for line, expected in self.capture:
+            self.assertEqual(withoutFrames(self.comms.parseMessage(line)), expected, line)
+
+    def testWholeCapture(self):
+        """All the recorded lines received together parse the same as one at a time."""
+        data = "\n".join([line for line, _ in self.capture])
+        expected = []
+
+        for _, messages in self.capture:
+            expected.extend(messages)
+
+        self.assertEqual(withoutFrames(self.comms.parseMessage(data)), expected)
+
+    def testWantedTypes(self):
+        """Only asking for some types of message gives the same messages of those types."""
+        data = "\n".join([line for line, _ in self.capture])
+
+        for wantedTypes in (["SOURCE"], ["DESTINATION", "METER"], ["LEVEL_ALERT", "GPI", "GPO"], ["ERROR", "MATRIX"]):
+            expected = []
+
+            for _, messages in self.capture:
+                expected.extend([message for message in messages if message["type"] in wantedTypes])
+
+            self.assertEqual(self.comms.parseMessage(data, wantedTypes), expected)
+
+    def testAttributesCovered(self):
+        """The capture includes every attribute the parser knows about, so none of them can be lost unnoticed."""
+        found = set()
+
+        for _, messages in self.capture:
+            for message in messages:
+                found.update(message.get("attributes", {}).keys())
+
+        for attribute in ("protocol_version", "device_name", "system_version", "source_count", "source_type",
+                          "destination_count", "GPI_count", "GPO_count", "matrix_enabled", "matrix_channels",
+                          "ip_address", "ip_netmask", "ip_gateway", "ip_hostname", "advertisment_ipaddress",
+                          "clock_ipaddress", "nic_ipaddress", "nic_name", "name", "livestream", "livestream_destination",
+                          "rtp", "rtp_destination", "_SHAB", "_FASM", "_BSID", "_LPID", "_INGN", "address",
+                          "PEAK_L", "PEAK_R", "RMS_L", "RMS_R", "clip", "silence", "command_text"):
+            self.assertIn(attribute, found)
+
+    def testMeterFrame(self):
+        """MTR lines are also stored in the meter frame."""
+        data = "\n".join([line for line, _ in self.capture if line[:3] == "MTR"])
+        frames = [message["frame"] for message in self.comms.parseMessage(data) if message["type"] == "METER_FRAME"]
+
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0].level("in", 1, "peak"), (-12.0, -13.5))
+        self.assertEqual(frames[0].level("in", 2, "rms"), (-96.0, -96.0))
+        self.assertEqual(frames[0].level("out", 1, "rms"), (-18.0, -17.7))
+        self.assertEqual(frames[0].level("out", 2, "peak"), (-4.5, -6.0))
+        self.assertEqual(frames[0].level("out", 3, "peak"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Tests for running salvos against a fake node."""
+
+import unittest
+
+from fakenode import FakeNode
+from LWRPClientPool import LWRPClientPool
+from LWRPSalvo import LWRPSalvo
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+class SalvoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.node = FakeNode()
+        self.pool = LWRPClientPool(["127.0.0.1"], self.node.port, timeout=1)
+
+    def tearDown(self):
+        self.pool.stop()
+        self.node.close()
+
+    def testConfirmed(self):
+        """Every change confirmed gives the latency, and no failures."""
+        salvo = LWRPSalvo("Studio A", {"127.0.0.1": [
+            {"type": "DST", "channel": 1, "stream": 101},
+            {"type": "SRC", "channel": 2, "address": "239.192.0.202"},
+        ]})
+
+        result = salvo.execute(self.pool, 1)["127.0.0.1"]
+
+        self.assertEqual(result['failed'], [])
+        self.assertEqual(result['error'], None)
+        self.assertTrue(0 <= result['latency'] < 1)
+        self.assertEqual(self.node.destinations[1], "239.192.0.101")
+        self.assertEqual(self.node.sources[2], "239.192.0.202")
+
+    def testNotConfirmed(self):
+        """A change the device rejects is listed as failed, and there's no latency."""
+        salvo = LWRPSalvo("Studio A", {"127.0.0.1": [
+            {"type": "DST", "channel": 1, "stream": 101},
+            {"type": "DST", "channel": 99, "stream": 102},
+        ]})
+
+        result = salvo.execute(self.pool, 1)["127.0.0.1"]
+
+        self.assertEqual(result['failed'], ["DST 99"])
+        self.assertEqual(result['latency'], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
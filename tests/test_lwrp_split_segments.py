@@ -0,0 +1,79 @@
+"""Tests for LWRP segment splitting. The str.split based splitSegments is compared with the original per-character loop."""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libs"))
+
+from LWRPClientComms import LWRPClientComms
+
+__author__ = "Anthony Eden"
+__copyright__ = "Copyright 2015-2018, Anthony Eden / Media Realm"
+__credits__ = ["Anthony Eden"]
+__license__ = "GPL"
+__version__ = "1.0"
+
+
+dataDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def splitSegmentsReference(string):
+    """The original splitSegments, which walked the string one character at a time."""
+    segments = []
+    currentText = ""
+    inSubStr = False
+    string += " "
+
+    for char in string:
+        if char == " " and inSubStr is False:
+            segments.append(currentText)
+            currentText = ""
+        else:
+            if char == '"' and inSubStr is False:
+                inSubStr = True
+            elif char == '"' and inSubStr is True:
+                inSubStr = False
+            else:
+                currentText += char
+
+    return segments
+
+
+def loadBodies():
+    """Get the bodies (everything after the command) of the recorded LWRP lines."""
+    with open(os.path.join(dataDir, "lwrp_capture.txt")) as f:
+        return [line.partition(" ")[2] for line in f.read().splitlines()]
+
+
+class LWRPSplitSegmentsTest(unittest.TestCase):
+    """Check splitSegments gives exactly the same segments as the original implementation."""
+
+    def setUp(self):
+        self.comms = LWRPClientComms.__new__(LWRPClientComms)
+
+    def assertSameSegments(self, string):
+        self.assertEqual(self.comms.splitSegments(string), splitSegmentsReference(string), repr(string))
+
+    def testRecordedLines(self):
+        """Every recorded line splits the same way."""
+        for body in loadBodies():
+            self.assertSameSegments(body)
+
+    def testEdgeCases(self):
+        """Empty strings, repeated spaces, empty quotes and unterminated quotes."""
+        for string in ('', ' ', '  ', '"', '""', '" "', 'a  b', ' a ', 'a"b c"d e', 'NAME:"" ADDR:""',
+                       'PSNM:"unterminated', 'a "b" "c d', 'x"y"z', '"a" "b"', 'CMD:"say ""hi"""'):
+            self.assertSameSegments(string)
+
+    def testRandomStrings(self):
+        """Random mixes of letters, spaces, quotes and colons."""
+        generator = random.Random(1)
+
+        for _ in range(20000):
+            self.assertSameSegments("".join(generator.choice('ab " :') for _ in range(generator.randint(0, 15))))
+
+
+if __name__ == "__main__":
+    unittest.main()